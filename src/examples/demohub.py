@@ -1,136 +1,129 @@
 import asyncio
 import os
-import uuid
+from pathlib import Path
 
 import cv2
-import numpy as np
-import pynng
 
-from wigglecam.dto import ImageMessage
+from wigglecam.dto import Codec, StreamLevel
+from wigglecam.hub.aggregator import JobResult, JobStatus
+from wigglecam.hub.client import HubClient
+from wigglecam.hub.compositor import GridCompositor
+from wigglecam.hub.decode import LoresDecoder
+from wigglecam.hub.raw import decode_bgr
+from wigglecam.hub.wigglegram import WigglegramPipeline
 
 DEVICES = [
     ("localhost", 5550),  # connect to, base-port
     ("localhost", 5560),
 ]
+BASE_DIR = "tmp/job_results"
+TIME_SERVER = "tcp://0.0.0.0:5549"  # nodes started with APP_TIME_SYNC_ADDRESS=tcp://<hub>:5549 sync their clock to the hub
+CAPTURE_DELAY_S = 0.1  # schedule captures this far ahead, so all nodes received the trigger in time
 
 
 async def main():
-    # host also subscribes to the hires replies
-    pub_trigger = pynng.Pub0()
-    sub_lo = pynng.Sub0()  # Pipeline pull for lores stream.
-    sub_lo.subscribe(b"")
-    sub_hi = pynng.Sub0()  # Pipeline pull for lores stream.
-    sub_hi.subscribe(b"")
-    sub_hi.recv_timeout = 1000
-
-    # def cb_connected(pipe: pynng.Pipe):
-    #     print("Verbunden:", len(pub_trigger.pipes))
-
-    # def cb_disconnected(pipe: pynng.Pipe):
-    #     active = [p for p in pub_trigger.pipes if not p.closed]
-    #     print("Noch verbunden:", len(active))
-    #     print("Noch verbunden:", len(pub_trigger.pipes))
-
-    # pub_trigger.add_post_pipe_connect_cb(cb_connected)
-    # pub_trigger.add_post_pipe_remove_cb(cb_disconnected)
-
-    # print(len(pub_trigger.dialers))
-
-    for host, base_port in DEVICES:
-        # block=False means continue program and try to connect in the background without any exception
-        print(f"tcp://{host}:{base_port + 0}")
-        pub_trigger.dial(f"tcp://{host}:{base_port + 0}", block=False)
-        sub_lo.dial(f"tcp://{host}:{base_port + 1}", block=False)
-        sub_hi.dial(f"tcp://{host}:{base_port + 2}", block=False)
-
+    lores_decoder = LoresDecoder()  # decodes off the event loop, frames never displayed are skipped
+    compositor = GridCompositor(tile_size=(320, 240))
+    wigglegram = WigglegramPipeline(Path(BASE_DIR) / "calibration.json")  # calibrates on the first job, press c to redo
+    jobs: set[asyncio.Task] = set()
+
+    async def assemble_wigglegram(job_folder: str, result: JobResult):
+        images = {device_id: msg for (device_id, _), msg in result.results.items()}
+        try:
+            await asyncio.to_thread(wigglegram.assemble, images, Path(job_folder) / "wigglegram.gif")
+            print(f"wigglegram saved to {job_folder}")
+        except ValueError as exc:
+            print(f"WARNING: wigglegram not assembled: {exc}")
+
+    def on_job_done(result: JobResult):
+        job_folder = os.path.join(BASE_DIR, f"job_{result.job_id}")
+        os.makedirs(job_folder, exist_ok=True)
+        for msg in result.results.values():
+            fname = f"cam{msg.device_id}" if msg.frame_count == 1 else f"cam{msg.device_id}_{msg.frame_index:03d}"
+            if msg.codec is Codec.JPEG:
+                with open(os.path.join(job_folder, f"{fname}.jpg"), "wb") as f:
+                    f.write(msg.payload)
+            else:
+                # raw results are kept lossless
+                cv2.imwrite(os.path.join(job_folder, f"{fname}.png"), decode_bgr(msg))
+
+        if result.status is JobStatus.COMPLETE:
+            print(f"job completed in {result.duration_s:.2f}s! capture skew {hub.skew_analyzer.job_skew_ms(result.job_id)} ms")
+            if len(result.results) > 1 and all(msg.frame_count == 1 for msg in result.results.values()):
+                task = asyncio.create_task(assemble_wigglegram(job_folder, result))
+                jobs.add(task)
+                task.add_done_callback(jobs.discard)
+        else:
+            print(f"job {result.status.value}, got {len(result.results)} results but {result.expected} expected, missing {result.missing}!")
+
+        lores_skew = hub.skew_analyzer.lores_skew()
+        print(f"lores skew p50={lores_skew.p50_ms:.2f}ms p99={lores_skew.p99_ms:.2f}ms over {lores_skew.samples} frames")
+        if hub.aggregator.slow_device_ids:
+            print(f"WARNING: slow devices: {hub.aggregator.slow_device_ids}")
+        if hub.skew_analyzer.unsynced_devices():
+            print(f"WARNING: devices not in sync: {hub.skew_analyzer.unsynced_devices()}")
+
+    hub = HubClient(DEVICES, on_lores=lores_decoder.submit, on_job_done=on_job_done, time_server_address=TIME_SERVER)
     print(f"listen on base ports {[port[1] for port in DEVICES]} for devices")
 
-    lores_frames = {}
-    trigger = asyncio.Event()
-
-    async def lores_task():
-        nonlocal lores_frames
-        while True:
-            data = await sub_lo.arecv()
-            msg = ImageMessage.from_bytes(data)
-
-            img = cv2.imdecode(np.frombuffer(msg.jpg_bytes, np.uint8), cv2.IMREAD_COLOR)
-            lores_frames[msg.device_id] = img
-
-    async def hires_task():
-        base_dir = "tmp/job_results"
-        os.makedirs(base_dir, exist_ok=True)
-
-        while True:
-            await trigger.wait()
-            trigger.clear()
-            print("Job start")
-
-            print("connected devices:", len(pub_trigger.pipes))
-            if len(DEVICES) > len(pub_trigger.pipes):
-                print("WARNING: not all devices are connected!")
-
-            # Eindeutige ID für diese Umfrage
-            job_uuid = uuid.uuid4()
-            await pub_trigger.asend(job_uuid.bytes)
-
-            job_folder = os.path.join(base_dir, f"job_{job_uuid}")
-            os.makedirs(job_folder, exist_ok=True)
-            results_no = 0
-
-            while True:
-                try:
-                    data = await sub_hi.arecv()
-                    msg = ImageMessage.from_bytes(data)
-                    results_no += 1
-
-                    if msg.job_id != job_uuid:
-                        # Antwort gehört zu alter Umfrage -> ignorieren
-                        print("warning, old job id result received, ignored!")
-                        continue
-
-                    fname = f"cam{msg.device_id}.jpg"
-                    with open(os.path.join(job_folder, fname), "wb") as f:
-                        f.write(msg.jpg_bytes)
-
-                    if results_no == len(DEVICES):
-                        print("got all results, job completed!")
-                        break
-
-                except pynng.exceptions.Timeout:
-                    # raise RuntimeError("tis bad, we got not all results!")
-                    print(f"job finished incomplete after 1s no more data, got {results_no} result but {len(DEVICES)} expected!")
-                    break
+    def trigger(frames: int):
+        # jobs run concurrently, triggering again does not wait for the previous job
+        task = asyncio.create_task(hub.trigger(frames=frames, interval_us=100_000, capture_delay_s=CAPTURE_DELAY_S))
+        jobs.add(task)
+        task.add_done_callback(jobs.discard)
+        print(f"Job start, {len(hub.aggregator.in_flight) + 1} in flight")
+
+    async def focus_next(focus: int | None) -> int | None:
+        # the focused device streams full lores, all others thumbnails for the wall
+        device_ids = sorted(lores_decoder.frames())
+        following = [device_id for device_id in device_ids if focus is None or device_id > focus]
+        if focus is not None:
+            await hub.select_lores_level(StreamLevel.THUMBNAIL, focus)
+            cv2.destroyWindow("Focus")
+        focus = following[0] if following else None
+        if focus is not None:
+            await hub.select_lores_level(StreamLevel.LORES, focus)
+        return focus
 
     async def ui_task():
-        nonlocal lores_frames
+        focus = None
+        await hub.select_lores_level(StreamLevel.THUMBNAIL)
+
         while True:
+            lores_frames = lores_decoder.frames()
             if lores_frames:
-                imgs = [lores_frames[cid] for cid in sorted(lores_frames.keys())]
-                h = 240
-                imgs_resized = [cv2.resize(img, (320, h)) for img in imgs]
-                rows = []
-                for i in range(0, len(imgs_resized), 2):
-                    row_imgs = imgs_resized[i : i + 2]
-                    if len(row_imgs) == 1:
-                        # pad with a black image of same size
-                        blank = np.zeros_like(row_imgs[0])
-                        row_imgs.append(blank)
-                    row = cv2.hconcat(row_imgs)
-                    rows.append(row)
-
-                wall = cv2.vconcat(rows)
+                wall = compositor.compose(lores_frames)
                 cv2.imshow("Live Wall", wall)
+            if focus is not None and (frame := lores_decoder.latest(focus)):
+                cv2.imshow("Focus", frame.image)
 
             key = cv2.waitKey(1)
             if key == 27:  # ESC
                 break
             elif key == ord("t"):
-                trigger.set()
+                trigger(frames=1)
+            elif key == ord("b"):
+                trigger(frames=10)
+            elif key == ord("f"):
+                focus = await focus_next(focus)
+                print(f"focus on device {focus}" if focus is not None else "focus view closed")
+            elif key == ord("c"):
+                wigglegram.invalidate_calibration()
+                print("calibration reset, next job recalibrates the rig")
 
             await asyncio.sleep(0.05)
 
-    await asyncio.gather(lores_task(), hires_task(), ui_task())
+    hub_task = asyncio.create_task(hub.run())
+    try:
+        await ui_task()
+    finally:
+        hub_task.cancel()
+        hub.close()
+        lores_decoder.close()
+        wigglegram.close()
+
+        stats = lores_decoder.stats
+        print(f"lores frames received {stats.received}, decoded {stats.decoded}, dropped {stats.dropped}")
 
 
 def run_async():
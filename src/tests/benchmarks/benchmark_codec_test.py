@@ -0,0 +1,71 @@
+import io
+
+import cv2
+import numpy
+import pytest
+from PIL import Image
+
+from wigglecam.backends.cameras.virtual import FrameRenderer
+from wigglecam.backends.encoders.base import ENCODER_CLASSES, encoder_factory
+
+RESOLUTIONS = {
+    "lores": (1152, 648),  # picamera2 default stream
+    "hires": (2304, 1296),  # imx708 hdr
+    "full": (4608, 2592),  # imx708 full sensor
+}
+
+
+@pytest.fixture(params=list(RESOLUTIONS), scope="module")
+def frame(request):
+    # a real photo compresses differently than the flat virtual frames, add noise to get realistic JPEG sizes
+    rng = numpy.random.default_rng(0)
+    image = FrameRenderer(*RESOLUTIONS[request.param]).render(17)
+    image = cv2.add(image, rng.integers(0, 24, image.shape, dtype=numpy.uint8))
+    yield image
+
+
+def pil_encode(frame: numpy.ndarray) -> bytes:
+    byte_io = io.BytesIO()
+    Image.fromarray(frame, "RGB").save(byte_io, format="JPEG", quality=85)
+    return byte_io.getvalue()
+
+
+def cv2_encode(frame: numpy.ndarray) -> bytes:
+    return cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes()
+
+
+def pil_decode(data: bytes) -> numpy.ndarray:
+    return numpy.asarray(Image.open(io.BytesIO(data)).convert("RGB"))
+
+
+def cv2_decode(data: bytes) -> numpy.ndarray:
+    return cv2.imdecode(numpy.frombuffer(data, numpy.uint8), cv2.IMREAD_COLOR)
+
+
+# needs pip install pytest-benchmark
+@pytest.mark.benchmark(group="jpeg-encode")
+@pytest.mark.parametrize("encode", [pil_encode, cv2_encode], ids=["pil", "cv2"])
+def test_jpeg_encode(frame, encode, benchmark):
+    jpeg = benchmark(encode, frame)
+    benchmark.extra_info["jpeg_bytes"] = len(jpeg)
+
+
+@pytest.mark.benchmark(group="jpeg-encoder")
+@pytest.mark.parametrize("subsampling", ["444", "420"])
+@pytest.mark.parametrize("name", list(ENCODER_CLASSES))
+def test_jpeg_encoder(frame, name, subsampling, benchmark):
+    try:
+        encoder = encoder_factory(name, 85, subsampling)
+    except (ImportError, OSError):
+        pytest.skip(f"{name} not installed")
+
+    jpeg = benchmark(encoder.encode, frame)
+    benchmark.extra_info["jpeg_bytes"] = len(jpeg)
+
+
+@pytest.mark.benchmark(group="jpeg-decode")
+@pytest.mark.parametrize("decode", [pil_decode, cv2_decode], ids=["pil", "cv2"])
+def test_jpeg_decode(frame, decode, benchmark):
+    jpeg = cv2_encode(frame)
+    decoded = benchmark(decode, jpeg)
+    assert decoded.shape == frame.shape
@@ -0,0 +1,56 @@
+import struct
+import uuid
+
+import pytest
+
+from wigglecam.dto import ImageMessage
+
+V0_HEADER_FMT = "iI16s"
+
+
+def v0_to_bytes(msg: ImageMessage) -> bytes:
+    # legacy implementation, kept to compare against
+    header = struct.pack(V0_HEADER_FMT, msg.device_id, len(msg.payload), msg.job_id.bytes if msg.job_id else b"\x00" * 16)
+    return header + msg.payload
+
+
+def v0_from_bytes(data: bytes) -> bytes:
+    header_size = struct.calcsize(V0_HEADER_FMT)
+    _, jpg_len, _ = struct.unpack(V0_HEADER_FMT, data[:header_size])
+    return data[header_size : header_size + jpg_len]
+
+
+@pytest.fixture(params=[200_000, 5_000_000], ids=["lores", "hires"])
+def message(request):
+    yield ImageMessage(1, payload=bytes(request.param), job_id=uuid.uuid4())
+
+
+# needs pip install pytest-benchmark
+@pytest.mark.benchmark(group="imagemessage-encode")
+def test_encode_v0_concat(message, benchmark):
+    benchmark(v0_to_bytes, message)
+
+
+@pytest.mark.benchmark(group="imagemessage-encode")
+def test_encode_segments(message, benchmark):
+    header, payload = benchmark(message.to_segments)
+    assert payload is message.payload
+
+
+@pytest.mark.benchmark(group="imagemessage-encode")
+def test_encode_pack_into_reused_buffer(message, benchmark):
+    buffer = bytearray()
+    benchmark(message.pack_into, buffer)
+
+
+@pytest.mark.benchmark(group="imagemessage-decode")
+def test_decode_v0_slice(message, benchmark):
+    data = v0_to_bytes(message)
+    benchmark(v0_from_bytes, data)
+
+
+@pytest.mark.benchmark(group="imagemessage-decode")
+def test_decode_memoryview(message, benchmark):
+    data = message.to_bytes()
+    decoded = benchmark(ImageMessage.from_bytes, data)
+    assert decoded.payload.obj is data
@@ -1,5 +1,6 @@
 import io
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from multiprocessing import Process
 from threading import Thread
 
@@ -7,6 +8,8 @@ import numpy
 import pytest
 from PIL import Image
 
+from wigglecam.backends.encoders.base import encoder_factory
+
 # from turbojpeg import TurboJPEG
 
 # turbojpeg = TurboJPEG()
@@ -68,3 +71,14 @@ def test_libraries_encode_parallelism_multiprocessing(image_hires, benchmark):
 def test_libraries_encode_parallelism_threading(image_hires, benchmark):
     benchmark(threading_encode, frame_from_camera=image_hires)
     assert True
+
+
+@pytest.mark.benchmark(group="encode-pool")
+@pytest.mark.parametrize("workers", [1, 2, 4])
+def test_encode_pool_burst(image_hires, workers, benchmark):
+    # a burst of 8 frames through the hires encode pool, the encoders release the GIL so threads scale
+    encoder = encoder_factory("auto")
+    frame = image_hires.astype("uint8")
+
+    with ThreadPoolExecutor(workers) as pool:
+        benchmark(lambda: list(pool.map(encoder.encode, [frame] * 8)))
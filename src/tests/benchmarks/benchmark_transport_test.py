@@ -0,0 +1,94 @@
+import threading
+import time
+import uuid
+
+import pynng
+import pytest
+
+from wigglecam.backends.cameras.output.pynng import PynngCameraOutput
+from wigglecam.backends.cameras.output.shm import ShmCameraOutput, ShmFrameReader
+from wigglecam.dto import ImageMessage
+
+
+@pytest.fixture(params=[200_000, 5_000_000], ids=["lores", "hires"])
+def message(request):
+    yield ImageMessage(1, payload=bytes(request.param), job_id=uuid.uuid4())
+
+
+@pytest.fixture(params=["tcp://127.0.0.1:5960", "ipc:///tmp/wigglecam-benchmark.sock"], ids=["tcp", "ipc"])
+def pynng_pair(request):
+    output = PynngCameraOutput(request.param)
+    with pynng.Sub0(dial=request.param, recv_timeout=5000) as sub:
+        sub.subscribe(b"")
+        while output.subscriber_count == 0:
+            time.sleep(0.01)
+        yield output, sub
+    output.close()
+
+
+def pynng_roundtrip(output: PynngCameraOutput, sub: pynng.Sub0, message: ImageMessage):
+    output.write_segments(*message.to_segments())
+    return ImageMessage.from_bytes(sub.recv())
+
+
+def shm_roundtrip(output: ShmCameraOutput, reader: ShmFrameReader, message: ImageMessage):
+    output.write_segments(*message.to_segments())
+    return ImageMessage.from_bytes(reader.read())  # type: ignore[arg-type]
+
+
+# needs pip install pytest-benchmark
+@pytest.mark.benchmark(group="transport")
+def test_transport_pynng(pynng_pair, message, benchmark):
+    output, sub = pynng_pair
+    received = benchmark(pynng_roundtrip, output, sub, message)
+    assert len(received.payload) == len(message.payload)
+
+
+@pytest.mark.benchmark(group="transport")
+def test_transport_shm(message, benchmark):
+    name = f"wigglecam-benchmark-{uuid.uuid4().hex[:8]}"
+    output = ShmCameraOutput(name, slot_count=4, slot_size=8 * 1024 * 1024)
+    reader = ShmFrameReader(name)
+
+    received = benchmark(shm_roundtrip, output, reader, message)
+    assert len(received.payload) == len(message.payload)
+
+    reader.close()
+    output.close()
+
+
+@pytest.mark.benchmark(group="transport-throughput")
+def test_transport_pynng_throughput(pynng_pair, message, benchmark):
+    """Messages per round sent as fast as a thread receives them, reports MB/s in extra_info.
+    Pub drops messages once its queue is full, so the sender stays a window of messages ahead of the receiver like
+    the chunked hires transfer, otherwise the round measures the receive timeout of dropped messages."""
+    output, sub = pynng_pair
+    count = 20
+    window = 8
+
+    def send_all():
+        credits = threading.Semaphore(window)
+        errors: list[Exception] = []
+
+        def receive():
+            try:
+                for _ in range(count):
+                    sub.recv()
+                    credits.release()
+            except Exception as exc:
+                errors.append(exc)
+                credits.release()  # wake the sender
+
+        receiver = threading.Thread(target=receive)
+        receiver.start()
+        for _ in range(count):
+            if not credits.acquire(timeout=10.0) or errors:
+                break
+            output.write_segments(*message.to_segments())
+        receiver.join()
+        if errors:
+            raise errors[0]
+
+    benchmark.pedantic(send_all, rounds=5, warmup_rounds=1)
+    if benchmark.stats:  # None with --benchmark-disable
+        benchmark.extra_info["megabytes_per_second"] = count * len(message.payload) / benchmark.stats.stats.mean / 1e6
@@ -0,0 +1,39 @@
+import pytest
+
+from wigglecam.backends.cameras.output.base import CameraOutput
+from wigglecam.backends.cameras.virtual import FrameRenderer, Virtual
+
+
+class NullOutput(CameraOutput):
+    def __init__(self):
+        pass
+
+    def write(self, buf: bytes) -> int:
+        return len(buf)
+
+    async def awrite(self, buf: bytes) -> int:
+        return len(buf)
+
+
+@pytest.fixture(params=[False, True], ids=["cached", "live_encode"])
+def virtual(request, monkeypatch):
+    monkeypatch.setenv("CAMERA_VIRTUAL_LIVE_ENCODE", str(request.param))
+    yield Virtual(1, NullOutput(), NullOutput())
+
+
+# needs pip install pytest-benchmark
+@pytest.mark.benchmark(group="virtual-render")
+@pytest.mark.parametrize("resolution", [(250, 250), (2304, 1296)], ids=["lores", "hires"])
+def test_frame_renderer(resolution, benchmark):
+    renderer = FrameRenderer(*resolution)
+    benchmark(renderer.render, 42)
+
+
+@pytest.mark.benchmark(group="virtual-lores")
+def test_produce_lores_frame(virtual, benchmark):
+    benchmark(virtual._produce_dummy_image)
+
+
+@pytest.mark.benchmark(group="virtual-hires")
+def test_capture_and_encode_hires_frame(virtual, benchmark):
+    benchmark(lambda: virtual._encode_hires_frame(virtual._capture_hires_frame()))
@@ -0,0 +1,38 @@
+import time
+
+import pynng
+
+from wigglecam.backends.cameras.output.pynng import PynngCameraOutput
+from wigglecam.dto import ImageMessage
+
+
+def wait_for(condition, timeout: float = 2.0):
+    start = time.monotonic()
+    while not condition() and time.monotonic() - start < timeout:
+        time.sleep(0.01)
+
+
+def test_subscriber_count():
+    output = PynngCameraOutput("tcp://127.0.0.1:5940")
+    assert output.subscriber_count == 0
+
+    with pynng.Sub0(dial="tcp://127.0.0.1:5940"):
+        wait_for(lambda: output.subscriber_count == 1)
+        assert output.subscriber_count == 1
+
+    wait_for(lambda: output.subscriber_count == 0)
+    assert output.subscriber_count == 0
+
+
+def test_write_segments():
+    output = PynngCameraOutput("tcp://127.0.0.1:5941")
+
+    with pynng.Sub0(dial="tcp://127.0.0.1:5941", recv_timeout=2000) as sub:
+        sub.subscribe(b"")
+        wait_for(lambda: output.subscriber_count == 1)
+
+        output.write_segments(*ImageMessage(5, payload=memoryview(b"xxpayload")[2:]).to_segments())
+
+        msg = ImageMessage.from_bytes(sub.recv())
+        assert msg.device_id == 5
+        assert bytes(msg.payload) == b"payload"
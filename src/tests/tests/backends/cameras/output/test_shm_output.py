@@ -0,0 +1,85 @@
+import asyncio
+import uuid
+
+import pytest
+
+from wigglecam.backends.cameras.output.shm import ShmCameraOutput, ShmFrameReader
+from wigglecam.dto import ImageMessage
+
+
+@pytest.fixture()
+def shm_name():
+    yield f"wigglecam-test-{uuid.uuid4().hex[:8]}"
+
+
+def test_roundtrip(shm_name):
+    output = ShmCameraOutput(shm_name, slot_count=4, slot_size=1024)
+    reader = ShmFrameReader(shm_name)
+
+    assert reader.read() is None
+    output.write_segments(*ImageMessage(3, payload=b"payload").to_segments())
+
+    msg = ImageMessage.from_bytes(reader.read())
+    assert msg.device_id == 3
+    assert bytes(msg.payload) == b"payload"
+    assert reader.read() is None
+
+    reader.close()
+    output.close()
+
+
+def test_slow_reader_skips_overwritten(shm_name):
+    output = ShmCameraOutput(shm_name, slot_count=2, slot_size=64)
+    reader = ShmFrameReader(shm_name)
+
+    for i in range(5):
+        output.write(bytes([i]))
+
+    assert reader.read() == b"\x03"
+    assert reader.read() == b"\x04"
+    assert reader.read() is None
+    assert reader.dropped == 3
+
+    reader.close()
+    output.close()
+
+
+def test_multiple_readers_and_latest(shm_name):
+    output = ShmCameraOutput(shm_name, slot_count=4, slot_size=64)
+    reader_all = ShmFrameReader(shm_name)
+    reader_latest = ShmFrameReader(shm_name)
+
+    for i in range(3):
+        output.write(bytes([i]))
+
+    assert [reader_all.read() for _ in range(3)] == [b"\x00", b"\x01", b"\x02"]
+    assert reader_latest.read_latest() == b"\x02"
+    assert reader_latest.read() is None
+
+    reader_all.close()
+    reader_latest.close()
+    output.close()
+
+
+def test_message_too_large(shm_name):
+    output = ShmCameraOutput(shm_name, slot_count=2, slot_size=8)
+
+    with pytest.raises(ValueError):
+        output.write(b"0123456789")
+
+    output.close()
+
+
+@pytest.mark.asyncio
+async def test_arecv(shm_name):
+    output = ShmCameraOutput(shm_name, slot_count=2, slot_size=64)
+    reader = ShmFrameReader(shm_name)
+
+    receive = asyncio.create_task(reader.arecv())
+    await asyncio.sleep(0.01)
+    await output.awrite(b"hello")
+
+    assert await asyncio.wait_for(receive, timeout=1) == b"hello"
+
+    reader.close()
+    output.close()
@@ -0,0 +1,63 @@
+from wigglecam.backends.cameras.frames import FrameRing, FrameSequencer, RawFrame
+
+
+def test_ring_is_bounded():
+    ring = FrameRing(3)
+
+    for i in range(5):
+        ring.append(RawFrame(array=None, timestamp_ns=i * 100, sequence=i))
+
+    assert len(ring) == 3
+    assert ring.latest().sequence == 4
+    assert ring.closest(0).sequence == 2
+
+
+def test_ring_closest():
+    ring = FrameRing(10)
+    for i in range(5):
+        ring.append(RawFrame(array=None, timestamp_ns=i * 100, sequence=i))
+
+    assert ring.closest(140).sequence == 1
+    assert ring.closest(160).sequence == 2
+    assert ring.closest(10_000).sequence == 4
+
+
+def test_ring_empty():
+    ring = FrameRing(2)
+
+    assert ring.closest(0) is None
+    assert ring.latest() is None
+
+
+def test_sequence_counts_dropped_frames():
+    sequencer = FrameSequencer()
+
+    for timestamp_ns in (1000, 1100, 1200, 1500):  # two frames dropped before 1500
+        sequencer.add(timestamp_ns, frame_duration_ns=100)
+
+    assert [sequencer.lookup(timestamp_ns) for timestamp_ns in (1000, 1100, 1200, 1500)] == [0, 1, 2, 5]
+
+
+def test_sequence_kept_when_frame_duration_changes():
+    sequencer = FrameSequencer()
+    for timestamp_ns in range(0, 1000, 100):
+        sequencer.add(timestamp_ns + 1, frame_duration_ns=100)
+
+    # auto exposure doubles the frame duration, earlier frames keep their sequence and the count goes on by one
+    sequencer.add(1101, frame_duration_ns=200)
+    sequencer.add(1301, frame_duration_ns=200)
+
+    assert sequencer.lookup(901) == 9
+    assert sequencer.lookup(1101) == 10
+    assert sequencer.lookup(1301) == 11
+    sequencer.add(1101)  # the same frame seen again by another capture
+    assert sequencer.sequence == 11
+
+
+def test_sequence_of_unknown_timestamp_is_placed_relative_to_last_frame():
+    sequencer = FrameSequencer(recent=2)
+    for timestamp_ns in range(1, 1001, 100):
+        sequencer.add(timestamp_ns, frame_duration_ns=100)
+
+    assert sequencer.lookup(905) == 9  # encoder timestamps are rounded to microseconds
+    assert sequencer.lookup(101) == 1  # no longer among the recent frames
@@ -0,0 +1,63 @@
+import io
+
+import numpy
+import pytest
+from PIL import Image
+
+from wigglecam.backends.cameras.gate import LoresGate, jpeg_signature
+
+
+def jpeg(gray: int, size: tuple[int, int] = (320, 240)) -> bytes:
+    byte_io = io.BytesIO()
+    Image.new("RGB", size, (gray, gray, gray)).save(byte_io, format="JPEG")
+    return byte_io.getvalue()
+
+
+def test_signature_is_downscaled():
+    signature = jpeg_signature(jpeg(100))
+
+    assert signature.shape == (30, 40)
+    assert signature.mean() == pytest.approx(100, abs=2)
+
+
+def test_gate_skips_unchanged_frames():
+    gate = LoresGate(threshold=2.0, refresh_s=1.0)
+
+    assert gate.admit(jpeg(100), now=0.0)
+    assert not gate.admit(jpeg(100), now=0.1)
+    assert not gate.admit(jpeg(101), now=0.2)
+    assert gate.admit(jpeg(120), now=0.3)
+
+    assert (gate.stats.sent, gate.stats.skipped) == (2, 2)
+
+
+def test_gate_compares_to_last_sent_frame():
+    gate = LoresGate(threshold=2.5, refresh_s=10.0)
+    assert gate.admit(jpeg(100), now=0.0)
+
+    # small steps add up until the change to the sent frame exceeds the threshold
+    admitted = [gate.admit(jpeg(100 + step), now=step / 10) for step in range(1, 5)]
+
+    assert admitted == [False, False, True, False]
+
+
+def test_gate_refreshes_and_passes_new_resolutions():
+    gate = LoresGate(threshold=2.0, refresh_s=1.0)
+    assert gate.admit(jpeg(100), now=0.0)
+
+    assert gate.admit(jpeg(100), now=1.0)
+    assert gate.admit(jpeg(100, size=(80, 80)), now=1.1)
+
+
+def test_gate_detects_local_change():
+    gate = LoresGate(threshold=2.0, refresh_s=10.0)
+    array = numpy.zeros((240, 320, 3), numpy.uint8)
+    frames = []
+    for _ in range(2):
+        byte_io = io.BytesIO()
+        Image.fromarray(array).save(byte_io, format="JPEG")
+        frames.append(byte_io.getvalue())
+        array[60:180, 80:240] = 255  # someone steps in, a quarter of the frame
+
+    assert gate.admit(frames[0], now=0.0)
+    assert gate.admit(frames[1], now=0.1)
@@ -1,14 +1,19 @@
 import asyncio
 import io
+import threading
+import time
 import uuid
 from unittest.mock import AsyncMock
 
 import pytest
 from PIL import Image
 
+from wigglecam.backends.cameras.base import STAGE_SECONDS
 from wigglecam.backends.cameras.output.base import CameraOutput
 from wigglecam.backends.cameras.virtual import Virtual
-from wigglecam.dto import ImageMessage
+from wigglecam.dto import Codec, ImageMessage, PixelFormat, StreamLevel
+from wigglecam.hub.chunks import ChunkAssembler
+from wigglecam.hub.raw import decode_raw
 
 
 class DummyOutput(CameraOutput):
@@ -60,7 +65,7 @@ async def test_trigger_hires_capture_writes_to_output():
     hires_imgmsg = ImageMessage.from_bytes(hires_bytes)
     assert hires_imgmsg.job_id == job_id
     assert hires_imgmsg.device_id == 42
-    with Image.open(io.BytesIO(hires_imgmsg.jpg_bytes)) as img:
+    with Image.open(io.BytesIO(hires_imgmsg.payload)) as img:
         img.verify()
         assert img.format == "JPEG"
 
@@ -73,8 +78,8 @@ async def test_run_writes_to_lores_once():
 
     task = asyncio.create_task(cam.run())
 
-    # give it time to produce at least one frame
-    while len(lores.written) == 0:
+    # give it time to produce at least one frame after the ready announcement
+    while len(lores.written) < 2:
         await asyncio.sleep(0.05)
 
     task.cancel()
@@ -82,14 +87,14 @@ async def test_run_writes_to_lores_once():
     with pytest.raises(asyncio.CancelledError):
         await task
 
-    assert len(lores.written) >= 1
-    lores_bytes = lores.written[0]
+    assert ImageMessage.from_bytes(lores.written[0]).is_ready
+    lores_bytes = lores.written[1]
     assert isinstance(lores_bytes, bytes)
 
     lores_imgmsg = ImageMessage.from_bytes(lores_bytes)
     assert lores_imgmsg.job_id is None
     assert lores_imgmsg.device_id == 42
-    with Image.open(io.BytesIO(lores_imgmsg.jpg_bytes)) as img:
+    with Image.open(io.BytesIO(lores_imgmsg.payload)) as img:
         img.verify()
         assert img.format == "JPEG"
 
@@ -103,7 +108,266 @@ async def test_trigger_hires_capture_with_mock():
     job_id = uuid.uuid4()
     await cam.trigger_hires_capture(job_id)
 
-    hires.awrite.assert_called_once()
-    # You can still inspect the actual bytes if needed:
-    written_bytes = hires.awrite.call_args[0][0]
-    assert isinstance(written_bytes, bytes)
+    hires.awrite_segments.assert_called_once()
+    # You can still inspect the actual header and payload if needed:
+    header, payload = hires.awrite_segments.call_args[0]
+    assert isinstance(header, bytes)
+    assert ImageMessage.from_bytes(header + payload).job_id == job_id
+
+
+@pytest.mark.asyncio
+async def test_run_streams_selected_level():
+    lores = DummyOutput()
+    cam = Virtual(device_id=42, output_lores=lores, output_hires=DummyOutput())
+    cam.select_lores_level(StreamLevel.THUMBNAIL)
+
+    task = asyncio.create_task(cam.run())
+    while len(lores.written) < 2:
+        await asyncio.sleep(0.05)
+    task.cancel()
+
+    msg = ImageMessage.from_bytes(lores.written[1])
+    assert msg.level is StreamLevel.THUMBNAIL
+    with Image.open(io.BytesIO(msg.payload)) as img:
+        assert img.size == (125, 125)
+
+
+@pytest.mark.asyncio
+async def test_run_gates_unchanged_lores(monkeypatch):
+    monkeypatch.setenv("CAMERA_LORES_GATE_ENABLED", "true")
+    monkeypatch.setenv("CAMERA_LORES_GATE_THRESHOLD", "255")  # nothing counts as changed
+    monkeypatch.setenv("CAMERA_LORES_GATE_REFRESH_MS", "60000")
+    monkeypatch.setenv("CAMERA_VIRTUAL_FPS_NOMINAL", "50")
+    lores = DummyOutput()
+    cam = Virtual(device_id=42, output_lores=lores, output_hires=DummyOutput())
+
+    task = asyncio.create_task(cam.run())
+    while cam._lores_gate.stats.skipped < 3:
+        await asyncio.sleep(0.02)
+    task.cancel()
+
+    # the ready message and the first frame, which the gate compares later frames to
+    assert len(lores.written) == 2
+    assert cam._lores_gate.stats.sent == 1
+
+
+@pytest.mark.asyncio
+async def test_hires_resolution_configurable(monkeypatch):
+    monkeypatch.setenv("CAMERA_VIRTUAL_HIRES_RES_WIDTH", "640")
+    monkeypatch.setenv("CAMERA_VIRTUAL_HIRES_RES_HEIGHT", "480")
+    hires = DummyOutput()
+    cam = Virtual(device_id=1, output_lores=DummyOutput(), output_hires=hires)
+
+    await cam.trigger_hires_capture(uuid.uuid4())
+
+    with Image.open(io.BytesIO(ImageMessage.from_bytes(hires.written[0]).payload)) as img:
+        assert img.size == (640, 480)
+
+
+@pytest.mark.asyncio
+async def test_hires_raw_codec(monkeypatch):
+    monkeypatch.setenv("CAMERA_VIRTUAL_HIRES_RES_WIDTH", "64")
+    monkeypatch.setenv("CAMERA_VIRTUAL_HIRES_RES_HEIGHT", "48")
+    monkeypatch.setenv("CAMERA_HIRES_CODEC", "zlib")
+    hires = DummyOutput()
+    cam = Virtual(device_id=1, output_lores=DummyOutput(), output_hires=hires)
+
+    await cam.trigger_hires_capture(uuid.uuid4())
+
+    msg = ImageMessage.from_bytes(hires.written[0])
+    assert (msg.codec, msg.pixel_format, msg.width, msg.height) == (Codec.ZLIB, PixelFormat.RGB888, 64, 48)
+    assert decode_raw(msg).shape == (48, 64, 3)
+
+
+def test_produce_dummy_image_replays_cache(monkeypatch):
+    monkeypatch.setenv("CAMERA_VIRTUAL_CACHE_SIZE", "3")
+    cam = Virtual(device_id=1, output_lores=DummyOutput(), output_hires=DummyOutput())
+
+    frames = [cam._produce_dummy_image() for _ in range(6)]
+
+    assert frames[0] != frames[1]
+    assert frames[0] is frames[3]
+    assert frames[2] is frames[5]
+
+
+def test_produce_dummy_image_live_encode(monkeypatch):
+    monkeypatch.setenv("CAMERA_VIRTUAL_CACHE_SIZE", "1")
+    monkeypatch.setenv("CAMERA_VIRTUAL_LIVE_ENCODE", "true")
+    cam = Virtual(device_id=1, output_lores=DummyOutput(), output_hires=DummyOutput())
+
+    first = cam._produce_dummy_image()
+    second = cam._produce_dummy_image()
+
+    assert first == second
+    assert first is not second
+
+
+@pytest.mark.asyncio
+async def test_trigger_hires_capture_zero_shutter_lag(monkeypatch):
+    monkeypatch.setenv("CAMERA_ZSL_RING_SIZE", "5")
+    monkeypatch.setenv("CAMERA_VIRTUAL_HIRES_RES_WIDTH", "320")
+    monkeypatch.setenv("CAMERA_VIRTUAL_HIRES_RES_HEIGHT", "240")
+    lores = DummyOutput()
+    hires = DummyOutput()
+    cam = Virtual(device_id=1, output_lores=lores, output_hires=hires)
+
+    task = asyncio.create_task(cam.run())
+    while len(lores.written) < 3:
+        await asyncio.sleep(0.05)
+
+    reference = ImageMessage.from_bytes(lores.written[1])
+    await cam.trigger_hires_capture(uuid.uuid4(), reference_time_ns=reference.timestamp_ns)
+
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    hires_imgmsg = ImageMessage.from_bytes(hires.written[0])
+    assert hires_imgmsg.timestamp_ns == reference.timestamp_ns
+    assert hires_imgmsg.sequence == reference.sequence
+    with Image.open(io.BytesIO(hires_imgmsg.payload)) as img:
+        assert img.size == (320, 240)
+
+
+@pytest.mark.asyncio
+async def test_trigger_hires_burst_streams_frames(monkeypatch):
+    monkeypatch.setenv("CAMERA_VIRTUAL_HIRES_RES_WIDTH", "320")
+    monkeypatch.setenv("CAMERA_VIRTUAL_HIRES_RES_HEIGHT", "240")
+    hires = DummyOutput()
+    cam = Virtual(device_id=3, output_lores=DummyOutput(), output_hires=hires)
+
+    job_id = uuid.uuid4()
+    await cam.trigger_hires_burst(job_id, frames=4, interval_s=0.02)
+
+    msgs = [ImageMessage.from_bytes(written) for written in hires.written]
+    assert [msg.frame_index for msg in msgs] == [0, 1, 2, 3]
+    assert all(msg.frame_count == 4 and msg.job_id == job_id and msg.device_id == 3 for msg in msgs)
+    timestamps = [msg.timestamp_ns for msg in msgs]
+    assert timestamps == sorted(timestamps)
+    assert (timestamps[-1] - timestamps[0]) / 1e6 >= 3 * 20 * 0.9
+
+
+@pytest.mark.asyncio
+async def test_trigger_hires_burst_encodes_in_parallel(monkeypatch):
+    monkeypatch.setenv("CAMERA_VIRTUAL_HIRES_RES_WIDTH", "320")
+    monkeypatch.setenv("CAMERA_VIRTUAL_HIRES_RES_HEIGHT", "240")
+    monkeypatch.setenv("CAMERA_HIRES_ENCODE_WORKERS", "4")
+    hires = DummyOutput()
+    cam = Virtual(device_id=3, output_lores=DummyOutput(), output_hires=hires)
+
+    encode = cam._encode_hires_frame
+    lock = threading.Lock()
+    running = []
+    overlap = 0
+
+    def slow_encode(frame):
+        nonlocal overlap
+        with lock:
+            running.append(frame)
+            overlap = max(overlap, len(running))
+        time.sleep(0.2)
+        with lock:
+            running.remove(frame)
+        return encode(frame)
+
+    monkeypatch.setattr(cam, "_encode_hires_frame", slow_encode)
+
+    start = time.monotonic()
+    await cam.trigger_hires_burst(uuid.uuid4(), frames=4, interval_s=0.01)
+    elapsed = time.monotonic() - start
+
+    msgs = [ImageMessage.from_bytes(written) for written in hires.written]
+    assert [msg.frame_index for msg in msgs] == [0, 1, 2, 3]
+    assert 1 < overlap <= 4
+    assert elapsed < 4 * 0.2  # one encode at a time would take at least that long
+
+
+@pytest.mark.asyncio
+async def test_trigger_hires_capture_chunked(monkeypatch):
+    monkeypatch.setenv("CAMERA_VIRTUAL_HIRES_RES_WIDTH", "320")
+    monkeypatch.setenv("CAMERA_VIRTUAL_HIRES_RES_HEIGHT", "240")
+    monkeypatch.setenv("CAMERA_HIRES_CHUNK_SIZE", "1000")
+    hires = DummyOutput()
+    cam = Virtual(device_id=3, output_lores=DummyOutput(), output_hires=hires)
+    serialize_count, send_count = STAGE_SECONDS["serialize"].count, STAGE_SECONDS["send"].count
+
+    job_id = uuid.uuid4()
+    await cam.trigger_hires_capture(job_id)
+
+    msgs = [ImageMessage.from_bytes(written) for written in hires.written]
+    assert len(msgs) > 1
+    # once per frame, like unchunked frames
+    assert STAGE_SECONDS["serialize"].count == serialize_count + 1
+    assert STAGE_SECONDS["send"].count == send_count + 1
+    assert all(msg.is_chunk and msg.job_id == job_id and len(msg.payload) <= 1000 for msg in msgs)
+    assert [msg.chunk_offset for msg in msgs] == list(range(0, msgs[0].total_len, 1000))
+
+    assembler = ChunkAssembler()
+    results = [assembler.feed(msg) for msg in msgs]
+    assert results[:-1] == [None] * (len(msgs) - 1)
+    with Image.open(io.BytesIO(results[-1].payload)) as img:
+        assert img.size == (320, 240)
+
+
+class CountingOutput(DummyOutput):
+    def __init__(self, subscriber_count: int):
+        super().__init__()
+        self.subscribers = subscriber_count
+
+    @property
+    def subscriber_count(self) -> int:
+        return self.subscribers
+
+
+@pytest.mark.asyncio
+async def test_run_pauses_lores_without_subscribers(monkeypatch):
+    monkeypatch.setenv("CAMERA_VIRTUAL_FPS_NOMINAL", "50")
+    lores = CountingOutput(subscriber_count=0)
+    cam = Virtual(device_id=1, output_lores=lores, output_hires=DummyOutput())
+
+    task = asyncio.create_task(cam.run())
+    await asyncio.sleep(0.2)
+    assert len(lores.written) == 0
+
+    lores.subscribers = 1
+    await asyncio.sleep(0.1)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert len(lores.written) >= 1
+
+
+@pytest.mark.asyncio
+async def test_run_sends_keepalive_without_subscribers(monkeypatch):
+    monkeypatch.setenv("CAMERA_VIRTUAL_FPS_NOMINAL", "50")
+    monkeypatch.setenv("CAMERA_LORES_IDLE_MODE", "keepalive")
+    monkeypatch.setenv("CAMERA_LORES_KEEPALIVE_INTERVAL_MS", "100")
+    lores = CountingOutput(subscriber_count=0)
+    cam = Virtual(device_id=1, output_lores=lores, output_hires=DummyOutput())
+
+    task = asyncio.create_task(cam.run())
+    await asyncio.sleep(0.35)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    # 50fps for 350ms would be ~17 frames, keepalive sends ~4
+    assert 2 <= len(lores.written) <= 5
+
+
+@pytest.mark.asyncio
+async def test_run_announces_ready_on_first_frame():
+    lores = DummyOutput()
+    cam = Virtual(device_id=4, output_lores=lores, output_hires=DummyOutput())
+
+    start = time.perf_counter()
+    task = asyncio.create_task(cam.run())
+    await asyncio.wait_for(cam.wait_ready(), timeout=1.0)
+    time_to_first_frame = time.perf_counter() - start
+    task.cancel()
+
+    assert cam.ready
+    assert time_to_first_frame < 0.5
+    msg = ImageMessage.from_bytes(lores.written[0])
+    assert msg.is_ready and msg.device_id == 4 and len(msg.payload) == 0
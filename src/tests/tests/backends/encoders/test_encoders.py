@@ -0,0 +1,47 @@
+import io
+
+import numpy
+import pytest
+from PIL import Image
+
+from wigglecam.backends.encoders.base import ENCODER_CLASSES, encoder_factory
+
+
+def create_encoder(name: str, *args):
+    try:
+        return encoder_factory(name, *args)
+    except (ImportError, OSError):
+        pytest.skip(f"{name} not installed")
+
+
+@pytest.fixture(scope="module")
+def red_frame():
+    frame = numpy.zeros((64, 96, 3), dtype=numpy.uint8)
+    frame[..., 0] = 255
+    return frame
+
+
+@pytest.mark.parametrize("name", list(ENCODER_CLASSES))
+@pytest.mark.parametrize("channel_order", ["RGB", "BGR"])
+def test_encode_keeps_colors(name, channel_order, red_frame):
+    encoder = create_encoder(name, 90, "444")
+    frame = red_frame if channel_order == "RGB" else red_frame[..., ::-1]
+
+    with Image.open(io.BytesIO(encoder.encode(frame, channel_order))) as img:
+        assert img.size == (96, 64)
+        red, green, blue = img.convert("RGB").getpixel((48, 32))
+
+    assert red > 240 and green < 15 and blue < 15
+
+
+@pytest.mark.parametrize("name", list(ENCODER_CLASSES))
+def test_quality_and_subsampling(name):
+    frame = numpy.random.default_rng(0).integers(0, 255, (64, 96, 3), dtype=numpy.uint8)
+
+    sizes = {args: len(create_encoder(name, *args).encode(frame)) for args in ((90, "444"), (90, "420"), (50, "420"))}
+
+    assert sizes[(90, "444")] > sizes[(90, "420")] > sizes[(50, "420")]
+
+
+def test_auto_picks_installed_encoder():
+    assert type(encoder_factory("auto")).__name__ in ENCODER_CLASSES.values()
@@ -0,0 +1,78 @@
+import uuid
+
+import pytest
+
+from wigglecam.backends.results.cache import ResultCache
+from wigglecam.dto import ImageMessage
+
+
+@pytest.mark.asyncio
+async def test_get_returns_cached_result():
+    cache = ResultCache(max_bytes=1000)
+    msg = ImageMessage(1, b"x" * 100, job_id=uuid.uuid4(), frame_index=2)
+
+    cache.put(msg)
+
+    assert await cache.get(msg.job_id, 2) is msg
+    assert await cache.get(msg.job_id, 0) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+@pytest.mark.asyncio
+async def test_evicts_least_recently_used_by_bytes():
+    cache = ResultCache(max_bytes=250)
+    msgs = [ImageMessage(1, b"x" * 100, job_id=uuid.uuid4()) for _ in range(3)]
+
+    cache.put(msgs[0])
+    cache.put(msgs[1])
+    await cache.get(msgs[0].job_id)  # msgs[1] is least recently used now
+    cache.put(msgs[2])
+
+    assert await cache.get(msgs[1].job_id) is None
+    assert await cache.get(msgs[0].job_id) is msgs[0]
+    assert cache.memory_bytes == 200
+
+
+@pytest.mark.asyncio
+async def test_spills_evicted_results_to_disk(tmp_path):
+    cache = ResultCache(max_bytes=150, spill_dir=tmp_path, spill_max_bytes=10_000)
+    msgs = [ImageMessage(3, bytes([index]) * 100, job_id=uuid.uuid4()) for index in range(3)]
+
+    for msg in msgs:
+        cache.put(msg)
+
+    # written in a worker thread, served from memory meanwhile
+    assert await cache.get(msgs[0].job_id) is msgs[0]
+    await cache.flush()
+
+    assert len(cache) == 3
+    assert len(list(tmp_path.iterdir())) == 2
+    spilled = await cache.get(msgs[0].job_id)
+    assert spilled is not None
+    assert spilled.device_id == 3
+    assert bytes(spilled.payload) == bytes(msgs[0].payload)
+
+
+@pytest.mark.asyncio
+async def test_spill_is_bounded(tmp_path):
+    cache = ResultCache(max_bytes=0, spill_dir=tmp_path, spill_max_bytes=300)
+
+    for _ in range(5):
+        cache.put(ImageMessage(1, b"x" * 100, job_id=uuid.uuid4()))
+        await cache.flush()
+
+    assert len(list(tmp_path.iterdir())) == 1  # one message with header is more than 100 bytes
+
+
+@pytest.mark.asyncio
+async def test_removed_spill_file_is_a_miss(tmp_path):
+    cache = ResultCache(max_bytes=0, spill_dir=tmp_path, spill_max_bytes=10_000)
+    msg = ImageMessage(1, b"x" * 100, job_id=uuid.uuid4())
+    cache.put(msg)
+    await cache.flush()
+
+    for path in tmp_path.iterdir():
+        path.unlink()
+
+    assert await cache.get(msg.job_id) is None
+    assert cache.misses == 1
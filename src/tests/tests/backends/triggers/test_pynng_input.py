@@ -0,0 +1,31 @@
+import asyncio
+import uuid
+
+import pynng
+import pytest
+
+from wigglecam.backends.triggers.input.pynng import PynngTriggerInput
+from wigglecam.dto import CONTROL_MAGIC, StreamControlMessage, StreamLevel, TriggerMessage
+
+
+@pytest.mark.asyncio
+async def test_invalid_messages_are_skipped():
+    trigger_input = PynngTriggerInput("tcp://127.0.0.1:5955")
+    controls = []
+    trigger_input.add_control_listener(controls.append)
+    pub = pynng.Pub0(dial="tcp://127.0.0.1:5955")
+
+    try:
+        await asyncio.sleep(0.2)  # subscription established
+        job_id = uuid.uuid4()
+        control = StreamControlMessage(level=StreamLevel.THUMBNAIL)
+        for msg in (b"garbage", CONTROL_MAGIC + b"\x01", control.to_bytes(), TriggerMessage(job_id).to_bytes()):
+            await pub.asend(msg)
+
+        trigger = await asyncio.wait_for(trigger_input.receive_trigger(), timeout=2.0)
+
+        assert trigger.job_id == job_id
+        assert [control.level for control in controls] == [StreamLevel.THUMBNAIL]
+    finally:
+        pub.close()
+        trigger_input.close()
@@ -0,0 +1,120 @@
+import asyncio
+import uuid
+
+import pytest
+
+from wigglecam.dto import ImageMessage
+from wigglecam.hub.aggregator import JobAggregator, JobStatus
+from wigglecam.hub.latency import LatencyTracker
+
+
+@pytest.mark.asyncio
+async def test_jobs_in_flight_resolve_independently():
+    done = []
+    aggregator = JobAggregator(device_count=2, on_job_done=done.append)
+    job_a, job_b = uuid.uuid4(), uuid.uuid4()
+    future_a = aggregator.start_job(job_a)
+    future_b = aggregator.start_job(job_b, frames=2)
+
+    for device_id in (1, 2):
+        assert aggregator.add(ImageMessage(device_id, b"b0", job_id=job_b, frame_index=0, frame_count=2))
+        assert aggregator.add(ImageMessage(device_id, b"a", job_id=job_a))
+    assert not aggregator.add(ImageMessage(1, b"a", job_id=job_a))  # finished already
+
+    result_a = await future_a
+    assert result_a.status is JobStatus.COMPLETE
+    assert set(result_a.results) == {(1, 0), (2, 0)}
+    assert not future_b.done()
+
+    for device_id in (1, 2):
+        aggregator.add(ImageMessage(device_id, b"b1", job_id=job_b, frame_index=1, frame_count=2))
+
+    assert (await future_b).status is JobStatus.COMPLETE
+    assert [result.job_id for result in done] == [job_a, job_b]
+    assert aggregator.stats.unknown == 1
+
+
+@pytest.mark.asyncio
+async def test_duplicates_are_ignored():
+    aggregator = JobAggregator(device_count=2, timeout_s=0.05)
+    job_id = uuid.uuid4()
+    future = aggregator.start_job(job_id)
+
+    assert aggregator.add(ImageMessage(1, b"x", job_id=job_id))
+    assert not aggregator.add(ImageMessage(1, b"x", job_id=job_id))
+
+    result = await future
+    assert result.status is JobStatus.PARTIAL
+    assert aggregator.stats.duplicates == 1
+
+
+@pytest.mark.asyncio
+async def test_timeout_fails_and_partial():
+    aggregator = JobAggregator(device_count=2, timeout_s=0.05)
+    future_failed = aggregator.start_job(uuid.uuid4())
+    job_id = uuid.uuid4()
+    future_partial = aggregator.start_job(job_id, device_ids={1, 2})
+    aggregator.add(ImageMessage(1, b"x", job_id=job_id))
+
+    result_failed, result_partial = await asyncio.gather(future_failed, future_partial)
+
+    assert result_failed.status is JobStatus.FAILED
+    assert result_partial.status is JobStatus.PARTIAL
+    assert result_partial.missing == [(2, 0)]
+
+
+@pytest.mark.asyncio
+async def test_timeout_recovers_missing_results():
+    requested = []
+
+    async def recover(job_id, missing):
+        requested.extend(missing)
+        return [ImageMessage(device_id, b"fetched", job_id=job_id, frame_index=index) for device_id, index in missing]
+
+    aggregator = JobAggregator(device_count=2, timeout_s=0.05, recover=recover)
+    job_id = uuid.uuid4()
+    future = aggregator.start_job(job_id, device_ids={1, 2})
+    aggregator.add(ImageMessage(1, b"x", job_id=job_id))
+
+    result = await future
+
+    assert requested == [(2, 0)]
+    assert result.status is JobStatus.COMPLETE
+    assert bytes(result.results[(2, 0)].payload) == b"fetched"
+
+
+@pytest.mark.asyncio
+async def test_drop_device_finishes_job_early():
+    aggregator = JobAggregator(device_count=0, timeout_s=10.0)
+    job_id = uuid.uuid4()
+    future = aggregator.start_job(job_id, device_ids={1, 2})
+
+    aggregator.add(ImageMessage(1, b"a", job_id=job_id))
+    assert not future.done()
+    aggregator.drop_device(2)
+
+    result = await asyncio.wait_for(future, timeout=1.0)
+    assert result.status is JobStatus.PARTIAL
+    assert result.missing == [(2, 0)]
+
+
+@pytest.mark.asyncio
+async def test_deadline_adapts_to_device_latency():
+    latency = LatencyTracker(min_samples=3, margin_s=0.05)
+    aggregator = JobAggregator(device_count=2, timeout_s=5.0, latency=latency)
+    for _ in range(3):
+        latency.observe(1, 0.01)
+        latency.observe(2, 0.02)
+
+    job_id = uuid.uuid4()
+    future = aggregator.start_job(job_id)
+    aggregator.add(ImageMessage(1, b"a", job_id=job_id))
+
+    # device 2 never delivers, the job finishes at its p99 plus margin instead of timeout_s
+    result = await asyncio.wait_for(future, timeout=1.0)
+    assert result.status is JobStatus.PARTIAL
+    assert result.deadline_s == pytest.approx(0.07)
+
+    aggregator.add(ImageMessage(2, b"b", job_id=job_id))
+    assert aggregator.stats.late == 1
+    assert latency.stats()[2].late == 1
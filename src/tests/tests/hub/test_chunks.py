@@ -0,0 +1,106 @@
+import time
+import uuid
+
+from wigglecam.dto import FLAG_CHUNK, ImageMessage
+from wigglecam.hub.chunks import ChunkAssembler
+
+
+def _chunks(payload: bytes, chunk_size: int, job_id: uuid.UUID, device_id: int = 1) -> list[ImageMessage]:
+    return [
+        ImageMessage(
+            device_id,
+            payload[offset : offset + chunk_size],
+            job_id=job_id,
+            flags=FLAG_CHUNK,
+            chunk_offset=offset,
+            total_len=len(payload),
+        )
+        for offset in range(0, len(payload), chunk_size)
+    ]
+
+
+def test_unchunked_message_passes_through():
+    msg = ImageMessage(1, b"abc")
+
+    assert ChunkAssembler().feed(msg) is msg
+
+
+def test_empty_chunked_transfer_completes():
+    msg = ImageMessage(1, b"", job_id=uuid.uuid4(), flags=FLAG_CHUNK, total_len=0)
+    assembler = ChunkAssembler()
+
+    result = assembler.feed(msg)
+
+    assert result is not None and not result.is_chunk
+    assert bytes(result.payload) == b""
+    assert assembler.pending == 0
+
+
+def test_assembles_out_of_order_chunks():
+    payload = bytes(range(256)) * 10
+    chunks = _chunks(payload, 100, uuid.uuid4())
+    assembler = ChunkAssembler()
+
+    results = [assembler.feed(chunk) for chunk in reversed(chunks)]
+
+    assert results[:-1] == [None] * (len(chunks) - 1)
+    assert bytes(results[-1].payload) == payload
+    assert not results[-1].is_chunk
+    assert assembler.pending == 0
+
+
+def test_interleaved_devices_and_duplicates():
+    job_id = uuid.uuid4()
+    chunks_a = _chunks(b"a" * 300, 100, job_id, device_id=1)
+    chunks_b = _chunks(b"b" * 300, 100, job_id, device_id=2)
+    received = []
+    assembler = ChunkAssembler(on_chunk=received.append)
+
+    results = [assembler.feed(chunk) for pair in zip(chunks_a, chunks_b, strict=True) for chunk in pair]
+    assert assembler.feed(chunks_a[0]) is None  # duplicate after completion starts a new transfer
+    assert assembler.feed(chunks_b[0]) is None
+
+    done = [result for result in results if result is not None]
+    assert [(msg.device_id, bytes(msg.payload)) for msg in done] == [(1, b"a" * 300), (2, b"b" * 300)]
+    assert len(received) == 8
+    assert assembler.progress(job_id, 1) == (100, 300)
+
+
+def test_evicts_stale_transfers():
+    assembler = ChunkAssembler(max_transfers=2)
+
+    for _ in range(3):
+        assembler.feed(_chunks(b"x" * 200, 100, uuid.uuid4())[0])
+
+    assert assembler.pending == 2
+    assert assembler.evicted == 1
+
+
+def test_missing_ranges_of_stalled_transfers():
+    job_id = uuid.uuid4()
+    chunks = _chunks(bytes(range(250)), 50, job_id)
+    assembler = ChunkAssembler()
+    for chunk in (chunks[0], chunks[2]):
+        assembler.feed(chunk)
+    key = (job_id, 1, 0)
+
+    assert assembler.missing_ranges(key) == [(50, 50), (150, 100)]
+    assert assembler.stalled(idle_s=1.0) == []
+    assert assembler.stalled(idle_s=1.0, now=time.monotonic() + 2.0) == [key]
+    assert assembler.stalled(idle_s=1.0, now=time.monotonic() + 2.0) == []  # reported once per idle_s
+
+
+def test_fetched_range_overlapping_late_chunks():
+    payload = bytes(range(250))
+    job_id = uuid.uuid4()
+    chunks = _chunks(payload, 50, job_id)
+    fetched = ImageMessage(1, payload[100:250], job_id=job_id, flags=FLAG_CHUNK, chunk_offset=100, total_len=len(payload))
+    assembler = ChunkAssembler()
+
+    assert assembler.feed(chunks[0]) is None
+    assert assembler.feed(fetched) is None
+    assert assembler.feed(chunks[3]) is None  # arrived late, covered by the fetched range already
+    assert assembler.missing_ranges((job_id, 1, 0)) == [(50, 50)]
+
+    result = assembler.feed(chunks[1])
+    assert bytes(result.payload) == payload
@@ -0,0 +1,315 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from wigglecam.app import CameraApp
+from wigglecam.backends.cameras.output.pynng import PynngCameraOutput
+from wigglecam.backends.cameras.virtual import Virtual
+from wigglecam.backends.results.pynng import PynngResultServer
+from wigglecam.backends.triggers.input.pynng import PynngTriggerInput
+from wigglecam.discovery import Announcer
+from wigglecam.dto import CAP_RESULT_FETCH, CAP_TCP_OUTPUT, StreamLevel
+from wigglecam.hub.aggregator import JobStatus
+from wigglecam.hub.client import HubClient
+
+
+def pynng_node(device_id: int, base_port: int, host: str = "127.0.0.1", result_server: bool = False, **kwargs) -> tuple[Virtual, CameraApp, list]:
+    """Virtual node listening on base_port and the sockets to close after the test, sockets left to the garbage
+    collector can deadlock with the pipe callbacks of pynng."""
+    sockets = [PynngCameraOutput(f"tcp://{host}:{base_port + offset}") for offset in (1, 2)]
+    sockets.append(PynngTriggerInput(f"tcp://{host}:{base_port}"))
+    if result_server:
+        sockets.append(PynngResultServer(f"tcp://{host}:{base_port + 3}"))
+
+    camera = Virtual(device_id, sockets[0], sockets[1])
+    return camera, CameraApp(camera, *sockets[2:], **kwargs), sockets
+
+
+@pytest.mark.asyncio
+async def test_back_to_back_jobs(monkeypatch):
+    monkeypatch.setenv("CAMERA_VIRTUAL_HIRES_RES_WIDTH", "320")
+    monkeypatch.setenv("CAMERA_VIRTUAL_HIRES_RES_HEIGHT", "240")
+    base_port = 5970
+
+    _, node, sockets = pynng_node(7, base_port, result_server=True)
+    hub = HubClient([("127.0.0.1", base_port)], job_timeout_s=3.0)
+    tasks = [asyncio.create_task(node.run()), asyncio.create_task(hub.run())]
+
+    try:
+        while not hub.ready_devices:
+            await asyncio.sleep(0.01)
+        assert hub.ready_devices == {7}
+        await asyncio.sleep(0.2)  # subscription of the node's trigger input is established
+
+        results = await asyncio.gather(*(hub.trigger() for _ in range(3)))
+
+        assert [result.status for result in results] == [JobStatus.COMPLETE] * 3
+        assert len({result.job_id for result in results}) == 3
+        assert all(list(result.results) == [(7, 0)] for result in results)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.sleep(0)
+        hub.close()
+        for sock in sockets:
+            sock.close()
+
+
+@pytest.mark.asyncio
+async def test_discovered_nodes_are_dialed(monkeypatch):
+    monkeypatch.setenv("CAMERA_VIRTUAL_HIRES_RES_WIDTH", "320")
+    monkeypatch.setenv("CAMERA_VIRTUAL_HIRES_RES_HEIGHT", "240")
+    base_port = 5975
+
+    # the hub dials the source address of the announcement, which is not necessarily the loopback interface
+    announcer = Announcer(8, base_port, CAP_TCP_OUTPUT | CAP_RESULT_FETCH, interval_s=0.05, port=5994)
+    _, node, sockets = pynng_node(8, base_port, host="0.0.0.0", announcer=announcer)
+    hub = HubClient(job_timeout_s=3.0, discovery=True, discovery_port=5994)
+    tasks = [asyncio.create_task(node.run()), asyncio.create_task(hub.run())]
+
+    try:
+        async with asyncio.timeout(5.0):
+            while not hub.ready_devices:
+                await asyncio.sleep(0.01)
+        assert hub.registry.alive_device_ids == {8}
+        await asyncio.sleep(0.2)  # subscription of the node's trigger input is established
+
+        result = await hub.trigger()
+
+        assert result.status is JobStatus.COMPLETE
+        assert list(result.results) == [(8, 0)]
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.sleep(0)
+        hub.close()
+        announcer.close()
+        for sock in sockets:
+            sock.close()
+
+
+@pytest.mark.asyncio
+async def test_select_lores_level():
+    base_port = 5985
+    lores = []
+
+    camera, node, sockets = pynng_node(9, base_port)
+    hub = HubClient([("127.0.0.1", base_port)], on_lores=lores.append)
+    tasks = [asyncio.create_task(node.run()), asyncio.create_task(hub.run())]
+
+    try:
+        async with asyncio.timeout(5.0):
+            # selected before the node subscribed, the hub corrects the level once it sees the node streaming lores
+            await hub.select_lores_level(StreamLevel.THUMBNAIL)
+            while not lores or lores[-1].level is not StreamLevel.THUMBNAIL:
+                await asyncio.sleep(0.01)
+
+            await hub.select_lores_level(StreamLevel.LORES, device_id=9)
+            while lores[-1].level is not StreamLevel.LORES:
+                await asyncio.sleep(0.01)
+        assert camera.lores_level is StreamLevel.LORES
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.sleep(0)
+        hub.close()
+        for sock in sockets:
+            sock.close()
+
+
+@pytest.mark.asyncio
+async def test_ready_again_after_node_restart():
+    base_port = 5960
+    ready = []
+    hub = HubClient([("127.0.0.1", base_port)], on_ready=ready.append)
+    hub_task = asyncio.create_task(hub.run())
+
+    try:
+        for start in range(2):
+            outputs = [PynngCameraOutput(f"tcp://127.0.0.1:{base_port + offset}") for offset in (1, 2)]
+            node_task = asyncio.create_task(Virtual(5, *outputs).run())
+            async with asyncio.timeout(5.0):
+                while len(ready) < start + 1:
+                    await asyncio.sleep(0.01)
+                assert hub.ready_devices == {5}
+
+                node_task.cancel()
+                for output in outputs:
+                    output.close()
+                while hub.ready_devices:
+                    await asyncio.sleep(0.01)
+
+        assert ready == [5, 5]
+    finally:
+        hub_task.cancel()
+        hub.close()
+
+
+@pytest.mark.asyncio
+async def test_static_and_discovered_nodes_on_localhost(monkeypatch):
+    monkeypatch.setenv("CAMERA_VIRTUAL_HIRES_RES_WIDTH", "320")
+    monkeypatch.setenv("CAMERA_VIRTUAL_HIRES_RES_HEIGHT", "240")
+    announcing_port, static_port = 5900, 5905
+
+    # a static device that announces itself also and one that does not announce
+    announcer = Announcer(3, announcing_port, CAP_TCP_OUTPUT, interval_s=0.05, port=5995)
+    _, announcing_node, announcing_sockets = pynng_node(3, announcing_port, host="0.0.0.0", announcer=announcer)
+    _, static_node, static_sockets = pynng_node(4, static_port, host="0.0.0.0")
+    nodes = [announcing_node, static_node]
+    hub = HubClient([("localhost", announcing_port), ("localhost", static_port)], job_timeout_s=3.0, discovery=True, discovery_port=5995)
+    tasks = [asyncio.create_task(node.run()) for node in nodes] + [asyncio.create_task(hub.run())]
+
+    try:
+        async with asyncio.timeout(5.0):
+            while hub.ready_devices != {3, 4} or not hub.registry.alive_device_ids:
+                await asyncio.sleep(0.01)
+        await asyncio.sleep(0.2)  # subscription of the node's trigger input is established
+
+        result = await hub.trigger()
+
+        assert hub.expected_devices == 2  # the announcing node is not dialed a second time
+        assert result.status is JobStatus.COMPLETE
+        assert sorted(result.results) == [(3, 0), (4, 0)]
+        assert hub.aggregator.stats.duplicates == 0
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.sleep(0)
+        hub.close()
+        announcer.close()
+        for sock in announcing_sockets + static_sockets:
+            sock.close()
+
+
+@pytest.mark.asyncio
+async def test_invalid_messages_are_skipped():
+    base_port = 5945
+    outputs = [PynngCameraOutput(f"tcp://127.0.0.1:{base_port + offset}") for offset in (1, 2)]
+    hub = HubClient([("127.0.0.1", base_port)])
+    tasks = [asyncio.create_task(hub.run())]
+
+    try:
+        async with asyncio.timeout(5.0):
+            while any(output.subscriber_count == 0 for output in outputs):
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.1)  # subscriptions established
+            for output in outputs:
+                output.write(b"garbage")
+
+            tasks.append(asyncio.create_task(Virtual(7, *outputs).run()))
+            while hub.ready_devices != {7}:
+                await asyncio.sleep(0.01)
+        assert not tasks[0].done()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.sleep(0)
+        hub.close()
+        for output in outputs:
+            output.close()
+
+
+@pytest.mark.asyncio
+async def test_run_returns_when_closed():
+    hub = HubClient([("127.0.0.1", 5925)])
+    hub_task = asyncio.create_task(hub.run())
+    await asyncio.sleep(0.05)
+
+    hub.close()
+
+    await asyncio.wait_for(hub_task, timeout=1.0)
+
+
+@pytest.mark.asyncio
+async def test_many_chunks_to_a_slow_hub(monkeypatch):
+    monkeypatch.setenv("CAMERA_VIRTUAL_HIRES_RES_WIDTH", "640")
+    monkeypatch.setenv("CAMERA_VIRTUAL_HIRES_RES_HEIGHT", "480")
+    monkeypatch.setenv("CAMERA_HIRES_CODEC", "raw")
+    monkeypatch.setenv("CAMERA_HIRES_CHUNK_SIZE", "1024")
+    base_port = 5910
+
+    # the node runs in its own event loop, so it sends as fast as it can while the hub falls behind
+    camera, node, sockets = pynng_node(5, base_port, result_server=True)
+    sent = []
+    camera.add_hires_listener(sent.append)
+    node_loop = asyncio.new_event_loop()
+    node_thread = threading.Thread(target=node_loop.run_forever, daemon=True)
+    node_thread.start()
+    node_future = asyncio.run_coroutine_threadsafe(node.run(), node_loop)
+
+    hub = HubClient([("127.0.0.1", base_port)], job_timeout_s=10.0, fetch_missing=False)
+    feed = hub.chunk_assembler.feed
+
+    def slow_feed(msg):
+        time.sleep(0.0002)
+        return feed(msg)
+
+    hub.chunk_assembler.feed = slow_feed
+    hub_task = asyncio.create_task(hub.run())
+
+    try:
+        while not hub.ready_devices:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.2)  # subscription of the node's trigger input is established
+
+        result = await hub.trigger()
+
+        assert len(sent[0].payload) > 400 * 1024  # sent in more than 400 chunks
+        assert result.status is JobStatus.COMPLETE
+        assert bytes(result.results[(5, 0)].payload) == bytes(sent[0].payload)
+        assert hub.chunk_assembler.pending == 0
+    finally:
+        hub_task.cancel()
+        hub.close()
+        node_future.cancel()
+        node_loop.call_soon_threadsafe(node_loop.stop)
+        node_thread.join(timeout=2.0)
+        for sock in sockets:
+            sock.close()
+
+
+@pytest.mark.asyncio
+async def test_lost_chunks_are_fetched(monkeypatch):
+    monkeypatch.setenv("CAMERA_VIRTUAL_HIRES_RES_WIDTH", "320")
+    monkeypatch.setenv("CAMERA_VIRTUAL_HIRES_RES_HEIGHT", "240")
+    monkeypatch.setenv("CAMERA_HIRES_CHUNK_SIZE", "200")
+    base_port = 5915
+
+    camera, node, sockets = pynng_node(6, base_port, result_server=True)
+    sent = []
+    camera.add_hires_listener(sent.append)
+    hub = HubClient([("127.0.0.1", base_port)], job_timeout_s=10.0)
+    feed = hub.chunk_assembler.feed
+    dropped = []
+
+    def lossy_feed(msg):
+        # lose a chunk in the middle and the last chunk, once
+        if msg.is_chunk and msg.chunk_offset not in dropped and msg.chunk_offset in (400, (msg.total_len - 1) // 200 * 200):
+            dropped.append(msg.chunk_offset)
+            return None
+        return feed(msg)
+
+    hub.chunk_assembler.feed = lossy_feed
+    tasks = [asyncio.create_task(node.run()), asyncio.create_task(hub.run())]
+
+    try:
+        while not hub.ready_devices:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.2)  # subscription of the node's trigger input is established
+
+        result = await hub.trigger()
+
+        assert len(dropped) == 2
+        assert result.status is JobStatus.COMPLETE
+        assert result.duration_s < 2.0  # repaired, not fetched at the job timeout
+        assert bytes(result.results[(6, 0)].payload) == bytes(sent[0].payload)
+        assert hub.chunk_assembler.pending == 0
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.sleep(0)
+        hub.close()
+        for sock in sockets:
+            sock.close()
@@ -0,0 +1,46 @@
+import numpy as np
+
+from wigglecam.dto import ImageMessage
+from wigglecam.hub.compositor import GridCompositor
+from wigglecam.hub.decode import DecodedFrame
+
+
+def _frame(device_id: int, value: int) -> DecodedFrame:
+    return DecodedFrame(np.full((60, 80, 3), value, np.uint8), ImageMessage(device_id, b""))
+
+
+def test_redraws_only_changed_tiles():
+    compositor = GridCompositor(tile_size=(40, 30))
+    frames = {1: _frame(1, 10), 2: _frame(2, 20), 3: _frame(3, 30)}
+
+    canvas = compositor.compose(frames)
+    assert canvas.shape == (60, 80, 3)  # 2x2 grid
+    assert compositor.tiles_updated == 3
+
+    frames[2] = _frame(2, 99)
+    assert compositor.compose(frames) is canvas
+    assert compositor.tiles_updated == 4
+    assert canvas[0, 40, 0] == 99
+    assert canvas[30, 0, 0] == 30
+    assert canvas[30, 40, 0] == 0  # empty cell
+
+
+def test_new_device_changes_layout():
+    compositor = GridCompositor(tile_size=(40, 30), columns=4)
+
+    compositor.compose({1: _frame(1, 10)})
+    canvas = compositor.compose({1: _frame(1, 10), 5: _frame(5, 50)})
+
+    assert canvas.shape == (30, 80, 3)
+    assert canvas[0, 40, 0] == 50
+
+
+def test_custom_positions():
+    compositor = GridCompositor(tile_size=(40, 30), positions={1: (1, 2), 2: (0, 0)})
+
+    canvas = compositor.compose({1: _frame(1, 10), 2: _frame(2, 20), 3: _frame(3, 30)})
+
+    assert canvas.shape == (60, 120, 3)
+    assert canvas[30, 80, 0] == 10
+    assert canvas[0, 0, 0] == 20
+    assert canvas[0, 40, 0] == 30  # first free cell
@@ -0,0 +1,43 @@
+import asyncio
+import threading
+
+import pytest
+
+from wigglecam.dto import ImageMessage
+from wigglecam.hub.decode import LoresDecoder, decode_jpeg_cv2
+
+
+@pytest.mark.asyncio
+async def test_latest_frame_wins():
+    release = threading.Event()
+
+    def decode(data):
+        release.wait(timeout=2)
+        return bytes(data)
+
+    decoder = LoresDecoder(decode=decode, workers=2)
+    for index in range(5):
+        decoder.submit(ImageMessage(1, f"frame{index}".encode(), sequence=index))
+    decoder.submit(ImageMessage(2, b"other"))
+
+    release.set()
+    while decoder.stats.decoded < 3:
+        await asyncio.sleep(0.01)
+
+    # frame0 was decoding, frame1 to frame3 were replaced while waiting
+    assert decoder.latest(1).image == b"frame4"
+    assert list(decoder.frames()) == [1, 2]
+    assert (decoder.stats.received, decoder.stats.decoded, decoder.stats.dropped) == (6, 3, 3)
+    decoder.close()
+
+
+@pytest.mark.asyncio
+async def test_decode_failure_is_counted():
+    decoder = LoresDecoder(decode=decode_jpeg_cv2, workers=1)
+
+    decoder.submit(ImageMessage(1, b"no jpeg"))
+    while decoder.stats.failed < 1:
+        await asyncio.sleep(0.01)
+
+    assert decoder.latest(1) is None
+    decoder.close()
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from wigglecam.discovery import Announcer
+from wigglecam.dto import FLAG_BYE, FLAG_READY, AnnounceMessage
+from wigglecam.hub.discovery import DiscoveryListener, NodeRegistry
+
+
+def test_registry_join_heartbeat_and_expire():
+    joined, left = [], []
+    registry = NodeRegistry(missed_heartbeats=3, on_join=joined.append, on_leave=left.append)
+
+    registry.update(AnnounceMessage(1, 5550, interval_ms=500), "10.0.0.1", now=0.0)
+    registry.update(AnnounceMessage(1, 5550, interval_ms=500, flags=FLAG_READY), "10.0.0.1", now=1.0)
+    registry.update(AnnounceMessage(2, 5560, interval_ms=500), "10.0.0.2", now=1.0)
+
+    assert [node.device_id for node in joined] == [1, 2]
+    assert registry.nodes[1].ready
+    assert registry.nodes[2].address(3) == "tcp://10.0.0.2:5563"
+    assert registry.expire(now=2.4) == []
+
+    assert [node.device_id for node in registry.expire(now=2.6)] == [1, 2]
+    assert registry.alive_device_ids == set()
+    assert len(left) == 2
+
+
+def test_registry_bye_and_move():
+    joined, left = [], []
+    registry = NodeRegistry(on_join=joined.append, on_leave=left.append)
+
+    registry.update(AnnounceMessage(1, 5550), "10.0.0.1")
+    registry.update(AnnounceMessage(1, 5570), "10.0.0.1")  # restarted with another base port
+    assert [(node.base_port) for node in joined] == [5550, 5570]
+    assert [(node.base_port) for node in left] == [5550]
+
+    registry.update(AnnounceMessage(1, 5550, flags=FLAG_BYE), "10.0.0.1")  # bye of the old address is ignored
+    assert registry.alive_device_ids == {1}
+    registry.update(AnnounceMessage(1, 5570, flags=FLAG_BYE), "10.0.0.1")
+    assert registry.alive_device_ids == set()
+
+
+@pytest.mark.asyncio
+async def test_announcer_to_listener_over_multicast():
+    registry = NodeRegistry()
+    listener = DiscoveryListener(registry, port=5993)
+    announcers = [Announcer(device_id, 6000 + 10 * device_id, interval_s=0.05, port=5993) for device_id in (1, 2)]
+    listener_task = asyncio.create_task(listener.serve())
+    announcer_tasks = [asyncio.create_task(announcer.run()) for announcer in announcers]
+
+    try:
+        async with asyncio.timeout(2.0):
+            while registry.alive_device_ids != {1, 2}:
+                await asyncio.sleep(0.01)
+        assert registry.nodes[2].base_port == 6020
+
+        announcer_tasks[0].cancel()  # sends bye
+        async with asyncio.timeout(2.0):
+            while registry.alive_device_ids != {2}:
+                await asyncio.sleep(0.01)
+    finally:
+        for task in [listener_task, *announcer_tasks]:
+            task.cancel()
+        await asyncio.sleep(0)
+        listener.close()
+        for announcer in announcers:
+            announcer.close()
@@ -0,0 +1,75 @@
+import asyncio
+import uuid
+
+import pytest
+
+from wigglecam.app import CameraApp
+from wigglecam.backends.cameras.output.pynng import PynngCameraOutput
+from wigglecam.backends.cameras.virtual import Virtual
+from wigglecam.backends.results.cache import ResultCache
+from wigglecam.backends.results.pynng import PynngResultServer
+from wigglecam.backends.triggers.input.pynng import PynngTriggerInput
+from wigglecam.dto import ImageMessage
+from wigglecam.hub.fetch import ResultFetcher
+
+
+@pytest.mark.asyncio
+async def test_fetch_missed_results():
+    job_id = uuid.uuid4()
+    caches = [ResultCache(max_bytes=1_000_000), ResultCache(max_bytes=1_000_000)]
+    caches[0].put(ImageMessage(1, b"cam1", job_id=job_id))
+    caches[1].put(ImageMessage(2, b"cam2", job_id=job_id))
+
+    servers = [PynngResultServer("tcp://127.0.0.1:5950"), PynngResultServer("tcp://127.0.0.1:5951")]
+    tasks = [asyncio.create_task(server.serve(cache)) for server, cache in zip(servers, caches, strict=True)]
+    fetcher = ResultFetcher(["tcp://127.0.0.1:5950", "tcp://127.0.0.1:5951"], timeout_ms=1000)
+
+    try:
+        msg = await fetcher.fetch(job_id, device_id=2)
+        assert msg is not None
+        assert bytes(msg.payload) == b"cam2"
+
+        msgs = await fetcher.fetch_missing(job_id, [(1, 0), (2, 0), (1, 1)])
+        assert sorted(bytes(msg.payload) for msg in msgs) == [b"cam1", b"cam2"]
+
+        assert await fetcher.fetch(uuid.uuid4()) is None
+
+        chunk = await fetcher.fetch(job_id, device_id=1, chunk_offset=1, length=2)
+        assert chunk.is_chunk
+        assert (chunk.chunk_offset, chunk.total_len, bytes(chunk.payload)) == (1, 4, b"am")
+    finally:
+        for task in tasks:
+            task.cancel()
+        fetcher.close()
+        for server in servers:
+            server.close()
+
+
+@pytest.mark.asyncio
+async def test_node_serves_its_results(monkeypatch):
+    monkeypatch.setenv("CAMERA_VIRTUAL_HIRES_RES_WIDTH", "320")
+    monkeypatch.setenv("CAMERA_VIRTUAL_HIRES_RES_HEIGHT", "240")
+    base_port = 5920
+
+    sockets = [PynngCameraOutput(f"tcp://127.0.0.1:{base_port + offset}") for offset in (1, 2)]
+    sockets += [PynngTriggerInput(f"tcp://127.0.0.1:{base_port}"), PynngResultServer(f"tcp://127.0.0.1:{base_port + 3}")]
+    camera = Virtual(2, sockets[0], sockets[1])
+    node = CameraApp(camera, sockets[2], sockets[3])
+    fetcher = ResultFetcher([f"tcp://127.0.0.1:{base_port + 3}"], timeout_ms=1000)
+    task = asyncio.create_task(node.run())
+
+    try:
+        await camera.wait_ready()
+        job_id = uuid.uuid4()
+        await camera.trigger_hires_capture(job_id)
+
+        msg = await fetcher.fetch(job_id)
+
+        assert msg is not None
+        assert msg.device_id == 2
+    finally:
+        task.cancel()
+        await asyncio.sleep(0)
+        fetcher.close()
+        for sock in sockets:
+            sock.close()
@@ -0,0 +1,29 @@
+from wigglecam.hub.latency import LatencyTracker
+
+
+def test_deadline_needs_samples_of_every_device():
+    tracker = LatencyTracker(min_samples=2, margin_s=0.1)
+    tracker.observe(1, 0.2)
+    tracker.observe(1, 0.3)
+    tracker.observe(2, 0.1)
+
+    assert tracker.deadline_s({1, 2}) is None
+    assert tracker.deadline_s({1}) == 0.3 + 0.1
+
+
+def test_burst_deadline_adds_gaps():
+    tracker = LatencyTracker(min_samples=1, margin_s=0.0)
+    tracker.observe(1, 0.2)
+    assert tracker.deadline_s({1}, frames=3) is None
+
+    tracker.observe(1, 0.05, first=False)
+    assert tracker.deadline_s({1}, frames=3) == 0.2 + 2 * 0.05
+
+
+def test_slow_devices():
+    tracker = LatencyTracker(min_samples=1)
+    for device_id, latency_s in ((1, 0.05), (2, 0.06), (3, 0.05), (4, 0.3)):
+        tracker.observe(device_id, latency_s)
+
+    assert tracker.slow_devices() == {4}
+    assert tracker.stats()[4].p50_ms == 300
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from wigglecam.backends.encoders.raw import RawImage, pack_raw
+from wigglecam.dto import Codec, ImageMessage, PixelFormat
+from wigglecam.hub.raw import decode_bgr, decode_raw, i420_planes
+
+
+def raw_message(image: RawImage, codec: Codec) -> ImageMessage:
+    msg = ImageMessage(1, pack_raw(image, codec), codec=codec, pixel_format=image.pixel_format, width=image.width, height=image.height)
+    return ImageMessage.from_bytes(msg.to_bytes())  # over the wire
+
+
+def test_raw_payload_is_not_copied():
+    array = np.arange(4 * 6 * 3, dtype=np.uint8).reshape(4, 6, 3)
+
+    payload = pack_raw(RawImage(array, PixelFormat.RGB888, 6, 4), Codec.RAW)
+    assert np.shares_memory(np.frombuffer(payload, np.uint8), array)
+
+    data = bytearray(ImageMessage(1, payload, codec=Codec.RAW, pixel_format=PixelFormat.RGB888, width=6, height=4).to_bytes())
+    decoded = decode_raw(ImageMessage.from_bytes(data))
+    assert np.array_equal(decoded, array)
+    assert np.shares_memory(decoded, np.frombuffer(data, np.uint8))
+
+
+@pytest.mark.parametrize("codec", [Codec.RAW, Codec.ZLIB, Codec.LZ4])
+def test_i420_roundtrip(codec):
+    if codec is Codec.LZ4:
+        pytest.importorskip("lz4")
+    width, height = 8, 4
+    y = np.full((height, width), 128, np.uint8)
+    u = np.full((height // 2, width // 2), 100, np.uint8)
+    v = np.full((height // 2, width // 2), 150, np.uint8)
+    array = np.concatenate((y.reshape(-1), u.reshape(-1), v.reshape(-1))).reshape(height * 3 // 2, width)
+
+    msg = raw_message(RawImage(array, PixelFormat.I420, width, height), codec)
+    planes = i420_planes(decode_raw(msg), width, height)
+
+    assert [plane.shape for plane in planes] == [(4, 8), (2, 4), (2, 4)]
+    assert [int(plane[0, 0]) for plane in planes] == [128, 100, 150]
+    assert decode_bgr(msg).shape == (height, width, 3)
+
+
+def test_decode_bgr_swaps_rgb():
+    array = np.zeros((2, 2, 3), np.uint8)
+    array[..., 0] = 255  # red
+
+    bgr = decode_bgr(raw_message(RawImage(array, PixelFormat.RGB888, 2, 2), Codec.ZLIB))
+
+    assert bgr[0, 0].tolist() == [0, 0, 255]
+
+
+def test_decode_raw_size_mismatch_raises():
+    msg = ImageMessage(1, b"\x00" * 10, codec=Codec.RAW, pixel_format=PixelFormat.RGB888, width=4, height=4)
+
+    with pytest.raises(ValueError):
+        decode_raw(msg)
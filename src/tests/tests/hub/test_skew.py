@@ -0,0 +1,72 @@
+import uuid
+
+from wigglecam.dto import ImageMessage, SyncState
+from wigglecam.hub.skew import SkewAnalyzer, percentile
+
+MS = 1_000_000
+
+
+def lores(device_id: int, timestamp_ns: int, sync_state: SyncState = SyncState.READY) -> ImageMessage:
+    return ImageMessage(device_id, payload=b"", timestamp_ns=timestamp_ns, sync_state=sync_state)
+
+
+def test_percentile():
+    values = [float(v) for v in range(1, 101)]
+
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([], 50) == 0
+
+
+def test_lores_skew_against_reference():
+    analyzer = SkewAnalyzer()
+
+    for frame in range(1, 11):
+        analyzer.add(lores(0, frame * 100 * MS))
+        analyzer.add(lores(1, frame * 100 * MS + 2 * MS))
+
+    stats = analyzer.lores_skew(1)
+
+    # last frame of device 1 is not evaluated until the reference sent a newer one
+    assert stats.samples == 9
+    assert stats.p50_ms == 2.0
+    assert stats.p99_ms == 2.0
+    assert analyzer.reference_device_id == 0
+
+
+def test_lores_skew_tolerates_reordering():
+    analyzer = SkewAnalyzer()
+
+    # device 1 frame arrives before the matching reference frame
+    analyzer.add(lores(0, 100 * MS))
+    analyzer.add(lores(1, 200 * MS + 1 * MS))
+    analyzer.add(lores(0, 200 * MS))
+    assert analyzer.lores_skew().samples == 0
+
+    analyzer.add(lores(0, 300 * MS))
+
+    assert analyzer.lores_skew().max_ms == 1.0
+
+
+def test_hires_job_skew():
+    analyzer = SkewAnalyzer()
+    job_id = uuid.uuid4()
+
+    analyzer.add(ImageMessage(0, payload=b"", job_id=job_id, timestamp_ns=10 * MS))
+    assert analyzer.job_skew_ms(job_id) is None
+
+    analyzer.add(ImageMessage(1, payload=b"", job_id=job_id, timestamp_ns=13 * MS))
+    analyzer.add(ImageMessage(2, payload=b"", job_id=job_id, timestamp_ns=11 * MS))
+
+    assert analyzer.job_skew_ms(job_id) == 3.0
+    assert analyzer.hires_skew().samples == 1
+
+
+def test_unsynced_devices_and_missing_timestamps():
+    analyzer = SkewAnalyzer()
+
+    analyzer.add(lores(0, 0, SyncState.READY))
+    analyzer.add(lores(3, 0, SyncState.WAITING))  # no timestamp known
+
+    assert analyzer.unsynced_devices() == [3]
+    assert analyzer.lores_skew().samples == 0
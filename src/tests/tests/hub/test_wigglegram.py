@@ -0,0 +1,63 @@
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from wigglecam.hub.wigglegram import RigCalibration, WigglegramPipeline, calibrate
+
+
+def _scene(shift_x: int, shift_y: int) -> np.ndarray:
+    rng = np.random.default_rng(42)
+    texture = cv2.GaussianBlur(rng.integers(0, 255, (400, 560, 3), dtype=np.uint8), (5, 5), 0)
+    return texture[40 + shift_y : 280 + shift_y, 40 + shift_x : 360 + shift_x].copy()
+
+
+def _jpeg(image: np.ndarray) -> bytes:
+    return cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 95])[1].tobytes()
+
+
+def test_calibrate_recovers_offsets():
+    images = {0: _scene(0, 0), 1: _scene(12, 0), 2: _scene(24, -6)}
+
+    calibration = calibrate(images)
+
+    assert calibration.reference_device_id == 0
+    assert calibration.image_size == (320, 240)
+    assert np.allclose(np.asarray(calibration.transforms[1])[:, 2], (12, 0), atol=1)
+    assert np.allclose(np.asarray(calibration.transforms[2])[:, 2], (24, -6), atol=1)
+    x, y, width, height = calibration.crop
+    assert np.allclose((x, y, width, height), (24, 0, 296, 234), atol=2)
+
+
+def test_calibrate_without_features_raises():
+    with pytest.raises(ValueError):
+        calibrate({0: _scene(0, 0), 1: np.zeros((240, 320, 3), np.uint8)})
+
+
+@pytest.mark.parametrize("format", ["gif", "webp", "mp4"])
+def test_assemble_caches_calibration(tmp_path, format):
+    calibration_path = tmp_path / "calibration.json"
+    jpegs = {0: _jpeg(_scene(0, 0)), 1: _jpeg(_scene(10, 0)), 2: _jpeg(_scene(20, 0))}
+    pipeline = WigglegramPipeline(calibration_path, workers=2)
+
+    pipeline.assemble(jpegs, tmp_path / f"wiggle.{format}", format=format)
+
+    assert calibration_path.exists()
+    assert RigCalibration.load(calibration_path) == pipeline.calibration
+    assert (tmp_path / f"wiggle.{format}").stat().st_size > 0
+    if format != "mp4":
+        with Image.open(tmp_path / f"wiggle.{format}") as img:
+            assert img.n_frames == 4  # forth and back
+    pipeline.close()
+
+
+def test_aligned_frames_match_reference(tmp_path):
+    pipeline = WigglegramPipeline(tmp_path / "calibration.json", max_width=None)
+    jpegs = {0: _jpeg(_scene(0, 0)), 1: _jpeg(_scene(16, 8))}
+
+    frames = pipeline.align(jpegs)
+
+    assert frames[0].shape == frames[1].shape
+    difference = np.abs(frames[0].astype(int) - frames[1].astype(int)).mean()
+    assert difference < 8
+    pipeline.close()
@@ -0,0 +1,199 @@
+import asyncio
+import time
+import uuid
+
+import pytest
+
+from wigglecam.app import JobScheduler
+from wigglecam.backends.cameras.frames import RawFrame
+from wigglecam.dto import TriggerMessage
+
+
+class FakeCamera:
+    """Records the order of capture and delivery stages."""
+
+    def __init__(self, deliver_delay: float = 0.0):
+        self.deliver_delay = deliver_delay
+        self.events = []
+        self.captures = []  # (wall clock, reference time)
+
+    async def capture_hires(self, reference_time_ns=None):
+        self.events.append("capture")
+        self.captures.append((time.time_ns(), reference_time_ns))
+        return RawFrame(array=None, timestamp_ns=reference_time_ns or 0)
+
+    async def deliver_hires(self, job_id, frame, frame_index=0, frame_count=1):
+        self.events.append("deliver_start")
+        await asyncio.sleep(self.deliver_delay)
+        self.events.append(("delivered", job_id))
+
+    async def trigger_hires_burst(self, job_id, frames, interval_s, reference_time_ns=None):
+        self.events.append(("burst", job_id, frames))
+
+
+async def run_until(scheduler: JobScheduler, condition, timeout: float = 2.0):
+    task = asyncio.create_task(scheduler.run())
+    start = time.monotonic()
+    while not condition() and time.monotonic() - start < timeout:
+        await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+
+@pytest.mark.asyncio
+async def test_scheduler_dedupes_job_ids():
+    camera = FakeCamera()
+    scheduler = JobScheduler(camera)
+    trigger = TriggerMessage(uuid.uuid4())
+
+    assert scheduler.submit(trigger)
+    assert not scheduler.submit(trigger)
+    await run_until(scheduler, lambda: scheduler.stats.completed == 1)
+
+    assert scheduler.stats.duplicates == 1
+    assert camera.events.count("capture") == 1
+
+
+@pytest.mark.asyncio
+async def test_scheduler_overflow_drop_oldest():
+    scheduler = JobScheduler(FakeCamera(), queue_size=2, overflow="drop_oldest")
+    triggers = [TriggerMessage(uuid.uuid4()) for _ in range(3)]
+
+    results = [scheduler.submit(trigger) for trigger in triggers]
+
+    assert results == [True, True, True]
+    assert scheduler.stats.dropped == 1
+    assert scheduler.queued == 2
+
+    # the hub retries the dropped job once the queue has room
+    await run_until(scheduler, lambda: scheduler.stats.completed == 2)
+    assert scheduler.submit(triggers[0])
+    assert scheduler.stats.duplicates == 0
+
+
+@pytest.mark.asyncio
+async def test_scheduler_overflow_drop_newest():
+    scheduler = JobScheduler(FakeCamera(), queue_size=2, overflow="drop_newest")
+    triggers = [TriggerMessage(uuid.uuid4()) for _ in range(3)]
+
+    results = [scheduler.submit(trigger) for trigger in triggers]
+
+    assert results == [True, True, False]
+    assert scheduler.stats.dropped == 1
+
+    await run_until(scheduler, lambda: scheduler.stats.completed == 2)
+    assert scheduler.submit(triggers[2])
+    assert scheduler.stats.duplicates == 0
+    await run_until(scheduler, lambda: scheduler.stats.completed == 3)
+    assert scheduler.stats.completed == 3
+
+
+@pytest.mark.asyncio
+async def test_scheduler_stop_cancels_deliveries():
+    camera = FakeCamera(deliver_delay=10)
+    scheduler = JobScheduler(camera)
+
+    scheduler.submit(TriggerMessage(uuid.uuid4()))
+    await run_until(scheduler, lambda: "deliver_start" in camera.events)
+    await asyncio.sleep(0)
+
+    assert not scheduler.stats.in_flight
+    assert scheduler.stats.completed == 0
+
+
+@pytest.mark.asyncio
+async def test_scheduler_cancels_stale_jobs():
+    camera = FakeCamera()
+    scheduler = JobScheduler(camera, deadline_s=0.5)
+
+    scheduler.submit(TriggerMessage(uuid.uuid4()), received_ns=time.time_ns() - 1_000_000_000)
+    scheduler.submit(TriggerMessage(uuid.uuid4()))
+    await run_until(scheduler, lambda: scheduler.stats.completed == 1)
+
+    assert scheduler.stats.expired == 1
+    assert camera.events.count("capture") == 1
+
+
+@pytest.mark.asyncio
+async def test_scheduler_expires_jobs_waiting_for_a_slot():
+    camera = FakeCamera(deliver_delay=0.5)
+    scheduler = JobScheduler(camera, deadline_s=0.2, pipeline_depth=1)
+
+    scheduler.submit(TriggerMessage(uuid.uuid4()))
+    scheduler.submit(TriggerMessage(uuid.uuid4()))  # waits for the slot longer than the deadline
+    await run_until(scheduler, lambda: scheduler.stats.completed == 1 and scheduler.stats.expired == 1)
+
+    assert scheduler.stats.expired == 1
+    assert camera.events.count("capture") == 1
+
+
+@pytest.mark.asyncio
+async def test_scheduler_pipelines_capture_and_delivery():
+    camera = FakeCamera(deliver_delay=0.1)
+    scheduler = JobScheduler(camera, pipeline_depth=2)
+
+    scheduler.submit(TriggerMessage(uuid.uuid4()))
+    scheduler.submit(TriggerMessage(uuid.uuid4()))
+    await run_until(scheduler, lambda: scheduler.stats.completed == 2)
+
+    # second capture starts while the first job is still being delivered
+    second_capture = camera.events.index("capture", 1)
+    first_delivered = next(i for i, event in enumerate(camera.events) if isinstance(event, tuple))
+    assert second_capture < first_delivered
+
+
+@pytest.mark.asyncio
+async def test_scheduler_runs_bursts():
+    camera = FakeCamera()
+    scheduler = JobScheduler(camera)
+    trigger = TriggerMessage(uuid.uuid4(), frames=5, interval_us=1000)
+
+    scheduler.submit(trigger)
+    await run_until(scheduler, lambda: scheduler.stats.completed == 1)
+
+    assert camera.events == [("burst", trigger.job_id, 5)]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_captures_at_scheduled_time():
+    camera = FakeCamera()
+    scheduler = JobScheduler(camera)
+    capture_at_ns = time.time_ns() + 100_000_000
+
+    scheduler.submit(TriggerMessage(uuid.uuid4()), capture_at_ns=capture_at_ns)
+    await run_until(scheduler, lambda: scheduler.stats.completed == 1)
+
+    captured_ns, reference_time_ns = camera.captures[0]
+    assert reference_time_ns == capture_at_ns
+    assert 0 <= captured_ns - capture_at_ns < 20_000_000
+
+
+@pytest.mark.asyncio
+async def test_scheduler_captures_late_schedule_immediately():
+    camera = FakeCamera()
+    scheduler = JobScheduler(camera)
+    capture_at_ns = time.time_ns() - 50_000_000
+
+    scheduler.submit(TriggerMessage(uuid.uuid4()), capture_at_ns=capture_at_ns)
+    await run_until(scheduler, lambda: scheduler.stats.completed == 1)
+
+    # the reference stays at the scheduled time, so zero shutter lag picks the frame of that moment
+    assert camera.captures[0][1] == capture_at_ns
+
+
+@pytest.mark.asyncio
+async def test_scheduler_does_not_hold_up_jobs_for_scheduled_ones():
+    camera = FakeCamera()
+    scheduler = JobScheduler(camera, pipeline_depth=1)
+    capture_at_ns = time.time_ns() + 300_000_000
+
+    scheduler.submit(TriggerMessage(uuid.uuid4()), capture_at_ns=capture_at_ns)
+    immediate = TriggerMessage(uuid.uuid4())
+    scheduler.submit(immediate)
+    await run_until(scheduler, lambda: scheduler.stats.completed == 2)
+
+    # the immediate job neither waited for the scheduled time nor for the pipeline slot
+    assert camera.captures[0][1] != capture_at_ns
+    assert camera.captures[0][0] < capture_at_ns
+    assert camera.captures[1][1] == capture_at_ns
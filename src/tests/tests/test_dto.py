@@ -0,0 +1,273 @@
+import struct
+import uuid
+
+import pytest
+
+from wigglecam.dto import (
+    FLAG_BYE,
+    FLAG_CHUNK,
+    FLAG_THUMBNAIL,
+    MAGIC,
+    VERSION,
+    AnnounceMessage,
+    ChunkAck,
+    Codec,
+    FetchRequest,
+    ImageMessage,
+    PixelFormat,
+    StreamControlMessage,
+    StreamLevel,
+    SyncState,
+    TimeSyncMessage,
+    TriggerMessage,
+)
+
+
+def test_roundtrip():
+    job_id = uuid.uuid4()
+    msg = ImageMessage(3, payload=b"\xff\xd8payload\xff\xd9", job_id=job_id)
+
+    decoded = ImageMessage.from_bytes(msg.to_bytes())
+
+    assert decoded.device_id == 3
+    assert decoded.job_id == job_id
+    assert bytes(decoded.payload) == b"\xff\xd8payload\xff\xd9"
+
+
+def test_header_is_versioned():
+    header = ImageMessage(1, payload=b"abc").header_bytes()
+
+    magic, version, _, header_len = struct.unpack_from("<4sBBH", header)
+
+    assert magic == MAGIC
+    assert version == VERSION
+    assert header_len == len(header)
+
+
+def test_decode_is_zero_copy():
+    data = bytearray(ImageMessage(1, payload=b"abc").to_bytes())
+
+    decoded = ImageMessage.from_bytes(data)
+
+    assert isinstance(decoded.payload, memoryview)
+    data[-1:] = b"x"
+    assert bytes(decoded.payload) == b"abx"
+
+
+def test_segments_do_not_copy_payload():
+    payload = b"\x00" * 1000
+    header, segment = ImageMessage(1, payload=payload).to_segments()
+
+    assert segment is payload
+    assert ImageMessage.from_bytes(header + segment).payload == payload
+
+
+def test_jpg_bytes_alias():
+    assert ImageMessage(1, payload=b"abc").jpg_bytes == b"abc"
+
+
+def test_pack_into_reuses_buffer():
+    buffer = bytearray()
+    view = ImageMessage(1, payload=b"a" * 100).pack_into(buffer)
+    size_first = len(buffer)
+
+    view = ImageMessage(2, payload=b"b" * 10).pack_into(buffer)
+
+    assert len(buffer) == size_first
+    decoded = ImageMessage.from_bytes(view)
+    assert decoded.device_id == 2
+    assert bytes(decoded.payload) == b"b" * 10
+
+
+def test_decode_v0_message():
+    job_id = uuid.uuid4()
+    data = struct.pack("iI16s", 7, 3, job_id.bytes) + b"abc"
+
+    decoded = ImageMessage.from_bytes(data)
+
+    assert decoded.device_id == 7
+    assert decoded.job_id == job_id
+    assert bytes(decoded.payload) == b"abc"
+
+
+def test_decode_truncated_raises():
+    data = ImageMessage(1, payload=b"abcdef").to_bytes()
+
+    with pytest.raises(ValueError):
+        ImageMessage.from_bytes(data[:-2])
+    for header in (data[:12], b"garbage"):
+        with pytest.raises(ValueError):
+            ImageMessage.from_bytes(header)
+
+
+def test_decode_v1_message_defaults_new_fields():
+    data = struct.pack("<4sBBHiI16s", MAGIC, 1, 0, 32, 7, 3, b"\x00" * 16) + b"abc"
+
+    decoded = ImageMessage.from_bytes(data)
+
+    assert decoded.device_id == 7
+    assert decoded.timestamp_ns == 0
+    assert decoded.sync_state == SyncState.OFF
+    assert bytes(decoded.payload) == b"abc"
+
+
+def test_roundtrip_frame_fields():
+    msg = ImageMessage(1, payload=b"abc", timestamp_ns=1_700_000_000_123_456_789, sequence=42, sync_state=SyncState.READY)
+
+    decoded = ImageMessage.from_bytes(msg.to_bytes())
+
+    assert decoded.timestamp_ns == 1_700_000_000_123_456_789
+    assert decoded.sequence == 42
+    assert decoded.sync_state is SyncState.READY
+
+
+def test_roundtrip_burst_fields():
+    decoded = ImageMessage.from_bytes(ImageMessage(1, payload=b"abc", frame_index=3, frame_count=10).to_bytes())
+
+    assert decoded.frame_index == 3
+    assert decoded.frame_count == 10
+
+
+def test_trigger_roundtrip():
+    trigger = TriggerMessage(uuid.uuid4(), frames=10, interval_us=100_000)
+
+    assert TriggerMessage.from_bytes(trigger.to_bytes()) == trigger
+
+
+def test_trigger_roundtrip_capture_at():
+    trigger = TriggerMessage(uuid.uuid4(), capture_at_ns=1_700_000_000_123_456_789)
+
+    assert TriggerMessage.from_bytes(trigger.to_bytes()).capture_at_ns == 1_700_000_000_123_456_789
+
+
+def test_trigger_decode_v1():
+    job_id = uuid.uuid4()
+    v1 = struct.pack("<4sBBH", b"WGCT", 1, 0, 18) + struct.pack("<16sHI", job_id.bytes, 3, 500)
+
+    trigger = TriggerMessage.from_bytes(v1)
+
+    assert trigger == TriggerMessage(job_id, frames=3, interval_us=500)
+    assert trigger.capture_at_ns == 0
+
+
+def test_timesync_roundtrip():
+    msg = TimeSyncMessage(origin_ns=1, receive_ns=2, transmit_ns=3)
+
+    assert TimeSyncMessage.from_bytes(msg.to_bytes()) == msg
+    with pytest.raises(ValueError):
+        TimeSyncMessage.from_bytes(TriggerMessage(uuid.uuid4()).to_bytes())
+
+
+def test_trigger_decode_v0_uuid():
+    job_id = uuid.uuid4()
+
+    trigger = TriggerMessage.from_bytes(job_id.bytes)
+
+    assert trigger.job_id == job_id
+    assert trigger.frames == 1
+
+
+def test_trigger_decode_invalid_raises():
+    with pytest.raises(ValueError):
+        TriggerMessage.from_bytes(b"garbage")
+
+
+@pytest.mark.parametrize(
+    "msg",
+    [
+        TriggerMessage(uuid.uuid4()),
+        FetchRequest(uuid.uuid4()),
+        StreamControlMessage(),
+        ChunkAck(uuid.uuid4(), 1),
+        TimeSyncMessage(1),
+        AnnounceMessage(1, 5550),
+    ],
+)
+def test_messages_decode_truncated_raises(msg):
+    data = msg.to_bytes()
+    assert type(msg).from_bytes(data) == msg
+
+    with pytest.raises(ValueError):
+        type(msg).from_bytes(data[:-1])
+
+
+def test_roundtrip_chunk_fields():
+    msg = ImageMessage(1, payload=b"abc", flags=FLAG_CHUNK, chunk_offset=4096, total_len=10_000)
+
+    decoded = ImageMessage.from_bytes(msg.to_bytes())
+
+    assert decoded.is_chunk
+    assert decoded.chunk_offset == 4096
+    assert decoded.total_len == 10_000
+
+
+def test_fetch_request_roundtrip():
+    request = FetchRequest(uuid.uuid4(), device_id=3, frame_index=7)
+
+    assert FetchRequest.from_bytes(request.to_bytes()) == request
+
+
+def test_fetch_request_range():
+    request = FetchRequest(uuid.uuid4(), device_id=3, chunk_offset=4096, length=1024)
+
+    assert FetchRequest.from_bytes(request.to_bytes()) == request
+
+
+def test_decode_v1_fetch_request_fetches_whole_result():
+    job_id = uuid.uuid4()
+    body = struct.pack("<16siH", job_id.bytes, 3, 1)
+    v1 = struct.pack("<4sBBH", b"WGCF", 1, 0, 8 + len(body)) + body
+
+    assert FetchRequest.from_bytes(v1) == FetchRequest(job_id, device_id=3, frame_index=1)
+
+
+def test_chunk_ack_roundtrip():
+    ack = ChunkAck(uuid.uuid4(), device_id=3, frame_index=2, received_len=65536)
+
+    assert ChunkAck.from_bytes(ack.to_bytes()) == ack
+    with pytest.raises(ValueError):
+        ChunkAck.from_bytes(StreamControlMessage().to_bytes())
+
+
+def test_announce_roundtrip():
+    msg = AnnounceMessage(device_id=3, base_port=5560, capabilities=0x05, interval_ms=500, flags=FLAG_BYE)
+
+    decoded = AnnounceMessage.from_bytes(msg.to_bytes())
+
+    assert decoded == msg
+    assert decoded.is_bye and not decoded.is_ready
+    with pytest.raises(ValueError):
+        AnnounceMessage.from_bytes(msg.to_bytes()[:10])
+
+
+def test_roundtrip_codec_fields():
+    msg = ImageMessage(1, payload=b"\x00" * 24, codec=Codec.ZLIB, pixel_format=PixelFormat.I420, width=4, height=4)
+
+    decoded = ImageMessage.from_bytes(msg.to_bytes())
+
+    assert (decoded.codec, decoded.pixel_format, decoded.width, decoded.height) == (Codec.ZLIB, PixelFormat.I420, 4, 4)
+
+
+def test_decode_v4_defaults_to_jpeg():
+    payload = b"\xff\xd8\xff\xd9"
+    body = struct.pack("<iI16sqIBHHII", 2, len(payload), b"\x00" * 16, 0, 0, 0, 0, 1, 0, 0)
+    v4 = struct.pack("<4sBBH", MAGIC, 4, 0, 8 + len(body)) + body + payload
+
+    decoded = ImageMessage.from_bytes(v4)
+
+    assert decoded.codec is Codec.JPEG
+    assert decoded.pixel_format is PixelFormat.UNKNOWN
+    assert bytes(decoded.payload) == payload
+
+
+def test_stream_control_roundtrip():
+    msg = StreamControlMessage(device_id=3, level=StreamLevel.THUMBNAIL)
+
+    assert StreamControlMessage.from_bytes(msg.to_bytes()) == msg
+    with pytest.raises(ValueError):
+        StreamControlMessage.from_bytes(TriggerMessage(uuid.uuid4()).to_bytes())
+
+
+def test_image_level_from_flags():
+    assert ImageMessage(1, b"").level is StreamLevel.LORES
+    assert ImageMessage.from_bytes(ImageMessage(1, b"", flags=FLAG_THUMBNAIL).to_bytes()).level is StreamLevel.THUMBNAIL
@@ -2,7 +2,17 @@
 Testing main
 """
 
+import asyncio
+import contextlib
 import logging
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from wigglecam.hub.client import HubClient
 
 logger = logging.getLogger(name=None)
 
@@ -11,3 +21,82 @@ def test_main_instance():
     import wigglecam.__main__
 
     wigglecam.__main__.main([], run_app=False)
+
+
+def test_hires_slot_size_fits_raw_frames(monkeypatch):
+    from wigglecam.__main__ import hires_slot_size
+
+    monkeypatch.setenv("CAMERA_PICAMERA2_CAMERA_RES_WIDTH", "4608")
+    monkeypatch.setenv("CAMERA_PICAMERA2_CAMERA_RES_HEIGHT", "2592")
+    monkeypatch.setenv("CAMERA_PICAMERA2_OPTIMIZE_MEMORYCONSUMPTION", "false")
+    assert hires_slot_size("Picam") == 16 * 1024 * 1024
+
+    monkeypatch.setenv("CAMERA_HIRES_CODEC", "raw")
+    assert hires_slot_size("Picam") > 4608 * 2592 * 3
+    monkeypatch.setenv("CAMERA_PICAMERA2_OPTIMIZE_MEMORYCONSUMPTION", "true")
+    assert 4608 * 2592 * 3 // 2 < hires_slot_size("Picam") < 4608 * 2592 * 3
+
+
+def test_main_import_is_lazy():
+    # in a fresh interpreter, the modules of this process are imported already
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import wigglecam.__main__\n"
+        "print(time.perf_counter() - start)\n"
+        "print(','.join(m for m in ('pynng', 'pydantic_settings', 'PIL', 'numpy', 'cv2', 'picamera2') if m in sys.modules))\n"
+    )
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout.splitlines()
+
+    logger.info(f"import took {float(output[0]) * 1000:.0f}ms")
+    assert float(output[0]) < 1.0
+    assert output[1:] in ([], [""])
+
+
+def test_main_binds_sockets_before_heavy_imports():
+    # record the loaded modules when main() creates the outputs and the camera backend
+    code = (
+        "import sys\n"
+        "import wigglecam.__main__ as main_module\n"
+        "loaded = lambda: ','.join(m for m in ('pydantic_settings', 'numpy', 'PIL') if m in sys.modules)\n"
+        "create_output, create_camera = main_module.output_factory, main_module.camera_factory\n"
+        "def output_factory(*args, **kwargs):\n"
+        "    print('output', loaded())\n"
+        "    return create_output(*args, **kwargs)\n"
+        "def camera_factory(*args):\n"
+        "    print('camera', loaded())\n"
+        "    return create_camera(*args)\n"
+        "main_module.output_factory, main_module.camera_factory = output_factory, camera_factory\n"
+        "main_module.main(['--base-port', '5930', '--bind-ip', '127.0.0.1'], run_app=False)\n"
+    )
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout.split("\n")
+
+    assert [line.strip() for line in output if line] == ["output", "output", "camera pydantic_settings"]
+
+
+@pytest.mark.asyncio
+async def test_main_time_to_first_frame():
+    base_port = 5935
+    ready = asyncio.Event()
+    hub = HubClient([("127.0.0.1", base_port)], on_ready=lambda device_id: ready.set())
+    hub_task = asyncio.create_task(hub.run())
+
+    start = time.perf_counter()
+    node = await asyncio.create_subprocess_exec(
+        sys.executable,
+        *("-m", "wigglecam", "--base-port", str(base_port), "--bind-ip", "127.0.0.1"),
+        env={**os.environ, "APP_DISCOVERY_ENABLED": "false"},
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        async with asyncio.timeout(20.0):
+            await ready.wait()
+        logger.info(f"first frame at the hub {(time.perf_counter() - start) * 1000:.0f}ms after the node process started")
+    finally:
+        node.terminate()
+        await node.wait()
+        hub_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await hub_task
+        hub.close()
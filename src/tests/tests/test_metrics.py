@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from wigglecam.metrics import MetricsHttpServer, Registry
+
+
+def test_render_prometheus_text():
+    registry = Registry()
+    registry.counter("frames_total", "Frames.", {"outcome": "sent"}).inc(3)
+    registry.counter("frames_total", "Frames.", {"outcome": "skipped"}).inc()
+    registry.gauge("subscribers", "Subscribers.", function=lambda: 2)
+    registry.gauge("unknown", "Not reported.", function=lambda: None)
+    histogram = registry.histogram("latency_seconds", "Latency.", buckets=(0.01, 0.1))
+    for value in (0.005, 0.05, 0.05, 1.0):
+        histogram.observe(value)
+
+    text = registry.render()
+
+    assert text.count("# TYPE frames_total counter") == 1
+    assert 'frames_total{outcome="sent"} 3.0' in text
+    assert 'frames_total{outcome="skipped"} 1.0' in text
+    assert "subscribers 2" in text
+    assert "\nunknown " not in text
+    assert 'latency_seconds_bucket{le="0.01"} 1' in text
+    assert 'latency_seconds_bucket{le="0.1"} 3' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 4' in text
+    assert "latency_seconds_count 4" in text
+
+
+def test_get_existing_metric():
+    registry = Registry()
+
+    assert registry.counter("a_total", "A.") is registry.counter("a_total", "A.")
+    with pytest.raises(ValueError):
+        registry.gauge("a_total", "A.")
+
+
+def test_histogram_time():
+    histogram = Registry().histogram("stage_seconds", "Stage.")
+
+    with histogram.time():
+        pass
+
+    assert histogram.count == 1
+    assert histogram.sum < 0.01
+
+
+@pytest.mark.asyncio
+async def test_http_endpoint():
+    registry = Registry()
+    registry.counter("scraped_total", "Scrapes.").inc()
+    task = asyncio.create_task(MetricsHttpServer("127.0.0.1", 5980).serve(registry))
+    await asyncio.sleep(0.1)
+
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", 5980)
+        writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        response = await reader.read()
+        writer.close()
+    finally:
+        task.cancel()
+
+    assert response.startswith(b"HTTP/1.1 200 OK")
+    assert b"scraped_total 1.0" in response
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from wigglecam.hub.timesync import TimeServer
+from wigglecam.timesync import ClockOffsetEstimator, ClockSample, ClockSyncClient, sample_from_exchange
+
+
+def test_sample_from_exchange():
+    # hub clock is 1000ns ahead, 100ns delay each direction, hub needs 50ns to reply
+    sample = sample_from_exchange(origin_ns=0, receive_ns=1100, transmit_ns=1150, destination_ns=250)
+
+    assert sample == ClockSample(offset_ns=1000, rtt_ns=200)
+
+
+def test_estimator_uses_lowest_rtt():
+    estimator = ClockOffsetEstimator(window=4, min_samples=3)
+    estimator.add(ClockSample(offset_ns=5000, rtt_ns=9000))
+    estimator.add(ClockSample(offset_ns=1000, rtt_ns=200))
+    assert not estimator.synced
+
+    estimator.add(ClockSample(offset_ns=-3000, rtt_ns=7000))
+    estimator.add(ClockSample(offset_ns=0, rtt_ns=-10))  # clock stepped, ignored
+
+    assert estimator.synced
+    assert estimator.offset_ns == 1000
+    assert estimator.to_local(10_000) == 9000
+
+
+def test_estimator_window_drops_old_samples():
+    estimator = ClockOffsetEstimator(window=2, min_samples=1)
+    estimator.add(ClockSample(offset_ns=1000, rtt_ns=100))
+    estimator.add(ClockSample(offset_ns=2000, rtt_ns=300))
+    estimator.add(ClockSample(offset_ns=3000, rtt_ns=500))
+
+    assert estimator.offset_ns == 2000
+
+
+@pytest.mark.asyncio
+async def test_clock_sync_against_time_server():
+    server = TimeServer("tcp://127.0.0.1:5990")
+    server_task = asyncio.create_task(server.serve())
+    client = ClockSyncClient("tcp://127.0.0.1:5990", interval_s=0.01, timeout_ms=1000)
+    client_task = asyncio.create_task(client.run())
+
+    try:
+        async with asyncio.timeout(3.0):
+            while not client.estimator.synced:
+                await asyncio.sleep(0.01)
+
+        # same host, same clock
+        assert abs(client.estimator.offset_ns) < 5_000_000
+        assert 0 <= client.estimator.rtt_ns < 50_000_000
+    finally:
+        client_task.cancel()
+        server_task.cancel()
+        client.close()
+        server.close()
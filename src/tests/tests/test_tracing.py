@@ -0,0 +1,95 @@
+import json
+import threading
+import uuid
+
+import pytest
+
+from wigglecam.backends.cameras.output.base import CameraOutput
+from wigglecam.backends.cameras.virtual import Virtual
+from wigglecam.tracing import TRACER, Tracer
+
+
+class NullOutput(CameraOutput):
+    def __init__(self):
+        pass
+
+    def write(self, buf: bytes) -> int:
+        return len(buf)
+
+    async def awrite(self, buf: bytes) -> int:
+        return len(buf)
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = Tracer(enabled=False)
+
+    with tracer.span("capture", uuid.uuid4()):
+        pass
+    tracer.instant("trigger_received")
+
+    assert len(tracer) == 0
+    assert tracer.span("a") is tracer.span("b")  # shared no-op, nothing allocated
+
+
+def test_ring_buffer_is_bounded():
+    tracer = Tracer(capacity=3, enabled=True)
+
+    for index in range(5):
+        tracer.instant(f"event{index}")
+
+    assert [span.name for span in tracer.spans()] == ["event2", "event3", "event4"]
+
+
+def test_chrome_trace_export(tmp_path):
+    tracer = Tracer(enabled=True)
+    job_id = uuid.uuid4()
+
+    with tracer.span("encode", job_id, frame_index=0):
+        with tracer.span("encode_hires_frame"):
+            pass
+    tracer.record("queue_wait", 1_000_000, 3_000_000, job_id=job_id)
+    tracer.dump(tmp_path / "trace.json")
+
+    events = json.loads((tmp_path / "trace.json").read_text())["traceEvents"]
+    assert [(event["name"], event["ph"]) for event in events] == [
+        ("encode_hires_frame", "X"),
+        ("encode", "b"),
+        ("encode", "e"),
+        ("queue_wait", "b"),
+        ("queue_wait", "e"),
+    ]
+    assert events[1]["id"] == str(job_id)
+    assert events[4]["ts"] - events[3]["ts"] == 2000  # us
+
+
+def test_chrome_trace_export_while_threads_record():
+    tracer = Tracer(capacity=1000, enabled=True)
+    stop = threading.Event()
+
+    def record():
+        while not stop.is_set():
+            with tracer.span("encode"):
+                pass
+
+    thread = threading.Thread(target=record)
+    thread.start()
+    try:
+        for _ in range(100):
+            tracer.to_chrome_trace()
+    finally:
+        stop.set()
+        thread.join()
+
+
+@pytest.mark.asyncio
+async def test_capture_spans_keyed_by_job(monkeypatch):
+    monkeypatch.setattr(TRACER, "enabled", True)
+    TRACER.clear()
+    cam = Virtual(device_id=1, output_lores=NullOutput(), output_hires=NullOutput())
+    job_id = uuid.uuid4()
+
+    await cam.trigger_hires_capture(job_id)
+
+    assert [span.name for span in TRACER.spans(job_id)] == ["encode", "send"]
+    assert {"capture_hires_frame", "encode_hires_frame"} <= {span.name for span in TRACER.spans()}
+    TRACER.clear()
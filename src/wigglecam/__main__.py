@@ -5,12 +5,15 @@ import asyncio
 import importlib
 import logging
 import sys
+import time
+from typing import TYPE_CHECKING
 
-from .app import CameraApp
-from .backends.cameras.base import CameraBackend
-from .backends.cameras.output.base import CameraOutput
-from .backends.cameras.output.pynng import PynngCameraOutput
-from .backends.triggers.input.pynng import PynngTriggerInput
+# backends, pydantic settings and transports are imported in main() and the factories, so the entry point starts
+# fast and only loads what the chosen configuration needs. main() binds the sockets first, hubs can connect while the
+# configuration (pydantic) and the camera backend (numpy, pillow, picamera2) are loaded
+if TYPE_CHECKING:
+    from .backends.cameras.base import CameraBackend
+    from .backends.cameras.output.base import CameraOutput
 
 logger = logging.getLogger(__name__)
 
@@ -18,17 +21,56 @@ logger = logging.getLogger(__name__)
 # --- Registry ------------------------
 
 CAMERA_CLASSES = ["Virtual", "Picam"]
+OUTPUT_TRANSPORTS = ["tcp", "ipc", "shm"]
 
 
 # --- Backend Factory ---------------------------------------------------
 
 
-def camera_factory(class_name: str, device_id: int, output_lores: CameraOutput, output_hires: CameraOutput) -> CameraBackend:
+def camera_factory(class_name: str, device_id: int, output_lores: "CameraOutput", output_hires: "CameraOutput") -> "CameraBackend":
     module_path = f".backends.cameras.{class_name.lower()}"
     module = importlib.import_module(module_path, __package__)
     return getattr(module, class_name)(device_id, output_lores, output_hires)
 
 
+def output_factory(transport: str, bind_ip: str, port: int, slot_size: int) -> "CameraOutput":
+    if transport in ("tcp", "ipc"):
+        from .backends.cameras.output.pynng import PynngCameraOutput
+
+        address = f"tcp://{bind_ip}:{port}" if transport == "tcp" else f"ipc:///tmp/wigglecam-{port}.sock"
+        return PynngCameraOutput(address)
+    if transport == "shm":
+        from .backends.cameras.output.shm import ShmCameraOutput
+
+        return ShmCameraOutput(f"wigglecam-{port}", slot_size=slot_size)
+    raise ValueError(f"Unknown output transport: {transport}")
+
+
+def hires_slot_size(camera_class: str) -> int:
+    """Shared memory slot size for hires messages. JPEGs fit 16MB, raw frames are sized by the configured resolution."""
+    from .config.camera_common import CfgCameraCommon
+
+    slot_size = 16 * 1024 * 1024
+    if CfgCameraCommon().hires_codec == "jpeg":
+        return slot_size
+
+    if camera_class == "Picam":
+        from .config.camera_picamera2 import CfgCameraPicamera2
+
+        picam_config = CfgCameraPicamera2()
+        width, height = picam_config.camera_res_width, picam_config.camera_res_height
+        bytes_per_pixel = 1.5 if picam_config.optimize_memoryconsumption else 3  # I420 or BGR888
+    else:
+        from .config.camera_virtual import CfgCameraVirtual
+
+        virtual_config = CfgCameraVirtual()
+        width, height = virtual_config.hires_res_width, virtual_config.hires_res_height
+        bytes_per_pixel = 3
+
+    # zlib and lz4 grow incompressible frames slightly, plus the message header
+    return max(slot_size, int(width * height * bytes_per_pixel * 1.01) + 64 * 1024)
+
+
 def resolve_class_name(cli_value: str, registry: list[str]) -> str:
     """Map CLI lowercase value back to the canonical class name."""
     for cls in registry:
@@ -67,6 +109,13 @@ def parse_args(args):
         default=5550,
         help="Starting from base-port the app will listen. Use to start multiple instances on one host.",
     )
+    parser.add_argument(
+        "--output",
+        choices=OUTPUT_TRANSPORTS,
+        default=OUTPUT_TRANSPORTS[0],
+        help="Transport for the lores and hires output. ipc and shm (shared memory) are for hubs on the same host, "
+        "named after the port that tcp would use, e.g. ipc:///tmp/wigglecam-5551.sock or shared memory wigglecam-5551.",
+    )
 
     return parser.parse_args(args)
 
@@ -80,22 +129,77 @@ def main(args=None, run_app: bool = True):
 
     args = parse_args(args)  # parse here, not above because pytest system exit 2
 
+    timings: dict[str, float] = {}
+    phase_start = time.perf_counter()
+
+    def phase_done(name: str):
+        nonlocal phase_start
+        now = time.perf_counter()
+        timings[name] = (now - phase_start) * 1000
+        phase_start = now
+
+    from .backends.results.pynng import PynngResultServer
+    from .backends.triggers.input.pynng import PynngTriggerInput
+    from .metrics import MetricsHttpServer
+
+    phase_done("imports")
+
     port_input_trigger = args.base_port
     port_output_lores = args.base_port + 1
     port_output_hires = args.base_port + 2
+    port_result_fetch = args.base_port + 3
+    port_metrics = args.base_port + 4
 
     input_trigger = PynngTriggerInput(f"tcp://{args.bind_ip}:{port_input_trigger}")
-    output_lores = PynngCameraOutput(f"tcp://{args.bind_ip}:{port_output_lores}")
-    output_hires = PynngCameraOutput(f"tcp://{args.bind_ip}:{port_output_hires}")
+    output_lores = output_factory(args.output, args.bind_ip, port_output_lores, slot_size=2 * 1024 * 1024)
+    # shm slots are sized for the configured hires frames, that costs the config load before binding
+    hires_slot = hires_slot_size(resolve_class_name(args.camera, CAMERA_CLASSES)) if args.output == "shm" else 0
+    output_hires = output_factory(args.output, args.bind_ip, port_output_hires, slot_size=hires_slot)
+    # results are fetched over tcp regardless of --output, a hub uses it only to recover missed results
+    result_server = PynngResultServer(f"tcp://{args.bind_ip}:{port_result_fetch}")
+    metrics_server = MetricsHttpServer(args.bind_ip, port_metrics)
+    phase_done("sockets")
+
+    from .app import CameraApp
+    from .config.app import CfgApp
+    from .discovery import Announcer
+    from .dto import CAP_CLOCK_SYNC, CAP_METRICS, CAP_RESULT_FETCH, CAP_TCP_OUTPUT
+    from .timesync import ClockSyncClient
+
+    config = CfgApp()
+    clock_sync = None
+    if config.time_sync_address:
+        clock_sync = ClockSyncClient(config.time_sync_address, interval_s=config.time_sync_interval_ms / 1000)
+    announcer = None
+    if config.discovery_enabled:
+        capabilities = (
+            (CAP_TCP_OUTPUT if args.output == "tcp" else 0)
+            | (CAP_RESULT_FETCH if config.result_cache_max_bytes else 0)
+            | (CAP_METRICS if config.metrics_enabled else 0)
+            | (CAP_CLOCK_SYNC if clock_sync else 0)
+        )
+        announcer = Announcer(
+            args.device_id,
+            args.base_port,
+            capabilities,
+            interval_s=config.discovery_interval_ms / 1000,
+            group=config.discovery_group,
+            port=config.discovery_port,
+        )
+    phase_done("config")
 
     camera_class = resolve_class_name(args.camera, CAMERA_CLASSES)
     camera = camera_factory(camera_class, args.device_id, output_lores, output_hires)
+    phase_done("camera backend")
 
-    camera_app = CameraApp(camera, input_trigger)
+    camera_app = CameraApp(camera, input_trigger, result_server, metrics_server, clock_sync, announcer)
+    phase_done("app")
 
     logger.info(f"Device Id: {args.device_id}")
     logger.info(f"Camera Backend: {camera_class}")
-    logger.info(f"Service bound to {args.bind_ip} and ports [{port_input_trigger},{port_output_lores},{port_output_hires}]")
+    ports = [port_input_trigger, port_output_lores, port_output_hires, port_result_fetch, port_metrics]
+    logger.info(f"Service bound to {args.bind_ip} and ports {ports}, output via {args.output}")
+    logger.info(f"startup took {sum(timings.values()):.0f}ms: " + ", ".join(f"{name} {ms:.0f}ms" for name, ms in timings.items()))
 
     try:
         if run_app:
@@ -1,19 +1,259 @@
 import asyncio
 import logging
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Literal
 
 from .backends.cameras.base import CameraBackend
+from .backends.results.base import ResultServer
+from .backends.results.cache import ResultCache
 from .backends.triggers.input.base import TriggerInput
 from .config.app import CfgApp
+from .discovery import Announcer
+from .dto import CONTROL_ANY_DEVICE, StreamControlMessage, TriggerMessage
+from .metrics import REGISTRY, MetricsHttpServer
+from .timesync import ClockSyncClient, sleep_until
+from .tracing import TRACER
 
 logger = logging.getLogger(__name__)
 
+JOB_SECONDS = REGISTRY.histogram("wigglecam_job_seconds", "Time from trigger received to all results of the job sent.")
+JOBS = {
+    outcome: REGISTRY.counter("wigglecam_jobs_total", "Triggered jobs by outcome.", {"outcome": outcome})
+    for outcome in ("completed", "failed", "expired", "dropped", "duplicate")
+}
+SCHEDULE_ERROR_SECONDS = REGISTRY.histogram(
+    "wigglecam_schedule_error_seconds",
+    "Time between the scheduled capture time of a job and the capture start, late only.",
+    buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+
+
+@dataclass
+class Job:
+    trigger: TriggerMessage
+    received_ns: int  # wall clock, used as reference time for the capture and for the deadline
+    capture_at_ns: int = 0  # scheduled capture time converted to the node wall clock, 0 captures on arrival
+
+
+@dataclass
+class JobStats:
+    submitted: int = 0
+    duplicates: int = 0
+    dropped: int = 0
+    expired: int = 0
+    completed: int = 0
+    failed: int = 0
+    in_flight: set[uuid.UUID] = field(default_factory=set)
+
+
+class JobScheduler:
+    """Queues triggered jobs and runs them on the camera.
+
+    Jobs are deduplicated by job id, queued in a bounded queue and cancelled if they wait longer than the deadline.
+    Capture and delivery (encode and send) of single frame jobs are pipelined: the next capture starts as soon as the
+    camera is free while up to pipeline_depth jobs are in flight. Scheduled jobs wait for their capture time in a task
+    of their own, so they hold up neither later jobs nor a pipeline slot.
+    """
+
+    def __init__(
+        self,
+        camera: CameraBackend,
+        queue_size: int = 8,
+        overflow: Literal["drop_oldest", "drop_newest"] = "drop_oldest",
+        dedupe_size: int = 128,
+        deadline_s: float = 3.0,
+        pipeline_depth: int = 2,
+    ):
+        self.__camera = camera
+        self.__overflow = overflow
+        self.__dedupe_size = dedupe_size
+        self.__deadline_s = deadline_s
+
+        self.__queue: asyncio.Queue[Job] = asyncio.Queue(maxsize=queue_size)
+        self.__seen_job_ids: OrderedDict[uuid.UUID, None] = OrderedDict()
+        self.__pipeline_slots = asyncio.Semaphore(pipeline_depth)
+        self.__delivery_tasks: set[asyncio.Task] = set()
+        self.__scheduled_tasks: set[asyncio.Task] = set()
+        self.__camera_lock = asyncio.Lock()  # scheduled jobs capture concurrently to the queue
+
+        self.stats = JobStats()
+
+    @property
+    def queued(self) -> int:
+        return self.__queue.qsize()
+
+    def submit(self, trigger: TriggerMessage, received_ns: int | None = None, capture_at_ns: int = 0) -> bool:
+        """Queue a job, returns False if it was a duplicate or dropped because the queue is full.
+        capture_at_ns is the scheduled capture time in the node wall clock."""
+        if trigger.job_id in self.__seen_job_ids:
+            self.stats.duplicates += 1
+            JOBS["duplicate"].inc()
+            logger.warning(f"ignored duplicate trigger, job_id={trigger.job_id}")
+            return False
+
+        job = Job(trigger, received_ns or time.time_ns(), capture_at_ns)
+
+        if self.__queue.full():
+            self.stats.dropped += 1
+            JOBS["dropped"].inc()
+            if self.__overflow == "drop_newest":
+                logger.warning(f"job queue full, dropped job_id={trigger.job_id}")
+                return False
+
+            dropped_job = self.__queue.get_nowait()
+            # the hub may retry a dropped job, it is no duplicate then
+            self.__seen_job_ids.pop(dropped_job.trigger.job_id, None)
+            logger.warning(f"job queue full, dropped oldest job_id={dropped_job.trigger.job_id}")
+
+        self.__queue.put_nowait(job)
+        self.stats.submitted += 1
+
+        if self.__dedupe_size:
+            self.__seen_job_ids[trigger.job_id] = None
+            while len(self.__seen_job_ids) > self.__dedupe_size:
+                self.__seen_job_ids.popitem(last=False)
+        return True
+
+    async def run(self):
+        try:
+            while True:
+                job = await self.__queue.get()
+                if self._expired(job):
+                    continue
+
+                TRACER.record("queue_wait", job.received_ns, job_id=job.trigger.job_id)
+
+                if job.capture_at_ns:
+                    task = asyncio.create_task(self._start_scheduled(job))
+                    self.__scheduled_tasks.add(task)
+                    task.add_done_callback(self.__scheduled_tasks.discard)
+                else:
+                    await self._start(job, job.received_ns)
+        finally:
+            for task in self.__scheduled_tasks | self.__delivery_tasks:
+                task.cancel()
+
+    async def _start_scheduled(self, job: Job):
+        with TRACER.span("scheduled_wait", job.trigger.job_id):
+            await self._wait_capture_time(job)
+        await self._start(job, job.capture_at_ns)
+
+    async def _start(self, job: Job, reference_time_ns: int):
+        """Capture the job once a pipeline slot is free, the delivery continues in the background."""
+        await self.__pipeline_slots.acquire()
+        if self._expired(job):
+            # waited for a free slot past the deadline
+            self.__pipeline_slots.release()
+            return
+        self.stats.in_flight.add(job.trigger.job_id)
+
+        try:
+            if job.trigger.frames > 1:
+                # bursts pipeline capture and encode internally, so they run exclusive
+                async with self.__camera_lock:
+                    delivery = self.__camera.trigger_hires_burst(
+                        job.trigger.job_id, job.trigger.frames, job.trigger.interval_us / 1e6, reference_time_ns
+                    )
+                    await self._deliver(job, delivery)
+            else:
+                async with self.__camera_lock:
+                    with TRACER.span("capture", job.trigger.job_id):
+                        frame = await self.__camera.capture_hires(reference_time_ns)
+                task = asyncio.create_task(self._deliver(job, self.__camera.deliver_hires(job.trigger.job_id, frame)))
+                self.__delivery_tasks.add(task)
+                task.add_done_callback(self.__delivery_tasks.discard)
+        except Exception as exc:
+            self.stats.failed += 1
+            JOBS["failed"].inc()
+            self.stats.in_flight.discard(job.trigger.job_id)
+            self.__pipeline_slots.release()
+            logger.error(f"capture failed, job_id={job.trigger.job_id}: {exc}")
+
+    def _expired(self, job: Job) -> bool:
+        """Count and log the job as expired if it waited longer than the deadline, scheduled jobs from their capture time."""
+        age_s = (time.time_ns() - max(job.received_ns, job.capture_at_ns)) / 1e9
+        if not self.__deadline_s or age_s <= self.__deadline_s:
+            return False
+
+        self.stats.expired += 1
+        JOBS["expired"].inc()
+        logger.warning(f"job waited {age_s:.2f}s, past deadline, cancelled job_id={job.trigger.job_id}")
+        return True
+
+    async def _wait_capture_time(self, job: Job):
+        late_ns = time.time_ns() - job.capture_at_ns
+        if late_ns > 0:
+            # with zero shutter lag the frame closest to the scheduled time is still used
+            SCHEDULE_ERROR_SECONDS.observe(late_ns / 1e9)
+            logger.warning(f"scheduled capture time passed {late_ns / 1e6:.1f}ms ago, job_id={job.trigger.job_id}")
+            return
+
+        await sleep_until(job.capture_at_ns)
+        SCHEDULE_ERROR_SECONDS.observe((time.time_ns() - job.capture_at_ns) / 1e9)
+
+    async def _deliver(self, job: Job, delivery):
+        try:
+            await delivery
+        except Exception as exc:
+            self.stats.failed += 1
+            JOBS["failed"].inc()
+            logger.error(f"job failed, job_id={job.trigger.job_id}: {exc}")
+        else:
+            self.stats.completed += 1
+            JOBS["completed"].inc()
+            JOB_SECONDS.observe((time.time_ns() - job.received_ns) / 1e9)
+            logger.info(f"job completed in {(time.time_ns() - job.received_ns) / 1e6:.1f}ms, job_id={job.trigger.job_id}")
+        finally:
+            TRACER.record("job", job.received_ns, job_id=job.trigger.job_id, frames=job.trigger.frames)
+            self.stats.in_flight.discard(job.trigger.job_id)
+            self.__pipeline_slots.release()
+
 
 class CameraApp:
-    def __init__(self, camera: CameraBackend, trigger_input: TriggerInput):
+    def __init__(
+        self,
+        camera: CameraBackend,
+        trigger_input: TriggerInput,
+        result_server: ResultServer | None = None,
+        metrics_server: MetricsHttpServer | None = None,
+        clock_sync: ClockSyncClient | None = None,
+        announcer: Announcer | None = None,
+    ):
         self.__config = CfgApp()
 
         self.__camera = camera
         self.__trigger_input = trigger_input
+        self.__result_server = result_server
+        self.__metrics_server = metrics_server
+        self.__clock_sync = clock_sync
+        self.__announcer = announcer
+        self.__result_cache = None
+
+        if self.__config.result_cache_max_bytes:
+            self.__result_cache = ResultCache(
+                self.__config.result_cache_max_bytes,
+                spill_dir=self.__config.result_cache_spill_dir,
+                spill_max_bytes=self.__config.result_cache_spill_max_bytes,
+            )
+            camera.add_hires_listener(self.__result_cache.put)
+        trigger_input.add_control_listener(self._on_stream_control)
+        trigger_input.add_chunk_ack_listener(camera.on_chunk_ack)
+        self.__scheduler = JobScheduler(
+            camera,
+            queue_size=self.__config.job_queue_size,
+            overflow=self.__config.job_queue_overflow,
+            dedupe_size=self.__config.job_dedupe_size,
+            deadline_s=self.__config.job_deadline_ms / 1000,
+            pipeline_depth=self.__config.job_pipeline_depth,
+        )
+
+        # registered here, once per node, the gauges keep the scheduler referenced
+        scheduler = self.__scheduler
+        REGISTRY.gauge("wigglecam_jobs_queued", "Jobs waiting for capture.", function=lambda: scheduler.queued)
+        REGISTRY.gauge("wigglecam_jobs_in_flight", "Jobs captured but not yet delivered.", function=lambda: len(scheduler.stats.in_flight))
 
     async def setup(self):
         asyncio.create_task(self.__camera.run())
@@ -22,15 +262,42 @@ class CameraApp:
     async def job_task(self):
         while True:
             try:
-                job_uuid = await asyncio.wait_for(self.__trigger_input.receive_job_id(), timeout=0.5)
-                logger.info(f"trigger received, job_id={job_uuid}")
+                trigger = await asyncio.wait_for(self.__trigger_input.receive_trigger(), timeout=0.5)
+                reference_time_ns = time.time_ns()
+                logger.info(f"trigger received, job_id={trigger.job_id}, frames={trigger.frames}")
             except TimeoutError:
                 # use wait_for with timeout since otherwise receive_job_id would block for infinite time and app shutdown doesnt work well in pytest
                 continue
 
-            await self.__camera.trigger_hires_capture(job_uuid)
-            logger.info("job completed")
+            capture_at_ns = 0
+            if trigger.capture_at_ns:
+                capture_at_ns = self._to_local_time(trigger.capture_at_ns)
+
+            self.__scheduler.submit(trigger, reference_time_ns, capture_at_ns)
+
+    def _on_stream_control(self, msg: StreamControlMessage):
+        if msg.device_id in (CONTROL_ANY_DEVICE, self.__camera.device_id):
+            self.__camera.select_lores_level(msg.level)
+
+    def _to_local_time(self, hub_time_ns: int) -> int:
+        if self.__clock_sync is None:
+            # assume the clocks are synchronized otherwise, e.g. by NTP or PTP
+            return hub_time_ns
+        if not self.__clock_sync.estimator.synced:
+            logger.warning("clock not yet synced to the hub, scheduled capture time is used unconverted")
+        return self.__clock_sync.estimator.to_local(hub_time_ns)
 
     async def run(self):
         await self.setup()
-        await asyncio.gather(self.job_task())
+
+        tasks = [self.job_task(), self.__scheduler.run()]
+        if self.__result_server and self.__result_cache is not None:  # an empty cache is falsy
+            tasks.append(self.__result_server.serve(self.__result_cache))
+        if self.__metrics_server and self.__config.metrics_enabled:
+            tasks.append(self.__metrics_server.serve(REGISTRY, TRACER))
+        if self.__clock_sync:
+            tasks.append(self.__clock_sync.run())
+        if self.__announcer:
+            tasks.append(self.__announcer.run(lambda: self.__camera.ready))
+
+        await asyncio.gather(*tasks)
@@ -1,17 +1,378 @@
 import abc
+import asyncio
+import dataclasses
+import logging
+import threading
+import time
 import uuid
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
 
+from ...config.camera_common import CfgCameraCommon
+from ...dto import FLAG_CHUNK, FLAG_READY, ChunkAck, Codec, ImageMessage, PixelFormat, StreamLevel
+from ...metrics import REGISTRY
+from ...tracing import TRACER
+from ..encoders.base import JpegEncoder, encoder_factory
+from .frames import FrameRing, RawFrame
 from .output.base import CameraOutput
 
+# numpy and pillow are imported when used, so the node binds its sockets before loading them
+if TYPE_CHECKING:
+    from ..encoders.raw import RawImage
+
+logger = logging.getLogger(__name__)
+
+STAGE_SECONDS = {
+    stage: REGISTRY.histogram("wigglecam_hires_stage_seconds", "Duration of the hires capture stages.", {"stage": stage})
+    for stage in ("capture", "encode", "serialize", "send")
+}
+HIRES_FRAMES = REGISTRY.counter("wigglecam_hires_frames_total", "Hires frames delivered.")
+HIRES_BYTES = REGISTRY.counter("wigglecam_hires_bytes_total", "Hires bytes written to the output.")
+ZSL_FRAMES = REGISTRY.counter("wigglecam_zsl_frames_total", "Hires frames taken from the zero shutter lag ring instead of captured.")
+LORES_FRAMES_SENT = REGISTRY.counter("wigglecam_lores_frames_total", "Lores frames by outcome.", {"outcome": "sent"})
+LORES_FRAMES_SKIPPED = REGISTRY.counter("wigglecam_lores_frames_total", "Lores frames by outcome.", {"outcome": "skipped"})
+LORES_FRAMES_UNCHANGED = REGISTRY.counter("wigglecam_lores_frames_total", "Lores frames by outcome.", {"outcome": "unchanged"})
+LORES_BYTES = REGISTRY.counter("wigglecam_lores_bytes_total", "Lores bytes written to the output.")
+
+
+@dataclasses.dataclass
+class _ChunkWindow:
+    acked: int = 0  # end of the last chunk the hub received
+    changed: asyncio.Event = dataclasses.field(default_factory=asyncio.Event)
+
+
+def _run_traced(name: str, function, *args):
+    # span inside the worker thread, the gap to the enclosing span is the thread hop
+    with TRACER.span(name):
+        return function(*args)
+
 
 class CameraBackend(abc.ABC):
     @abc.abstractmethod
     def __init__(self, device_id: int, output_lores: CameraOutput, output_hires: CameraOutput):
+        self._common_config = CfgCameraCommon()
+
         self._device_id = device_id
         self._output_lores = output_lores
         self._output_hires = output_hires
 
+        # zero shutter lag ring of full resolution frames, backends feed it in their run loop if enabled
+        self._hires_ring = FrameRing(self._common_config.zsl_ring_size) if self._common_config.zsl_ring_size else None
+        self._lores_gate = None
+        if self._common_config.lores_gate_enabled:
+            from .gate import LoresGate
+
+            self._lores_gate = LoresGate(self._common_config.lores_gate_threshold, self._common_config.lores_gate_refresh_ms / 1000)
+
+        self.__lores_keepalive_last = 0.0
+        self.__created = time.perf_counter()
+        self.__ready = asyncio.Event()
+        self.__hires_listeners: list[Callable[[ImageMessage], None]] = []
+        self.__chunk_windows: dict[tuple[uuid.UUID | None, int], _ChunkWindow] = {}  # by job_id, frame_index
+        self.__lores_level = StreamLevel.LORES
+
+        # the encoder is created on first use, its library import is not worth delaying the startup for
+        self.__hires_encoder: JpegEncoder | None = None
+        self.__hires_encoder_lock = threading.Lock()
+        self.__encode_pool = ThreadPoolExecutor(self._common_config.hires_encode_workers, thread_name_prefix="hires_encode")
+
+        for stream, output in (("lores", output_lores), ("hires", output_hires)):
+            help = "Consumers connected to the output, not reported if the output cannot tell."
+            REGISTRY.gauge("wigglecam_output_subscribers", help, {"stream": stream}, function=lambda output=output: output.subscriber_count)
+        REGISTRY.gauge("wigglecam_lores_level", "Selected level of the lores stream, 0 lores, 1 thumbnail.", function=lambda: int(self.__lores_level))
+
     @abc.abstractmethod
     async def run(self): ...
+
+    # blocking, run in a worker thread: grab the next full resolution frame unencoded
     @abc.abstractmethod
-    async def trigger_hires_capture(self, job_id: uuid.UUID): ...
+    def _capture_hires_frame(self) -> RawFrame: ...
+
+    def _encode_hires_frame(self, frame: RawFrame) -> bytes:
+        """Blocking, run in the encode pool. Backends delivering other than RGB arrays convert here."""
+        return self._hires_encoder.encode(frame.array, "RGB")
+
+    def _raw_hires_image(self, frame: RawFrame) -> "RawImage":
+        """Blocking, run in the encode pool. Backends delivering other than RGB arrays convert here."""
+        from ..encoders.raw import RawImage
+
+        height, width = frame.array.shape[:2]
+        return RawImage(frame.array, PixelFormat.RGB888, width, height)
+
+    def _pack_hires_frame(self, frame: RawFrame, codec: Codec) -> tuple["RawImage", bytes | memoryview]:
+        from ..encoders.raw import pack_raw
+
+        image = self._raw_hires_image(frame)
+        return image, pack_raw(image, codec)
+
+    @property
+    def _hires_encoder(self) -> JpegEncoder:
+        with self.__hires_encoder_lock:
+            if self.__hires_encoder is None:
+                config = self._common_config
+                self.__hires_encoder = encoder_factory(config.hires_encoder, config.hires_jpeg_quality, config.hires_jpeg_subsampling)
+            return self.__hires_encoder
+
+    @property
+    def device_id(self) -> int:
+        return self._device_id
+
+    @property
+    def lores_level(self) -> StreamLevel:
+        """Level of the lores stream the backends produce, selected by the hub."""
+        return self.__lores_level
+
+    def select_lores_level(self, level: StreamLevel):
+        if level is not self.__lores_level:
+            logger.info(f"lores stream level {self.__lores_level.name} -> {level.name}")
+        self.__lores_level = level
+
+    def _lores_subscribed(self) -> bool:
+        """True if the lores stream should be produced. Outputs that cannot count subscribers are always streamed to."""
+        return self._common_config.lores_idle_mode == "off" or self._output_lores.subscriber_count != 0
+
+    def _lores_changed(self, jpeg_bytes: bytes | bytearray | memoryview) -> bool:
+        """Blocking. False if the change gate holds the lores frame back, always True if the gate is disabled."""
+        if self._lores_gate is None or self._lores_gate.admit(jpeg_bytes):
+            return True
+
+        LORES_FRAMES_UNCHANGED.inc()
+        return False
+
+    def _lores_keepalive_due(self) -> bool:
+        """While nobody is subscribed, True once per keepalive interval if keepalive is enabled."""
+        if self._common_config.lores_idle_mode != "keepalive":
+            return False
+
+        now = time.monotonic()
+        if now - self.__lores_keepalive_last < self._common_config.lores_keepalive_interval_ms / 1000:
+            return False
+
+        self.__lores_keepalive_last = now
+        return True
+
+    @property
+    def ready(self) -> bool:
+        return self.__ready.is_set()
+
+    async def wait_ready(self):
+        await self.__ready.wait()
+
+    async def _announce_ready(self):
+        """Backends call this for every frame of their run loop, the first call publishes the ready message."""
+        if self.__ready.is_set():
+            return
+
+        self.__ready.set()
+        self.__encode_pool.submit(lambda: self._hires_encoder)  # warm up before the first trigger
+        logger.info(f"ready, first frame {(time.perf_counter() - self.__created) * 1000:.0f}ms after backend init, device_id={self._device_id}")
+
+        if self._lores_subscribed():
+            # hubs subscribing later see the node is ready by its first lores frame
+            msg = ImageMessage(self._device_id, payload=b"", flags=FLAG_READY, timestamp_ns=time.time_ns())
+            await self._output_lores.awrite_segments(*msg.to_segments())
+
+    def add_hires_listener(self, listener: Callable[[ImageMessage], None]):
+        """Call listener with every hires result before it is sent, e.g. to keep it for later retrieval."""
+        self.__hires_listeners.append(listener)
+
+    def on_chunk_ack(self, ack: ChunkAck):
+        """The hub received the chunks of a hires transfer up to ack.received_len, more can be sent."""
+        window = self.__chunk_windows.get((ack.job_id, ack.frame_index)) if ack.device_id == self._device_id else None
+        if window and ack.received_len > window.acked:
+            window.acked = ack.received_len
+            window.changed.set()
+
+    async def trigger_hires_capture(self, job_id: uuid.UUID, reference_time_ns: int | None = None):
+        logger.debug("start producing hires capture")
+
+        frame = await self.capture_hires(reference_time_ns)
+        await self.deliver_hires(job_id, frame)
+
+    async def capture_hires(self, reference_time_ns: int | None = None) -> RawFrame:
+        """First stage of a capture: the camera is free again once this returns."""
+        frame = self._zsl_frame(reference_time_ns)
+        if frame is None:
+            with STAGE_SECONDS["capture"].time():
+                frame = await asyncio.to_thread(_run_traced, "capture_hires_frame", self._capture_hires_frame)
+        else:
+            ZSL_FRAMES.inc()
+        return frame
+
+    async def deliver_hires(self, job_id: uuid.UUID, frame: RawFrame, frame_index: int = 0, frame_count: int = 1):
+        """Second stage of a capture: encode and send the frame."""
+        await self._send_hires(await self._encode_hires(job_id, frame, frame_index, frame_count))
+
+    async def _encode_hires(self, job_id: uuid.UUID, frame: RawFrame, frame_index: int, frame_count: int) -> ImageMessage:
+        """Encode the frame in the encode pool, several frames of a burst are encoded at once."""
+        codec = Codec[self._common_config.hires_codec.upper()]
+        image = None
+
+        with STAGE_SECONDS["encode"].time(), TRACER.span("encode", job_id, frame_index=frame_index):
+            loop = asyncio.get_running_loop()
+            if codec is Codec.JPEG:
+                payload = await loop.run_in_executor(self.__encode_pool, _run_traced, "encode_hires_frame", self._encode_hires_frame, frame)
+            else:
+                image, payload = await loop.run_in_executor(self.__encode_pool, _run_traced, "pack_hires_frame", self._pack_hires_frame, frame, codec)
+
+        msg = ImageMessage(
+            self._device_id,
+            payload=payload,
+            job_id=job_id,
+            timestamp_ns=frame.timestamp_ns,
+            sequence=frame.sequence,
+            sync_state=frame.sync_state,
+            frame_index=frame_index,
+            frame_count=frame_count,
+            codec=codec,
+        )
+        if image is not None:
+            msg.pixel_format, msg.width, msg.height = image.pixel_format, image.width, image.height
+        return msg
+
+    async def _send_hires(self, msg: ImageMessage):
+        """Hand the encoded frame to the listeners and write it to the hires output."""
+        job_id, frame_index, frame_count = msg.job_id, msg.frame_index, msg.frame_count
+        for listener in self.__hires_listeners:
+            listener(msg)
+
+        if self._common_config.hires_chunk_size and len(msg.payload):
+            with TRACER.span("send_chunked", job_id, frame_index=frame_index):
+                bytes_written = await self._send_hires_chunked(msg)
+        else:
+            with STAGE_SECONDS["serialize"].time():
+                segments = msg.to_segments()
+            with STAGE_SECONDS["send"].time(), TRACER.span("send", job_id, frame_index=frame_index):
+                bytes_written = await self._output_hires.awrite_segments(*segments)
+
+        HIRES_FRAMES.inc()
+        HIRES_BYTES.inc(bytes_written)
+
+        logger.info(f"hires capture {frame_index + 1}/{frame_count} {bytes_written} bytes written to output, device_id={self._device_id} {job_id=}")
+
+    async def _send_hires_chunked(self, msg: ImageMessage) -> int:
+        """Send the payload in fixed size chunks, paced to hires_chunk_max_rate and yielding to other traffic in between.
+        At most hires_chunk_window chunks are sent ahead of the hub's acknowledgements, pub outputs drop messages if
+        their queue is full. Observes the serialize and send stages, summed over the chunks."""
+        chunk_size = self._common_config.hires_chunk_size
+        max_rate = self._common_config.hires_chunk_max_rate
+        window_len = self._common_config.hires_chunk_window * chunk_size
+        if self._output_hires.subscriber_count == 0:
+            window_len = 0  # nobody to acknowledge, the result is kept in the cache only
+        ack_timeout_s = self._common_config.hires_chunk_ack_timeout_ms / 1000
+        payload = memoryview(msg.payload)
+        total_len = len(payload)
+
+        key = (msg.job_id, msg.frame_index)
+        window = self.__chunk_windows[key] = _ChunkWindow()
+        start = time.monotonic()
+        bytes_written = 0
+        serialize_s = send_s = 0.0
+        try:
+            for chunk_offset in range(0, total_len, chunk_size):
+                while window_len and chunk_offset - window.acked >= window_len:
+                    window.changed.clear()
+                    try:
+                        await asyncio.wait_for(window.changed.wait(), ack_timeout_s)
+                    except TimeoutError:
+                        # acknowledgements lost or the hub does not send them, go on, hubs fetch the chunks they missed
+                        logger.debug(f"no chunk acknowledgement within {ack_timeout_s}s at {chunk_offset}/{total_len}, job_id={msg.job_id}")
+                        window.acked = chunk_offset
+
+                serialize_start = time.perf_counter()
+                chunk = dataclasses.replace(
+                    msg,
+                    payload=payload[chunk_offset : chunk_offset + chunk_size],
+                    flags=msg.flags | FLAG_CHUNK,
+                    chunk_offset=chunk_offset,
+                    total_len=total_len,
+                )
+                segments = chunk.to_segments()
+                send_start = time.perf_counter()
+                bytes_written += await self._output_hires.awrite_segments(*segments)
+                serialize_s += send_start - serialize_start
+                send_s += time.perf_counter() - send_start
+
+                delay_s = bytes_written / max_rate - (time.monotonic() - start) if max_rate else 0
+                await asyncio.sleep(max(0.0, delay_s))
+        finally:
+            del self.__chunk_windows[key]
+
+        STAGE_SECONDS["serialize"].observe(serialize_s)
+        STAGE_SECONDS["send"].observe(send_s)
+        return bytes_written
+
+    async def trigger_hires_burst(self, job_id: uuid.UUID, frames: int, interval_s: float, reference_time_ns: int | None = None):
+        """Capture frames at interval_s and stream every frame as soon as it is encoded, in capture order.
+        Capture and up to hires_encode_workers encodes run at once, so the burst takes about frames * interval_s
+        as long as the pool keeps up. Otherwise the bounded queues hold the capture back rather than buffering
+        full resolution frames without limit."""
+        logger.debug(f"start producing hires burst of {frames} frames")
+
+        workers = self._common_config.hires_encode_workers
+        queue: asyncio.Queue[RawFrame | None] = asyncio.Queue(maxsize=workers)
+        encoded: asyncio.Queue[asyncio.Task[ImageMessage] | None] = asyncio.Queue(maxsize=workers)
+
+        async def capture():
+            start_ns = reference_time_ns or time.time_ns()
+            last_timestamp_ns = 0
+            for index in range(frames):
+                # the first frame is aligned to the reference time if the zsl ring is enabled, others are fresh frames
+                frame = self._zsl_frame(reference_time_ns) if index == 0 else None
+                if frame is None:
+                    frame = await self._next_hires_frame(last_timestamp_ns)
+                last_timestamp_ns = frame.timestamp_ns
+                await queue.put(frame)
+
+                delay_s = (start_ns - time.time_ns()) / 1e9 + (index + 1) * interval_s
+                if delay_s > 0 and index < frames - 1:
+                    await asyncio.sleep(delay_s)
+            await queue.put(None)
+
+        async def encode():
+            index = 0
+            while (frame := await queue.get()) is not None:
+                await encoded.put(task_group.create_task(self._encode_hires(job_id, frame, index, frames)))
+                index += 1
+            await encoded.put(None)
+
+        async def send():
+            # in frame_index order, whichever encode finishes first
+            while (encode_task := await encoded.get()) is not None:
+                await self._send_hires(await encode_task)
+
+        async with asyncio.TaskGroup() as task_group:
+            task_group.create_task(capture())
+            task_group.create_task(encode())
+            task_group.create_task(send())
+
+    async def _next_hires_frame(self, after_timestamp_ns: int) -> RawFrame:
+        """Next frame newer than after_timestamp_ns. Taken from the zsl ring if the run loop feeds it, grabbed otherwise."""
+        if self._hires_ring is None:
+            return await asyncio.to_thread(self._capture_hires_frame)
+
+        while (frame := self._hires_ring.latest()) is None or frame.timestamp_ns <= after_timestamp_ns:
+            await asyncio.sleep(0.005)
+        return frame
+
+    def _zsl_frame(self, reference_time_ns: int | None) -> RawFrame | None:
+        """Frame from the ring closest to the reference time (wall clock, default now) or None to capture a new one."""
+        if self._hires_ring is None:
+            return None
+
+        if reference_time_ns is None:
+            reference_time_ns = time.time_ns()
+
+        frame = self._hires_ring.closest(reference_time_ns)
+        if frame is None:
+            logger.warning("zsl ring is empty, capturing a new frame")
+            return None
+
+        offset_ms = (frame.timestamp_ns - reference_time_ns) / 1e6
+        if abs(offset_ms) > self._common_config.zsl_max_offset_ms:
+            logger.warning(f"closest zsl frame is {offset_ms:.1f}ms off the trigger time, capturing a new frame")
+            return None
+
+        logger.debug(f"using zsl frame {offset_ms:.1f}ms off the trigger time")
+        return frame
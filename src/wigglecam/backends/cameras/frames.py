@@ -0,0 +1,87 @@
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any
+
+from ...dto import SyncState
+
+
+@dataclass
+class RawFrame:
+    """An unencoded frame as delivered by the camera, array is a numpy array owned by the frame."""
+
+    array: Any
+    timestamp_ns: int  # wall clock
+    sequence: int = 0
+    sync_state: SyncState = SyncState.OFF
+
+
+class FrameRing:
+    """Bounded ring of the most recent raw frames. Written by the camera thread, read on trigger."""
+
+    def __init__(self, capacity: int):
+        self.__frames: deque[RawFrame] = deque(maxlen=capacity)
+        self.__lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.__frames)
+
+    def append(self, frame: RawFrame):
+        with self.__lock:
+            self.__frames.append(frame)
+
+    def latest(self) -> RawFrame | None:
+        with self.__lock:
+            return self.__frames[-1] if self.__frames else None
+
+    def closest(self, timestamp_ns: int) -> RawFrame | None:
+        with self.__lock:
+            if not self.__frames:
+                return None
+            return min(self.__frames, key=lambda frame: abs(frame.timestamp_ns - timestamp_ns))
+
+    def clear(self):
+        with self.__lock:
+            self.__frames.clear()
+
+
+class FrameSequencer:
+    """Sequence numbers of frames by their sensor timestamps, counted up from the previous frame by the frames elapsed,
+    so dropped frames are skipped and a changing frame duration does not re-index earlier frames.
+    Written by the camera thread, read by the encoder threads."""
+
+    def __init__(self, recent: int = 16):
+        self.__recent = recent
+        self.__sequences: OrderedDict[int, int] = OrderedDict()  # sensor timestamp to sequence of the latest frames
+        self.__lock = threading.Lock()
+
+        self.last_timestamp_ns = 0
+        self.sequence = 0
+        self.frame_duration_ns = 0
+
+    def add(self, timestamp_ns: int, frame_duration_ns: int = 0):
+        """Count a frame of the camera. Frames not newer than the last one were counted already."""
+        with self.__lock:
+            if frame_duration_ns:
+                self.frame_duration_ns = frame_duration_ns
+            if timestamp_ns <= self.last_timestamp_ns:
+                return
+
+            if self.last_timestamp_ns:
+                elapsed = round((timestamp_ns - self.last_timestamp_ns) / self.frame_duration_ns) if self.frame_duration_ns else 1
+                self.sequence += max(1, elapsed)
+            self.last_timestamp_ns = timestamp_ns
+
+            self.__sequences[timestamp_ns] = self.sequence
+            while len(self.__sequences) > self.__recent:
+                self.__sequences.popitem(last=False)
+
+    def lookup(self, timestamp_ns: int) -> int:
+        """Sequence of a counted frame, other timestamps are placed relative to the last frame."""
+        with self.__lock:
+            sequence = self.__sequences.get(timestamp_ns)
+            if sequence is not None:
+                return sequence
+            if not self.frame_duration_ns:
+                return self.sequence
+            return max(0, self.sequence + round((timestamp_ns - self.last_timestamp_ns) / self.frame_duration_ns))
@@ -0,0 +1,58 @@
+import io
+import time
+from dataclasses import dataclass
+
+import numpy
+from PIL import Image
+
+
+def jpeg_signature(data: bytes | bytearray | memoryview, scale: int = 8) -> numpy.ndarray:
+    """Grayscale of a JPEG at 1/scale of its size. The decoder scales in the DCT domain, much cheaper than a full decode."""
+    with Image.open(io.BytesIO(data)) as img:
+        img.draft("L", (max(1, img.width // scale), max(1, img.height // scale)))
+        return numpy.asarray(img.convert("L"), dtype=numpy.int16)
+
+
+@dataclass
+class GateStats:
+    sent: int = 0
+    skipped: int = 0  # content did not change enough since the last sent frame
+
+
+class LoresGate:
+    """Passes lores frames only if their content changed, so an idle booth does not stream near identical frames.
+
+    The change is the mean absolute difference of the downscaled grayscale frames in gray levels (0-255), compared
+    to the last passed frame so slow changes add up. At least every refresh_s a frame passes regardless, so the hub's
+    view is never older and it sees the node is alive.
+    """
+
+    def __init__(self, threshold: float = 2.0, refresh_s: float = 1.0, scale: int = 8):
+        self.__threshold = threshold
+        self.__refresh_s = refresh_s
+        self.__scale = scale
+
+        self.__reference: numpy.ndarray | None = None
+        self.__reference_time = 0.0
+
+        self.stats = GateStats()
+
+    def admit(self, jpeg_bytes: bytes | bytearray | memoryview, now: float | None = None) -> bool:
+        """True if the frame should be sent. Blocking, run it off the event loop like the encoding."""
+        now = time.monotonic() if now is None else now
+        signature = jpeg_signature(jpeg_bytes, self.__scale)
+
+        reference = self.__reference
+        if (
+            reference is not None
+            and reference.shape == signature.shape  # otherwise the resolution changed, e.g. another stream level
+            and now - self.__reference_time < self.__refresh_s
+            and numpy.abs(signature - reference).mean() < self.__threshold
+        ):
+            self.stats.skipped += 1
+            return False
+
+        self.__reference = signature
+        self.__reference_time = now
+        self.stats.sent += 1
+        return True
@@ -8,3 +8,15 @@ class CameraOutput(abc.ABC):
     def write(self, buf: bytes) -> int: ...
     @abc.abstractmethod
     async def awrite(self, buf: bytes) -> int: ...
+
+    def write_segments(self, *segments: bytes | bytearray | memoryview) -> int:
+        """Write one message made up of several segments. Outputs override to avoid joining the segments."""
+        return self.write(b"".join(segments))
+
+    async def awrite_segments(self, *segments: bytes | bytearray | memoryview) -> int:
+        return await self.awrite(b"".join(segments))
+
+    @property
+    def subscriber_count(self) -> int | None:
+        """Number of connected consumers, None if the output cannot tell."""
+        return None
@@ -1,7 +1,29 @@
+import logging
+import threading
+
 import pynng
+from pynng.exceptions import check_err
 
 from .base import CameraOutput
 
+logger = logging.getLogger(__name__)
+
+
+def _message_from_segments(segments: tuple[bytes | bytearray | memoryview, ...]) -> pynng.Message:
+    """Copy segments straight into a nng message body, skipping the intermediate join in python."""
+    total_len = sum(len(segment) for segment in segments)
+
+    msg_p = pynng.ffi.new("nng_msg **")
+    check_err(pynng.lib.nng_msg_alloc(msg_p, total_len))
+    body = pynng.ffi.cast("char *", pynng.lib.nng_msg_body(msg_p[0]))
+
+    offset = 0
+    for segment in segments:
+        pynng.ffi.memmove(body + offset, segment, len(segment))
+        offset += len(segment)
+
+    return pynng.Message(msg_p[0])
+
 
 class PynngCameraOutput(CameraOutput):
     def __init__(self, address: str):
@@ -9,6 +31,30 @@ class PynngCameraOutput(CameraOutput):
         self.__pub.listen(address)  # , block=False)
         # self.pub.listen("ipc:///home/michael/test.sock")
 
+        # pipe callbacks are invoked from nng threads
+        self.__address = address
+        self.__subscribers = 0
+        self.__subscribers_lock = threading.Lock()
+        self.__pub.add_post_pipe_connect_cb(self._on_pipe_connect)
+        self.__pub.add_post_pipe_remove_cb(self._on_pipe_remove)
+
+    def close(self):
+        self.__pub.close()
+
+    @property
+    def subscriber_count(self) -> int:
+        return self.__subscribers
+
+    def _on_pipe_connect(self, pipe: pynng.Pipe):
+        with self.__subscribers_lock:
+            self.__subscribers += 1
+        logger.info(f"subscriber connected to {self.__address}, {self.__subscribers} connected")
+
+    def _on_pipe_remove(self, pipe: pynng.Pipe):
+        with self.__subscribers_lock:
+            self.__subscribers = max(0, self.__subscribers - 1)
+        logger.info(f"subscriber disconnected from {self.__address}, {self.__subscribers} connected")
+
     def write(self, buf: bytes) -> int:
         """Synchronous send."""
         self.__pub.send(buf)
@@ -18,3 +64,11 @@ class PynngCameraOutput(CameraOutput):
         """Asynchronous send."""
         await self.__pub.asend(buf)
         return len(buf)
+
+    def write_segments(self, *segments: bytes | bytearray | memoryview) -> int:
+        self.__pub.send_msg(_message_from_segments(segments))
+        return sum(len(segment) for segment in segments)
+
+    async def awrite_segments(self, *segments: bytes | bytearray | memoryview) -> int:
+        await self.__pub.asend_msg(_message_from_segments(segments))
+        return sum(len(segment) for segment in segments)
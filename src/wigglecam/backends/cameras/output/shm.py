@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import struct
+from multiprocessing import resource_tracker, shared_memory
+
+from .base import CameraOutput
+
+logger = logging.getLogger(__name__)
+
+# Layout of the shared memory segment:
+#   control: magic (4s), slot_count (I), slot_size (I), reserved (I), last published sequence (Q)
+#   slots:   slot_count times: slot sequence (Q), message length (Q), slot_size bytes message
+# Single producer, multiple consumers, lock-free. Every slot is a seqlock: the producer sets the slot sequence odd
+# while writing and even when done. A consumer copies the message and accepts it only if the slot sequence is the
+# expected even value before and after the copy, otherwise the slot was overwritten meanwhile.
+SHM_MAGIC = b"WGSM"
+
+_CONTROL_STRUCT = struct.Struct("<4sIIIQ")
+_SLOT_HEADER_STRUCT = struct.Struct("<QQ")
+_LAST_SEQUENCE_OFFSET = 16
+
+
+def _slot_offset(index: int, slot_size: int) -> int:
+    return _CONTROL_STRUCT.size + index * (_SLOT_HEADER_STRUCT.size + slot_size)
+
+
+class ShmCameraOutput(CameraOutput):
+    """Publish messages into a ring of shared memory slots, for hubs running on the same host as the node."""
+
+    def __init__(self, name: str, slot_count: int = 4, slot_size: int = 8 * 1024 * 1024):
+        self.__slot_count = slot_count
+        self.__slot_size = slot_size
+        self.__sequence = 0
+
+        size = _slot_offset(slot_count, slot_size)
+        try:
+            self.__shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # left over from a node that was not shut down cleanly
+            logger.warning(f"shared memory {name} exists already, recreating it")
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            self.__shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        self.__buf = self.__shm.buf
+        _CONTROL_STRUCT.pack_into(self.__buf, 0, SHM_MAGIC, slot_count, slot_size, 0, 0)
+
+        logger.info(f"shared memory output {name} with {slot_count} slots of {slot_size} bytes")
+
+    def close(self):
+        self.__buf.release()
+        self.__shm.close()
+        self.__shm.unlink()
+
+    def write(self, buf: bytes) -> int:
+        return self.write_segments(buf)
+
+    async def awrite(self, buf: bytes) -> int:
+        return self.write_segments(buf)
+
+    def write_segments(self, *segments: bytes | bytearray | memoryview) -> int:
+        total_len = sum(len(segment) for segment in segments)
+        if total_len > self.__slot_size:
+            raise ValueError(f"message of {total_len} bytes exceeds shared memory slot size {self.__slot_size}")
+
+        self.__sequence += 1
+        offset = _slot_offset((self.__sequence - 1) % self.__slot_count, self.__slot_size)
+
+        _SLOT_HEADER_STRUCT.pack_into(self.__buf, offset, 2 * self.__sequence - 1, total_len)
+        position = offset + _SLOT_HEADER_STRUCT.size
+        for segment in segments:
+            self.__buf[position : position + len(segment)] = segment
+            position += len(segment)
+        _SLOT_HEADER_STRUCT.pack_into(self.__buf, offset, 2 * self.__sequence, total_len)
+
+        struct.pack_into("<Q", self.__buf, _LAST_SEQUENCE_OFFSET, self.__sequence)
+        return total_len
+
+    async def awrite_segments(self, *segments: bytes | bytearray | memoryview) -> int:
+        # a memcpy into shared memory, not worth a thread hop
+        return self.write_segments(*segments)
+
+
+class ShmFrameReader:
+    """Consumer side of ShmCameraOutput. Every reader keeps its own position, slow readers skip overwritten messages."""
+
+    def __init__(self, name: str):
+        self.__shm = shared_memory.SharedMemory(name=name)
+        # the producer owns the segment, do not let the resource tracker unlink it when this process exits
+        resource_tracker.unregister(self.__shm._name, "shared_memory")  # type: ignore[attr-defined]
+
+        self.__buf = self.__shm.buf
+        magic, self.__slot_count, self.__slot_size, _, last_sequence = _CONTROL_STRUCT.unpack_from(self.__buf, 0)
+        if magic != SHM_MAGIC:
+            raise ValueError(f"shared memory {name} is not a wigglecam output")
+
+        self.__next_sequence = last_sequence + 1  # start with the next message published
+        self.dropped = 0
+
+    def close(self):
+        self.__buf.release()
+        self.__shm.close()
+
+    @property
+    def last_sequence(self) -> int:
+        return struct.unpack_from("<Q", self.__buf, _LAST_SEQUENCE_OFFSET)[0]
+
+    def read(self) -> bytes | None:
+        """Next message or None if there is no new one."""
+        while True:
+            last_sequence = self.last_sequence
+            if self.__next_sequence > last_sequence:
+                return None
+
+            if last_sequence - self.__next_sequence >= self.__slot_count:
+                # fell behind, the ring has been overwritten since
+                skipped = last_sequence - self.__slot_count + 1 - self.__next_sequence
+                self.dropped += skipped
+                self.__next_sequence += skipped
+
+            sequence = self.__next_sequence
+            offset = _slot_offset((sequence - 1) % self.__slot_count, self.__slot_size)
+
+            slot_sequence, length = _SLOT_HEADER_STRUCT.unpack_from(self.__buf, offset)
+            position = offset + _SLOT_HEADER_STRUCT.size
+            data = bytes(self.__buf[position : position + min(length, self.__slot_size)])
+            slot_sequence_after, _ = _SLOT_HEADER_STRUCT.unpack_from(self.__buf, offset)
+
+            self.__next_sequence += 1
+            if slot_sequence == slot_sequence_after == 2 * sequence:
+                return data
+
+            # overwritten while copying
+            self.dropped += 1
+
+    def read_latest(self) -> bytes | None:
+        """Skip to the newest message, for consumers that only display the current frame."""
+        last_sequence = self.last_sequence
+        if last_sequence >= self.__next_sequence:
+            self.dropped += last_sequence - self.__next_sequence
+            self.__next_sequence = last_sequence
+        return self.read()
+
+    async def arecv(self, poll_interval: float = 0.002) -> bytes:
+        while (data := self.read()) is None:
+            await asyncio.sleep(poll_interval)
+        return data
@@ -1,7 +1,8 @@
 import asyncio
-import io
 import logging
-import uuid
+import time
+from collections.abc import Callable
+from typing import TYPE_CHECKING
 
 from libcamera import Transform, controls  # type: ignore
 from picamera2 import Picamera2
@@ -10,22 +11,92 @@ from picamera2.encoders import MJPEGEncoder, Quality
 from picamera2.outputs.output import Output
 
 from ...config.camera_picamera2 import CfgCameraPicamera2
-from ...dto import ImageMessage
-from .base import CameraBackend
+from ...dto import FLAG_THUMBNAIL, ImageMessage, PixelFormat, StreamLevel, SyncState
+from .base import LORES_BYTES, LORES_FRAMES_SENT, LORES_FRAMES_SKIPPED, CameraBackend
+from .frames import FrameSequencer, RawFrame
 from .output.base import CameraOutput
 
+# cv2 and numpy are imported when used, so the node binds its sockets before loading them
+if TYPE_CHECKING:
+    import numpy
+
+    from ..encoders.raw import RawImage
+
 # Suppress debug logs from picamera2
 logging.getLogger("picamera2").setLevel(logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def boottime_to_wall_ns(boottime_ns: int) -> int:
+    """Sensor timestamps are CLOCK_BOOTTIME, convert to wall clock so they are comparable across (time synced) nodes."""
+    return boottime_ns + time.time_ns() - time.clock_gettime_ns(time.CLOCK_BOOTTIME)
+
+
+def pack_i420(array: "numpy.ndarray", width: int, height: int) -> "numpy.ndarray":
+    """A picamera2 YUV420 array with rows padded to the stride, packed tightly as expected by cv2 and the hub."""
+    import numpy
+
+    stride = array.shape[1]
+    if stride == width:
+        return array
+
+    chroma = array[height:].reshape(-1)
+    chroma_size = (height // 2) * (stride // 2)
+    u = chroma[:chroma_size].reshape(height // 2, stride // 2)[:, : width // 2]
+    v = chroma[chroma_size : 2 * chroma_size].reshape(height // 2, stride // 2)[:, : width // 2]
+    return numpy.concatenate((array[:height, :width].reshape(-1), u.reshape(-1), v.reshape(-1))).reshape(height * 3 // 2, width)
+
+
+def array_to_bgr(array: "numpy.ndarray", format: str, width: int, height: int) -> "numpy.ndarray":
+    """Convert a picamera2 array of the main stream to BGR as expected by cv2."""
+    import cv2
+
+    if format == "YUV420":
+        return cv2.cvtColor(pack_i420(array, width, height), cv2.COLOR_YUV2BGR_I420)
+    if format in ("RGB888", "XRGB8888"):
+        # picamera2 naming follows libcamera, RGB888 is stored as B,G,R in memory
+        return array[:, :width, :3]
+    if format in ("BGR888", "XBGR8888"):
+        return cv2.cvtColor(array[:, :width, :3], cv2.COLOR_RGB2BGR)
+
+    raise ValueError(f"unsupported format {format}")
+
+
+def encode_jpeg(array: "numpy.ndarray", format: str, width: int, height: int, quality: int, size: tuple[int, int] | None = None) -> bytes:
+    """Encode a picamera2 array, downscaled to size (width, height) if given."""
+    import cv2
+
+    bgr = array_to_bgr(array, format, width, height)
+    if size is not None:
+        bgr = cv2.resize(bgr, size, interpolation=cv2.INTER_AREA)
+    ok, jpeg_buffer = cv2.imencode(".jpg", bgr, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("encoding jpeg failed")
+    return jpeg_buffer.tobytes()
+
+
 class PicameraEncoderOutputAdapter(Output):
-    def __init__(self, device_id: int, output: CameraOutput):
+    def __init__(
+        self,
+        device_id: int,
+        output: CameraOutput,
+        frame_info: Callable[[int | None], tuple[int, int, SyncState]],
+        changed: Callable[[bytes], bool] = lambda frame: True,
+    ):
         self.__device_id = device_id
         self.__output = output
+        self.__frame_info = frame_info
+        self.__changed = changed
 
     def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
-        self.__output.write(ImageMessage(self.__device_id, jpg_bytes=frame, job_id=None).to_bytes())
+        # called in the encoder thread, so the change gate does not delay the run loop
+        if not self.__changed(frame):
+            return
+
+        timestamp_ns, sequence, sync_state = self.__frame_info(timestamp)
+        msg = ImageMessage(self.__device_id, payload=frame, job_id=None, timestamp_ns=timestamp_ns, sequence=sequence, sync_state=sync_state)
+        LORES_BYTES.inc(self.__output.write_segments(*msg.to_segments()))
+        LORES_FRAMES_SENT.inc()
 
 
 class Picam(CameraBackend):
@@ -34,28 +105,178 @@ class Picam(CameraBackend):
         super().__init__(device_id, output_lores, output_hires)
 
         self.__picamera2: Picamera2 | None = None
-        self.__picamera2_output_lores = PicameraEncoderOutputAdapter(device_id, self._output_lores)
+        self.__mjpeg_encoder: MJPEGEncoder | None = None
+        self.__lores_encoding = False
+        self.__thumbnail_last = 0.0
+        self.__lores_software_task: asyncio.Task | None = None
+        self.__picamera2_output_lores = PicameraEncoderOutputAdapter(device_id, self._output_lores, self._lores_frame_info, self._lores_changed)
+
+        # updated from the metadata of every frame in the run loop
+        self.__sync_state = SyncState.OFF
+        self.__sequencer = FrameSequencer()
 
         logger.info(f"Picamera2Backend initialized, {device_id=}, listening for subs")
 
-    async def trigger_hires_capture(self, job_id: uuid.UUID):
-        logger.debug("start producing hires capture")
+    def _capture_hires_frame(self) -> RawFrame:
+        """Copy the main stream of the next frame out of the camera buffers."""
+        return self._capture_frame(lores=False)[0]
 
-        jpeg_bytes = await asyncio.to_thread(self._produce_image)
+    def _capture_frame(self, lores: bool) -> tuple[RawFrame, "numpy.ndarray | None"]:
+        """Copy the main stream and optionally the lores stream of the next frame out of the camera buffers."""
+        assert self.__picamera2
 
-        msg_bytes = ImageMessage(self._device_id, jpg_bytes=jpeg_bytes, job_id=job_id).to_bytes()
-        await self._output_hires.awrite(msg_bytes)
+        request = self.__picamera2.capture_request()
+        try:
+            array = request.make_array("main")
+            lores_array = request.make_array("lores") if lores else None
+            metadata = request.get_metadata()
+        finally:
+            request.release()
 
-        logger.info(f"hires capture {len(msg_bytes)} bytes written to output, device_id={self._device_id} {job_id=} ")
+        self._update_frame_state(metadata)
+        return RawFrame(array, *self._frame_info(metadata.get("SensorTimestamp"))), lores_array
 
-    def _produce_image(self) -> bytes:
+    def _capture_lores_frame(self) -> tuple["numpy.ndarray", dict]:
+        """Copy the lores stream of the next frame out of the camera buffers, for frames encoded in software."""
         assert self.__picamera2
 
-        jpeg_buffer = io.BytesIO()
-        self.__picamera2.capture_file(jpeg_buffer, format="jpeg")
-        jpeg_bytes = jpeg_buffer.getvalue()
+        request = self.__picamera2.capture_request()
+        try:
+            return request.make_array("lores"), request.get_metadata()
+        finally:
+            request.release()
+
+    def _encode_hires_frame(self, frame: RawFrame) -> bytes:
+        assert self.__picamera2
 
-        return jpeg_bytes
+        main_config = self.__picamera2.camera_config["main"]
+        width, height = main_config["size"]
+        return self._hires_encoder.encode(array_to_bgr(frame.array, main_config["format"], width, height), "BGR")
+
+    def _raw_hires_image(self, frame: RawFrame) -> "RawImage":
+        from ..encoders.raw import RawImage
+
+        assert self.__picamera2
+
+        main_config = self.__picamera2.camera_config["main"]
+        width, height = main_config["size"]
+        if main_config["format"] == "YUV420":
+            # the sensor's native output, half the size of RGB and no color conversion on the node
+            return RawImage(pack_i420(frame.array, width, height), PixelFormat.I420, width, height)
+        return RawImage(array_to_bgr(frame.array, main_config["format"], width, height), PixelFormat.BGR888, width, height)
+
+    async def _update_lores_encoder(self) -> bool:
+        """Stop the lores encoder while nobody is subscribed or the thumbnail level is selected and restart it once
+        someone connects to the full lores level. True if the frame grabbed next is due to be encoded in software,
+        a thumbnail at the stream rate or a keepalive frame."""
+        assert self.__picamera2 and self.__mjpeg_encoder
+
+        subscribed = self._lores_subscribed()
+        encoding = subscribed and self.lores_level is StreamLevel.LORES
+        if encoding and not self.__lores_encoding:
+            logger.info("lores subscriber connected, resume encoding")
+            await asyncio.to_thread(
+                self.__picamera2.start_encoder,
+                self.__mjpeg_encoder,
+                self.__picamera2_output_lores,
+                quality=Quality[self.__config.videostream_quality],
+            )
+        elif not encoding and self.__lores_encoding:
+            logger.info("no lores subscriber or thumbnail level selected, pause encoding")
+            await asyncio.to_thread(self.__picamera2.stop_encoder, self.__mjpeg_encoder)
+        self.__lores_encoding = encoding
+
+        if subscribed:
+            return not encoding and self._thumbnail_due()
+        if self._lores_keepalive_due():
+            return True
+
+        LORES_FRAMES_SKIPPED.inc()  # called once per frame period
+        return False
+
+    def _thumbnail_due(self) -> bool:
+        """True once per frame_skip_count frames, the rate of the hardware encoded stream."""
+        now = time.monotonic()
+        if now - self.__thumbnail_last < self.__config.frame_skip_count / self.__config.framerate:
+            return False
+
+        self.__thumbnail_last = now
+        return True
+
+    def _send_lores_software(self, array: "numpy.ndarray", frame_info: tuple[int, int, SyncState]):
+        """Hand a lores frame the run loop grabbed to a worker thread for encoding, so the loop keeps the frame rate.
+        If the previous frame is still being encoded, the frame is dropped rather than queued."""
+        if self.__lores_software_task is not None and not self.__lores_software_task.done():
+            LORES_FRAMES_SKIPPED.inc()
+            return
+
+        self.__lores_software_task = asyncio.create_task(self._lores_software_task(array, frame_info))
+
+    async def _lores_software_task(self, array: "numpy.ndarray", frame_info: tuple[int, int, SyncState]):
+        try:
+            await asyncio.to_thread(self._encode_lores_software, array, frame_info)
+        except Exception as exc:
+            logger.warning(f"encoding lores frame in software failed: {exc}")
+
+    def _encode_lores_software(self, array: "numpy.ndarray", frame_info: tuple[int, int, SyncState]):
+        """Encode a single lores frame in software while the encoder is paused, downscaled if thumbnails are selected.
+        Thumbnails are sent only if the change gate passes them, keepalive frames are rate limited already."""
+        assert self.__picamera2
+
+        lores_config = self.__picamera2.camera_config["lores"]
+        width, height = lores_config["size"]
+        thumbnail = self.lores_level is StreamLevel.THUMBNAIL
+        size = (self.__config.thumbnail_res_width, self.__config.thumbnail_res_height) if thumbnail else None
+        jpeg_bytes = encode_jpeg(array, lores_config["format"], width, height, 80, size)
+        if self._lores_subscribed() and not self._lores_changed(jpeg_bytes):
+            return
+
+        timestamp_ns, sequence, sync_state = frame_info
+        msg = ImageMessage(
+            self._device_id,
+            payload=jpeg_bytes,
+            flags=FLAG_THUMBNAIL if thumbnail else 0,
+            timestamp_ns=timestamp_ns,
+            sequence=sequence,
+            sync_state=sync_state,
+        )
+        LORES_BYTES.inc(self._output_lores.write_segments(*msg.to_segments()))
+        LORES_FRAMES_SENT.inc()
+
+    def _update_frame_state(self, metadata: dict):
+        sensor_timestamp_ns = metadata.get("SensorTimestamp")
+        frame_duration_ns = (metadata.get("FrameDuration") or 0) * 1000  # reported in us
+        if sensor_timestamp_ns is not None:
+            self.__sequencer.add(sensor_timestamp_ns, frame_duration_ns)
+
+        if self.__config.software_sync == "off":
+            sync_state = SyncState.OFF
+        elif metadata.get("SyncReady"):
+            sync_state = SyncState.READY
+        else:
+            sync_state = SyncState.WAITING
+
+        if sync_state != self.__sync_state:
+            logger.info(f"sync state changed {self.__sync_state.name} -> {sync_state.name}, sync lag: {metadata.get('SyncTimer')}")
+            self.__sync_state = sync_state
+
+    def _frame_info(self, sensor_timestamp_ns: int | None) -> tuple[int, int, SyncState]:
+        """Wall clock timestamp, sequence number and sync state for a frame by its sensor timestamp.
+        The sequence is looked up by the timestamp so it is consistent between lores and hires and skips dropped frames."""
+        if sensor_timestamp_ns is None:
+            sensor_timestamp_ns = self.__sequencer.last_timestamp_ns
+        if not sensor_timestamp_ns:
+            return 0, 0, self.__sync_state
+
+        return boottime_to_wall_ns(sensor_timestamp_ns), self.__sequencer.lookup(sensor_timestamp_ns), self.__sync_state
+
+    def _lores_frame_info(self, encoder_timestamp_us: int | None) -> tuple[int, int, SyncState]:
+        # picamera2 encoders pass timestamps relative to their first frame, restore the absolute sensor timestamp
+        first_timestamp_us = getattr(self.__mjpeg_encoder, "firsttimestamp", None)
+        if encoder_timestamp_us is None or first_timestamp_us is None:
+            return self._frame_info(None)
+
+        return self._frame_info((first_timestamp_us + encoder_timestamp_us) * 1000)
 
     def _set_pi5_hdr(self, enable: bool):
         """enable/disable Pi5 specific HDR."""
@@ -77,9 +298,8 @@ class Picam(CameraBackend):
         except Exception as exc:
             logger.warning(f"could not set imx708 hdr mode, error: {exc}")
 
-    async def run(self):
-        # initialize private props
-
+    def _start_camera(self):
+        """Blocking camera start, run in a worker thread so the node answers on its sockets meanwhile."""
         logger.debug("starting _camera_fun")
 
         if self.__config.hdr_type == "imx708":
@@ -137,29 +357,52 @@ class Picam(CameraBackend):
         except RuntimeError as exc:
             logger.info(f"control not available on all cameras - can ignore {exc}")
 
-        logger.info(f"{self.__picamera2.camera_config=}")
-        logger.info(f"{self.__picamera2.camera_controls=}")
-        logger.info(f"{self.__picamera2.controls=}")
-        logger.info(f"{self.__picamera2.camera_properties=}")
+        if logger.isEnabledFor(logging.DEBUG):
+            # large dumps, only formatted if they are logged
+            logger.debug(f"{self.__picamera2.camera_config=}")
+            logger.debug(f"{self.__picamera2.camera_controls=}")
+            logger.debug(f"{self.__picamera2.controls=}")
+            logger.debug(f"{self.__picamera2.camera_properties=}")
 
-        mjpeg_encoder = MJPEGEncoder()
-        mjpeg_encoder.frame_skip_count = self.__config.frame_skip_count
-        self.__picamera2.start_recording(mjpeg_encoder, self.__picamera2_output_lores, quality=Quality[self.__config.videostream_quality])
+        self.__mjpeg_encoder = MJPEGEncoder()
+        self.__mjpeg_encoder.frame_skip_count = self.__config.frame_skip_count
+        self.__picamera2.start_recording(self.__mjpeg_encoder, self.__picamera2_output_lores, quality=Quality[self.__config.videostream_quality])
+        self.__lores_encoding = True
 
         logger.debug(f"{self.__module__} started")
 
         if self.__config.software_sync != "off":
             logger.info("the node is configured to sync. ensure there is 1 server to sync to!")
 
+    async def run(self):
+        await asyncio.to_thread(self._start_camera)
+
         while True:
             # capture metadata blocks until new metadata is avail
             try:
-                _ = await asyncio.to_thread(self.__picamera2.capture_metadata)
+                # checked every frame, so the stream resumes within one frame period after a subscriber connects
+                lores_software = await self._update_lores_encoder()
+
+                if self._hires_ring is not None:
+                    # zero shutter lag, keep a copy of every full resolution frame
+                    frame, lores_array = await asyncio.to_thread(self._capture_frame, lores_software)
+                    self._hires_ring.append(frame)
+                    if lores_array is not None:
+                        self._send_lores_software(lores_array, (frame.timestamp_ns, frame.sequence, frame.sync_state))
+                    await self._announce_ready()
+                    continue
+
+                if lores_software:
+                    lores_array, metadata = await asyncio.to_thread(self._capture_lores_frame)
+                else:
+                    metadata = await asyncio.to_thread(self.__picamera2.capture_metadata)
 
                 # when sync client/server is enabled, the captures are synchronized by libcamera in the background
-                # at one point there is the SyncTimer true. We do not supvervise it for now, so if there is no server
-                # we don't know that the cameras are out of sync. Might improve later...
-                # print("Sync ready:", meta.get("SyncReady"), "    Sync lag:", meta.get("SyncTimer"))
+                # at one point there is the SyncReady true. The state is forwarded with every frame so the hub can supervise.
+                self._update_frame_state(metadata)
+                if lores_software:
+                    self._send_lores_software(lores_array, self._frame_info(metadata.get("SensorTimestamp")))
+                await self._announce_ready()
 
             except TimeoutError as exc:
                 logger.warning(f"camera timed out: {exc}")
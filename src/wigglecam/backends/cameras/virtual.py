@@ -1,81 +1,144 @@
 import asyncio
 import io
 import logging
-import uuid
+import time
 
 import numpy
 from PIL import Image, ImageDraw
 
 from ...config.camera_virtual import CfgCameraVirtual
-from ...dto import ImageMessage
-from .base import CameraBackend
+from ...dto import FLAG_THUMBNAIL, ImageMessage, StreamLevel
+from .base import LORES_BYTES, LORES_FRAMES_SENT, LORES_FRAMES_SKIPPED, CameraBackend
+from .frames import RawFrame
 from .output.base import CameraOutput
 
 logger = logging.getLogger(__name__)
 
+COLOR_STEPS = 100
+
+
+class FrameRenderer:
+    """Renders the synthetic frames of one resolution. The mask is built once, frames are rendered straight to uint8."""
+
+    def __init__(self, width: int, height: int, ellipse_divider: int = 3):
+        self.__width = width
+        self.__height = height
+
+        ellipse_size = min(width, height) // ellipse_divider
+        mask = Image.new("L", (ellipse_size, ellipse_size), 0)
+        ImageDraw.Draw(mask).ellipse((0, 0, ellipse_size, ellipse_size), fill=255)
+        self.__mask = numpy.asarray(mask) > 0
+        self.__mask_origin = (height // ellipse_divider, width // ellipse_divider)
+
+    @property
+    def resolution(self) -> tuple[int, int]:
+        return self.__width, self.__height
+
+    def render(self, step: int) -> numpy.ndarray:
+        time_normalized = step / COLOR_STEPS
+        color = numpy.round(255 * (0.5 + 0.5 * numpy.sin(2 * numpy.pi * (numpy.arange(3) / 3 + time_normalized)))).astype(numpy.uint8)
+
+        frame = numpy.empty((self.__height, self.__width, 3), dtype=numpy.uint8)
+        frame[:] = color
+
+        y, x = self.__mask_origin
+        mask_h, mask_w = self.__mask.shape
+        frame[y : y + mask_h, x : x + mask_w][self.__mask] = 255
+
+        return frame
+
 
 class Virtual(CameraBackend):
     """
     A fake camera backend that generates synthetic frames.
     Produces both 'lores' and 'hires' frames as byte strings.
+
+    By default frames are taken from a ring of pre-rendered, encoded frames, so a fleet of virtual nodes is a cheap load
+    generator. With live_encode every frame is rendered and encoded at the configured resolution to emulate the CPU load
+    of a real node.
     """
 
     def __init__(self, device_id: int, output_lores: CameraOutput, output_hires: CameraOutput):
         self.__config = CfgCameraVirtual()
         super().__init__(device_id, output_lores, output_hires)
 
-        self.__offset_x = 0
-        self.__offset_y = 0
-        self.__color_current = 0
+        self.__renderer_lores = FrameRenderer(self.__config.lores_res_width, self.__config.lores_res_height)
+        self.__renderer_hires = FrameRenderer(self.__config.hires_res_width, self.__config.hires_res_height)
+        self.__renderer_thumbnail = FrameRenderer(self.__config.thumbnail_res_width, self.__config.thumbnail_res_height)
+
+        # ring of encoded frames per resolution, filled lazily so startup is not delayed
+        self.__frame_cache: dict[tuple[int, int], list[bytes | None]] = {}
+        self.__frame_index: dict[tuple[int, int], int] = {}
+        self.__sequence = 0
 
         logger.info(f"VirtualBackend initialized, {device_id=}, listening for subs")
 
     async def run(self):
         while True:
-            # Offload CPU‑bound work to a thread
-            produced_frame = await asyncio.to_thread(self._produce_dummy_image)
-
-            # For demo, use same image for lores and hires
-            msg_bytes = ImageMessage(self._device_id, jpg_bytes=produced_frame).to_bytes()
-            await self._output_lores.awrite(msg_bytes)
+            timestamp_ns = time.time_ns()
+            self.__sequence += 1
+
+            if self._hires_ring is not None:
+                self._hires_ring.append(await asyncio.to_thread(self._capture_hires_frame, timestamp_ns))
+            await self._announce_ready()
+
+            # skip encoding while nobody watches, checked every frame period so streaming resumes within one frame
+            subscribed = self._lores_subscribed()
+            if subscribed or self._lores_keepalive_due():
+                # Offload CPU‑bound work to a thread
+                thumbnail = self.lores_level is StreamLevel.THUMBNAIL
+                renderer = self.__renderer_thumbnail if thumbnail else self.__renderer_lores
+                # keepalive frames are rate limited already, only the stream passes the change gate
+                produced_frame = await asyncio.to_thread(self._produce_lores_frame, renderer, subscribed)
+
+                if produced_frame is not None:
+                    flags = FLAG_THUMBNAIL if thumbnail else 0
+                    msg = ImageMessage(self._device_id, payload=produced_frame, flags=flags, timestamp_ns=timestamp_ns, sequence=self.__sequence)
+                    LORES_BYTES.inc(await self._output_lores.awrite_segments(*msg.to_segments()))
+                    LORES_FRAMES_SENT.inc()
+            else:
+                LORES_FRAMES_SKIPPED.inc()
 
             await asyncio.sleep(1.0 / self.__config.fps_nominal)
 
-    async def trigger_hires_capture(self, job_id: uuid.UUID):
-        logger.debug("start producing hires capture")
-
-        produced_frame = await asyncio.to_thread(self._produce_dummy_image)
-
-        msg_bytes = ImageMessage(self._device_id, jpg_bytes=produced_frame, job_id=job_id).to_bytes()
-        await self._output_hires.awrite(msg_bytes)
+    def _capture_hires_frame(self, timestamp_ns: int | None = None) -> RawFrame:
+        # as cheap load generator the frame is not rendered, the encoded frame is taken from the cache later
+        render = self.__config.live_encode or self._hires_ring is not None or self._common_config.hires_codec != "jpeg"
+        array = self.__renderer_hires.render(self.__sequence % COLOR_STEPS) if render else None
+        return RawFrame(array, timestamp_ns or time.time_ns(), self.__sequence)
 
-        logger.info(f"hires capture {len(msg_bytes)} bytes written to output, device_id={self._device_id} {job_id=} ")
+    def _encode_hires_frame(self, frame: RawFrame) -> bytes:
+        if frame.array is None:
+            return self._produce_dummy_image(self.__renderer_hires)
+        return super()._encode_hires_frame(frame)
 
-    def _produce_dummy_image(self) -> bytes:
-        """CPU-intensive image generator — run in a worker thread."""
-        offset_x = self.__offset_x
-        offset_y = self.__offset_y
-
-        size = 250
-        ellipse_divider = 3
-        color_steps = 100
+    def _encode(self, frame: numpy.ndarray) -> bytes:
         byte_io = io.BytesIO()
+        Image.fromarray(frame, "RGB").save(byte_io, format="JPEG", quality=self.__config.jpeg_quality)
+        return byte_io.getvalue()
 
-        mask = Image.new("L", (size, size), 0)
-        draw = ImageDraw.Draw(mask)
-        draw.ellipse((0, 0, size // ellipse_divider, size // ellipse_divider), fill=255)
+    def _produce_lores_frame(self, renderer: FrameRenderer, gated: bool) -> bytes | None:
+        """Next lores frame, None if the change gate holds it back — run in a worker thread."""
+        frame = self._produce_dummy_image(renderer)
+        return frame if not gated or self._lores_changed(frame) else None
 
-        time_normalized = self.__color_current / color_steps
-        self.__color_current = self.__color_current + 1 if self.__color_current < color_steps else 0
+    def _produce_dummy_image(self, renderer: FrameRenderer | None = None) -> bytes:
+        """Next frame of the renderer (lores by default) as JPEG — run in a worker thread."""
+        renderer = renderer or self.__renderer_lores
+        resolution = renderer.resolution
+        cache_size = self.__config.cache_size
 
-        imarray = numpy.empty((size, size, 3))
-        imarray[:, :, 0] = 0.5 + 0.5 * numpy.sin(2 * numpy.pi * (0 / 3 + time_normalized))
-        imarray[:, :, 1] = 0.5 + 0.5 * numpy.sin(2 * numpy.pi * (1 / 3 + time_normalized))
-        imarray[:, :, 2] = 0.5 + 0.5 * numpy.sin(2 * numpy.pi * (2 / 3 + time_normalized))
-        imarray = numpy.round(255 * imarray).astype(numpy.uint8)
+        index = self.__frame_index.get(resolution, 0)
+        self.__frame_index[resolution] = (index + 1) % cache_size
+        # the ring covers one full color cycle regardless of its size
+        step = index * COLOR_STEPS // cache_size
 
-        random_image = Image.fromarray(imarray, "RGB")
-        random_image.paste(mask, (size // ellipse_divider + offset_x, size // ellipse_divider + offset_y), mask=mask)
+        if self.__config.live_encode:
+            return self._encode(renderer.render(step))
 
-        random_image.save(byte_io, format="JPEG", quality=70)
-        return byte_io.getvalue()
+        cache = self.__frame_cache.setdefault(resolution, [None] * cache_size)
+        frame = cache[index]
+        if frame is None:
+            frame = cache[index] = self._encode(renderer.render(step))
+
+        return frame
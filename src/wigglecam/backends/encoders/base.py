@@ -0,0 +1,44 @@
+import abc
+import importlib
+import logging
+from typing import Any, Literal
+
+logger = logging.getLogger(__name__)
+
+ChannelOrder = Literal["RGB", "BGR"]
+Subsampling = Literal["444", "422", "420"]
+
+# tried in this order by the auto selection, the fastest first
+ENCODER_CLASSES = {
+    "simplejpeg": "SimplejpegEncoder",
+    "turbojpeg": "TurbojpegEncoder",
+    "opencv": "OpencvEncoder",
+    "pil": "PilEncoder",
+}
+
+
+class JpegEncoder(abc.ABC):
+    """Encodes a HxWx3 uint8 array to JPEG. Thread safe, the libraries release the GIL while encoding."""
+
+    @abc.abstractmethod
+    def __init__(self, quality: int = 90, subsampling: Subsampling = "420"): ...
+    @abc.abstractmethod
+    def encode(self, array: Any, channel_order: ChannelOrder = "RGB") -> bytes: ...
+
+
+def encoder_factory(name: str, quality: int = 90, subsampling: Subsampling = "420") -> JpegEncoder:
+    """Create the encoder by name, auto picks the first one whose library is installed."""
+    if name != "auto":
+        module = importlib.import_module(f".{name}", __package__)
+        return getattr(module, ENCODER_CLASSES[name])(quality, subsampling)
+
+    for candidate in ENCODER_CLASSES:
+        try:
+            encoder = encoder_factory(candidate, quality, subsampling)
+        except (ImportError, OSError):
+            # library not installed or its shared library is missing
+            continue
+        logger.info(f"using {candidate} to encode jpeg")
+        return encoder
+
+    raise RuntimeError("no jpeg encoder available, install pillow or opencv")
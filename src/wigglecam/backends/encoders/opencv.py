@@ -0,0 +1,24 @@
+import cv2
+import numpy
+
+from .base import ChannelOrder, JpegEncoder, Subsampling
+
+_SUBSAMPLING = {
+    "444": cv2.IMWRITE_JPEG_SAMPLING_FACTOR_444,
+    "422": cv2.IMWRITE_JPEG_SAMPLING_FACTOR_422,
+    "420": cv2.IMWRITE_JPEG_SAMPLING_FACTOR_420,
+}
+
+
+class OpencvEncoder(JpegEncoder):
+    def __init__(self, quality: int = 90, subsampling: Subsampling = "420"):
+        self.__params = [cv2.IMWRITE_JPEG_QUALITY, quality, cv2.IMWRITE_JPEG_SAMPLING_FACTOR, _SUBSAMPLING[subsampling]]
+
+    def encode(self, array: numpy.ndarray, channel_order: ChannelOrder = "RGB") -> bytes:
+        if channel_order == "RGB":
+            array = cv2.cvtColor(array, cv2.COLOR_RGB2BGR)
+
+        ok, jpeg_buffer = cv2.imencode(".jpg", array, self.__params)
+        if not ok:
+            raise RuntimeError("encoding jpeg failed")
+        return jpeg_buffer.tobytes()
@@ -0,0 +1,22 @@
+import io
+
+import numpy
+from PIL import Image
+
+from .base import ChannelOrder, JpegEncoder, Subsampling
+
+_SUBSAMPLING = {"444": 0, "422": 1, "420": 2}
+
+
+class PilEncoder(JpegEncoder):
+    def __init__(self, quality: int = 90, subsampling: Subsampling = "420"):
+        self.__quality = quality
+        self.__subsampling = _SUBSAMPLING[subsampling]
+
+    def encode(self, array: numpy.ndarray, channel_order: ChannelOrder = "RGB") -> bytes:
+        if channel_order == "BGR":
+            array = array[..., ::-1]
+
+        byte_io = io.BytesIO()
+        Image.fromarray(array, "RGB").save(byte_io, format="JPEG", quality=self.__quality, subsampling=self.__subsampling)
+        return byte_io.getvalue()
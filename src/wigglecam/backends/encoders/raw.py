@@ -0,0 +1,32 @@
+import zlib
+from dataclasses import dataclass
+
+import numpy
+
+from ...dto import Codec, PixelFormat
+
+
+@dataclass
+class RawImage:
+    """Pixels of a hires frame in a layout the hub can use without the camera's buffer details, e.g. row padding."""
+
+    array: numpy.ndarray
+    pixel_format: PixelFormat
+    width: int
+    height: int
+
+
+def pack_raw(image: RawImage, codec: Codec) -> bytes | memoryview:
+    """Payload of a raw hires result. Uncompressed payloads are a view on the array, not a copy."""
+    data = memoryview(numpy.ascontiguousarray(image.array)).cast("B")
+
+    if codec is Codec.RAW:
+        return data
+    if codec is Codec.ZLIB:
+        return zlib.compress(data, 1)  # fastest level, most of the gain at a fraction of the time
+    if codec is Codec.LZ4:
+        import lz4.frame  # optional dependency, only needed if configured
+
+        return lz4.frame.compress(data)
+
+    raise ValueError(f"{codec.name} is not a raw codec")
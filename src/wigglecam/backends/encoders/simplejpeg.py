@@ -0,0 +1,20 @@
+import numpy
+import simplejpeg
+
+from .base import ChannelOrder, JpegEncoder, Subsampling
+
+
+class SimplejpegEncoder(JpegEncoder):
+    """libjpeg-turbo bindings, takes RGB and BGR without conversion."""
+
+    def __init__(self, quality: int = 90, subsampling: Subsampling = "420"):
+        self.__quality = quality
+        self.__subsampling = subsampling
+
+    def encode(self, array: numpy.ndarray, channel_order: ChannelOrder = "RGB") -> bytes:
+        return simplejpeg.encode_jpeg(
+            numpy.ascontiguousarray(array),  # frames cropped from padded camera buffers are not contiguous
+            quality=self.__quality,
+            colorspace=channel_order,
+            colorsubsampling=self.__subsampling,
+        )
@@ -0,0 +1,24 @@
+import numpy
+from turbojpeg import TJPF_BGR, TJPF_RGB, TJSAMP_420, TJSAMP_422, TJSAMP_444, TurboJPEG
+
+from .base import ChannelOrder, JpegEncoder, Subsampling
+
+_SUBSAMPLING = {"444": TJSAMP_444, "422": TJSAMP_422, "420": TJSAMP_420}
+_PIXEL_FORMATS = {"RGB": TJPF_RGB, "BGR": TJPF_BGR}
+
+
+class TurbojpegEncoder(JpegEncoder):
+    """libjpeg-turbo bindings (PyTurboJPEG), needs the libturbojpeg system library."""
+
+    def __init__(self, quality: int = 90, subsampling: Subsampling = "420"):
+        self.__quality = quality
+        self.__subsampling = _SUBSAMPLING[subsampling]
+        self.__turbojpeg = TurboJPEG()  # raises if the library is missing, auto selection continues with the next
+
+    def encode(self, array: numpy.ndarray, channel_order: ChannelOrder = "RGB") -> bytes:
+        return self.__turbojpeg.encode(
+            numpy.ascontiguousarray(array),  # frames cropped from padded camera buffers are not contiguous
+            quality=self.__quality,
+            pixel_format=_PIXEL_FORMATS[channel_order],
+            jpeg_subsample=self.__subsampling,
+        )
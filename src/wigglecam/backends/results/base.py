@@ -0,0 +1,10 @@
+import abc
+
+from .cache import ResultCache
+
+
+class ResultServer(abc.ABC):
+    @abc.abstractmethod
+    def __init__(self, *args, **kwargs): ...
+    @abc.abstractmethod
+    async def serve(self, cache: ResultCache): ...
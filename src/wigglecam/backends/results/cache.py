@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+from ...dto import ImageMessage
+
+logger = logging.getLogger(__name__)
+
+ResultKey = tuple[uuid.UUID, int]  # job_id, frame_index
+
+
+class ResultCache:
+    """Recent hires results of this node, so a hub can fetch results it missed.
+
+    Results are kept in memory up to max_bytes of payload, least recently used first out. If spill_dir is set, results
+    evicted from memory are written there and kept up to spill_max_bytes. Disk I/O runs in worker threads if an event
+    loop is running, results being written are served from memory meanwhile.
+    """
+
+    def __init__(self, max_bytes: int, spill_dir: Path | None = None, spill_max_bytes: int = 0):
+        self.__max_bytes = max_bytes
+        self.__spill_dir = spill_dir
+        self.__spill_max_bytes = spill_max_bytes
+
+        self.__lock = threading.Lock()
+        self.__memory: OrderedDict[ResultKey, ImageMessage] = OrderedDict()
+        self.__memory_bytes = 0
+        self.__spilled: OrderedDict[ResultKey, int] = OrderedDict()  # key -> file size
+        self.__spilled_bytes = 0
+        self.__spilling: dict[ResultKey, ImageMessage] = {}
+        self.__spill_tasks: set[asyncio.Task] = set()
+
+        if self.__spill_dir:
+            self.__spill_dir.mkdir(parents=True, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.__memory_bytes
+
+    def __len__(self) -> int:
+        return len(self.__memory) + len(self.__spilling) + len(self.__spilled)
+
+    def put(self, msg: ImageMessage):
+        if msg.job_id is None:
+            return
+
+        key = (msg.job_id, msg.frame_index)
+        size = len(msg.payload)
+
+        evicted = []
+        with self.__lock:
+            if key in self.__memory:
+                self.__memory_bytes -= len(self.__memory.pop(key).payload)
+
+            self.__memory[key] = msg
+            self.__memory_bytes += size
+
+            while self.__memory_bytes > self.__max_bytes and self.__memory:
+                evicted_key, evicted_msg = self.__memory.popitem(last=False)
+                self.__memory_bytes -= len(evicted_msg.payload)
+                if self.__spill_dir:
+                    self.__spilling[evicted_key] = evicted_msg
+                    evicted.append((evicted_key, evicted_msg))
+
+        for evicted_key, evicted_msg in evicted:
+            self._schedule_spill(evicted_key, evicted_msg)
+
+    async def get(self, job_id: uuid.UUID, frame_index: int = 0) -> ImageMessage | None:
+        key = (job_id, frame_index)
+
+        with self.__lock:
+            msg = self.__memory.get(key) or self.__spilling.get(key)
+            if key in self.__memory:
+                self.__memory.move_to_end(key)
+            spilled = msg is None and key in self.__spilled
+
+        if spilled:
+            try:
+                msg = ImageMessage.from_bytes(await asyncio.to_thread(self._spill_path(key).read_bytes))
+            except (OSError, ValueError) as exc:
+                logger.warning(f"could not read spilled result: {exc}")
+
+        if msg is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return msg
+
+    async def flush(self):
+        """Wait until the evicted results are written to disk."""
+        while self.__spill_tasks:
+            await asyncio.gather(*self.__spill_tasks)
+
+    def _spill_path(self, key: ResultKey) -> Path:
+        assert self.__spill_dir
+        return self.__spill_dir / f"{key[0]}_{key[1]:03d}.wgcm"
+
+    def _schedule_spill(self, key: ResultKey, msg: ImageMessage):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._spill(key, msg)  # used without event loop
+            return
+
+        task = loop.create_task(asyncio.to_thread(self._spill, key, msg))
+        self.__spill_tasks.add(task)
+        task.add_done_callback(self.__spill_tasks.discard)
+
+    def _spill(self, key: ResultKey, msg: ImageMessage):
+        """Blocking, write an evicted result to disk and delete the oldest spilled results beyond spill_max_bytes."""
+        data = msg.to_bytes()
+        written = False
+        if len(data) <= self.__spill_max_bytes:
+            try:
+                self._spill_path(key).write_bytes(data)
+                written = True
+            except OSError as exc:
+                logger.warning(f"could not spill result to disk: {exc}")
+
+        expired = []
+        with self.__lock:
+            self.__spilling.pop(key, None)
+            if written:
+                self.__spilled[key] = len(data)
+                self.__spilled_bytes += len(data)
+
+            while self.__spilled_bytes > self.__spill_max_bytes:
+                evicted_key, evicted_size = self.__spilled.popitem(last=False)
+                self.__spilled_bytes -= evicted_size
+                expired.append(evicted_key)
+
+        for evicted_key in expired:
+            self._spill_path(evicted_key).unlink(missing_ok=True)
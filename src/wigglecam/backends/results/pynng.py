@@ -0,0 +1,51 @@
+import dataclasses
+import logging
+
+import pynng
+
+from ...dto import FETCH_ANY_DEVICE, FLAG_CHUNK, FetchRequest
+from .base import ResultServer
+from .cache import ResultCache
+
+logger = logging.getLogger(__name__)
+
+
+class PynngResultServer(ResultServer):
+    """Rep0 endpoint answering FetchRequests from the cache. Replies an empty message if the result is unknown.
+    Requests for a range of the payload are answered with that range as chunk."""
+
+    def __init__(self, address: str):
+        self.__rep = pynng.Rep0()
+        self.__rep.listen(address=address)
+
+    def close(self):
+        self.__rep.close()
+
+    async def serve(self, cache: ResultCache):
+        while True:
+            data = await self.__rep.arecv()
+
+            try:
+                request = FetchRequest.from_bytes(data)
+            except ValueError as exc:
+                logger.warning(f"ignored invalid fetch request: {exc}")
+                await self.__rep.asend(b"")
+                continue
+
+            msg = await cache.get(request.job_id, request.frame_index)
+            if msg is None or request.device_id not in (FETCH_ANY_DEVICE, msg.device_id):
+                await self.__rep.asend(b"")
+                continue
+
+            if request.length:
+                payload = memoryview(msg.payload)
+                msg = dataclasses.replace(
+                    msg,
+                    payload=payload[request.chunk_offset : request.chunk_offset + request.length],
+                    flags=msg.flags | FLAG_CHUNK,
+                    chunk_offset=request.chunk_offset,
+                    total_len=len(payload),
+                )
+
+            logger.info(f"result fetched, job_id={request.job_id} frame_index={request.frame_index} {len(msg.payload)} bytes")
+            await self.__rep.asend(msg.to_bytes())
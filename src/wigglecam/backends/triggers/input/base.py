@@ -1,9 +1,34 @@
 import abc
 import uuid
+from collections.abc import Callable
+
+from ....dto import ChunkAck, StreamControlMessage, TriggerMessage
 
 
 class TriggerInput(abc.ABC):
     @abc.abstractmethod
-    def __init__(self, *args, **kwargs): ...
+    def __init__(self, *args, **kwargs):
+        self.__control_listeners: list[Callable[[StreamControlMessage], None]] = []
+        self.__chunk_ack_listeners: list[Callable[[ChunkAck], None]] = []
+
     @abc.abstractmethod
-    async def receive_job_id(self) -> uuid.UUID: ...
+    async def receive_trigger(self) -> TriggerMessage: ...
+
+    async def receive_job_id(self) -> uuid.UUID:
+        return (await self.receive_trigger()).job_id
+
+    def add_control_listener(self, listener: Callable[[StreamControlMessage], None]):
+        """Call listener with every stream control message the hub sends on the trigger channel."""
+        self.__control_listeners.append(listener)
+
+    def _dispatch_control(self, msg: StreamControlMessage):
+        for listener in self.__control_listeners:
+            listener(msg)
+
+    def add_chunk_ack_listener(self, listener: Callable[[ChunkAck], None]):
+        """Call listener with every chunk acknowledgement the hub sends on the trigger channel."""
+        self.__chunk_ack_listeners.append(listener)
+
+    def _dispatch_chunk_ack(self, ack: ChunkAck):
+        for listener in self.__chunk_ack_listeners:
+            listener(ack)
@@ -1,17 +1,43 @@
-import uuid
+import logging
 
 import pynng
 
+from ....dto import CHUNK_ACK_MAGIC, CONTROL_MAGIC, ChunkAck, StreamControlMessage, TriggerMessage
+from ....tracing import TRACER
 from .base import TriggerInput
 
+logger = logging.getLogger(__name__)
+
 
 class PynngTriggerInput(TriggerInput):
     def __init__(self, address: str):
+        super().__init__()
+
         self.__sub = pynng.Sub0()
         self.__sub.subscribe(b"")
         self.__sub.listen(address=address)
 
-    async def receive_job_id(self) -> uuid.UUID:
-        """Encapsulates arecv and converts to UUID."""
-        msg = await self.__sub.arecv()
-        return uuid.UUID(bytes=msg)
+    def close(self):
+        self.__sub.close()
+
+    async def receive_trigger(self) -> TriggerMessage:
+        """Encapsulates arecv and converts to TriggerMessage, plain job UUIDs are accepted also.
+        Stream control messages and chunk acknowledgements arriving meanwhile are passed to their listeners."""
+        while True:
+            msg = await self.__sub.arecv()
+            try:
+                if msg[:4] == CONTROL_MAGIC:
+                    self._dispatch_control(StreamControlMessage.from_bytes(msg))
+                    continue
+                if msg[:4] == CHUNK_ACK_MAGIC:
+                    self._dispatch_chunk_ack(ChunkAck.from_bytes(msg))
+                    continue
+
+                trigger = TriggerMessage.from_bytes(msg)
+            except ValueError as exc:
+                # a malformed or unknown message must not stop the node from receiving triggers
+                logger.warning(f"skipped invalid message on the trigger input: {exc}")
+                continue
+
+            TRACER.instant("trigger_received", trigger.job_id, frames=trigger.frames)
+            return trigger
@@ -1,3 +1,7 @@
+from pathlib import Path
+from typing import Literal
+
+from pydantic import Field
 from pydantic_settings import SettingsConfigDict
 
 from .base import CfgBaseSettings
@@ -5,3 +9,44 @@ from .base import CfgBaseSettings
 
 class CfgApp(CfgBaseSettings):
     model_config = SettingsConfigDict(env_prefix="app_")
+
+    job_queue_size: int = Field(default=8, ge=1, description="Number of triggered jobs waiting for capture.")
+    job_queue_overflow: Literal["drop_oldest", "drop_newest"] = Field(
+        default="drop_oldest",
+        description="Which job to drop if a trigger arrives while the queue is full.",
+    )
+    job_dedupe_size: int = Field(default=128, ge=0, description="Number of recent job ids remembered to ignore retried triggers.")
+    job_deadline_ms: int = Field(
+        default=3000,
+        ge=0,
+        description="Jobs waiting longer than this since their trigger are cancelled instead of captured. 0 disables.",
+    )
+    job_pipeline_depth: int = Field(
+        default=2,
+        ge=1,
+        description="Number of jobs that may be in flight at once, so the next capture starts while previous results are encoded or sent.",
+    )
+
+    result_cache_max_bytes: int = Field(
+        default=64 * 1024 * 1024,
+        ge=0,
+        description="Keep recent hires results in memory up to this many bytes, so a hub can fetch results it missed. 0 disables the cache.",
+    )
+    result_cache_spill_dir: Path | None = Field(
+        default=None,
+        description="Write results evicted from memory to this directory instead of dropping them.",
+    )
+    result_cache_spill_max_bytes: int = Field(default=512 * 1024 * 1024, ge=0, description="Disk space used in result_cache_spill_dir.")
+
+    metrics_enabled: bool = Field(default=True, description="Serve metrics in the Prometheus text format over HTTP on base_port + 4.")
+
+    time_sync_address: str | None = Field(
+        default=None,
+        description="Address of the hub time server, e.g. tcp://hub:5549. The node estimates its clock offset to the hub, so triggers scheduled by the hub fire at the same moment on all nodes. Without it the clocks are assumed to be synchronized (NTP/PTP).",
+    )
+    time_sync_interval_ms: int = Field(default=1000, ge=100, description="Interval of clock offset measurements once synced.")
+
+    discovery_enabled: bool = Field(default=True, description="Announce the node by UDP multicast, so hubs find it and notice when it is gone.")
+    discovery_group: str = Field(default="239.255.77.77", description="Multicast group the announcements are sent to.")
+    discovery_port: int = Field(default=5548)
+    discovery_interval_ms: int = Field(default=500, ge=100, description="Interval of announcements, hubs consider the node dead after 3 missed ones.")
@@ -0,0 +1,80 @@
+from typing import Literal
+
+from pydantic import Field
+from pydantic_settings import SettingsConfigDict
+
+from .base import CfgBaseSettings
+
+
+class CfgCameraCommon(CfgBaseSettings):
+    """Settings shared by all camera backends, handled in the CameraBackend base class."""
+
+    model_config = SettingsConfigDict(env_prefix="camera_")
+
+    zsl_ring_size: int = Field(
+        default=0,
+        ge=0,
+        description="Zero shutter lag: keep the last N full resolution frames and on trigger encode the one closest to the trigger time instead of capturing a new frame. 0 disables.",
+    )
+    zsl_max_offset_ms: int = Field(
+        default=250,
+        ge=0,
+        description="If the closest frame in the ring is further away from the trigger time, a new frame is captured instead.",
+    )
+
+    lores_idle_mode: Literal["off", "pause", "keepalive"] = Field(
+        default="pause",
+        description="What to do with the lores stream while no subscriber is connected. Pause stops encoding, keepalive sends a frame every lores_keepalive_interval_ms.",
+    )
+    lores_keepalive_interval_ms: int = Field(default=1000, ge=100)
+    lores_gate_enabled: bool = Field(
+        default=False,
+        description="Skip lores frames whose content barely changed since the last sent frame, to save network and hub decode load while the booth is idle.",
+    )
+    lores_gate_threshold: float = Field(
+        default=2.0,
+        ge=0,
+        description="Mean difference of the downscaled grayscale frames in gray levels (0-255) a lores frame needs to be sent.",
+    )
+    lores_gate_refresh_ms: int = Field(default=1000, ge=0, description="Send a lores frame at least this often, changed or not.")
+
+    hires_chunk_size: int = Field(
+        default=0,
+        ge=0,
+        description="Send hires results in chunks of this many bytes, so large results do not block the link for other traffic and the hub can write incrementally. 0 sends one message.",
+    )
+    hires_chunk_max_rate: int = Field(
+        default=0,
+        ge=0,
+        description="Limit chunked hires transfers to this many bytes per second, 0 does not limit.",
+    )
+    hires_chunk_window: int = Field(
+        default=8,
+        ge=0,
+        description="Send at most this many chunks ahead of the last chunk the hub acknowledged, so the output does not drop chunks. 0 sends without waiting for acknowledgements.",
+    )
+    hires_chunk_ack_timeout_ms: int = Field(
+        default=200,
+        ge=0,
+        description="Send the next window of chunks if no acknowledgement arrived within this time, the hub fetches chunks it missed.",
+    )
+
+    hires_encoder: Literal["auto", "simplejpeg", "turbojpeg", "opencv", "pil"] = Field(
+        default="auto",
+        description="Library to encode hires frames, auto uses the fastest one installed (simplejpeg, turbojpeg, opencv, pil).",
+    )
+    hires_jpeg_quality: int = Field(default=90, ge=1, le=100)
+    hires_jpeg_subsampling: Literal["444", "422", "420"] = Field(
+        default="420",
+        description="Chroma subsampling of hires JPEGs, 444 keeps full color resolution at the cost of size and encode time.",
+    )
+    hires_encode_workers: int = Field(
+        default=2,
+        ge=1,
+        description="Threads encoding hires frames, so bursts and pipelined jobs encode in parallel while the camera captures.",
+    )
+
+    hires_codec: Literal["jpeg", "raw", "zlib", "lz4"] = Field(
+        default="jpeg",
+        description="Send hires results as JPEG or unencoded pixels (YUV420 on the Pi) for post-processing on the hub, optionally compressed lossless. lz4 needs the lz4 package.",
+    )
@@ -23,6 +23,8 @@ class CfgCameraPicamera2(CfgBaseSettings):
 
     stream_res_width: int = Field(default=1152)
     stream_res_height: int = Field(default=648)
+    thumbnail_res_width: int = Field(default=320)
+    thumbnail_res_height: int = Field(default=180)
     frame_skip_count: int = Field(
         default=2,
         ge=1,
@@ -10,3 +10,21 @@ class CfgCameraVirtual(CfgBaseSettings):
     # server: str = Field(default="0.0.0.0")
 
     fps_nominal: int = Field(default=10)
+
+    lores_res_width: int = Field(default=250)
+    lores_res_height: int = Field(default=250)
+    hires_res_width: int = Field(default=2304)
+    hires_res_height: int = Field(default=1296)
+    thumbnail_res_width: int = Field(default=125)
+    thumbnail_res_height: int = Field(default=125)
+
+    jpeg_quality: int = Field(default=70, ge=1, le=100)
+    cache_size: int = Field(
+        default=25,
+        ge=1,
+        description="Number of pre-rendered encoded frames kept per resolution. The frames are replayed in a ring, so the virtual camera is a cheap load generator.",
+    )
+    live_encode: bool = Field(
+        default=False,
+        description="Render and encode every frame at the configured resolution instead of replaying the cache, to emulate the CPU load of a real node.",
+    )
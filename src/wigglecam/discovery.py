@@ -0,0 +1,58 @@
+import asyncio
+import logging
+import socket
+from collections.abc import Callable
+
+from .dto import FLAG_BYE, FLAG_READY, AnnounceMessage
+
+logger = logging.getLogger(__name__)
+
+DISCOVERY_GROUP = "239.255.77.77"  # organization-local scope, not routed beyond the site
+DISCOVERY_PORT = 5548
+
+
+class Announcer:
+    """Announces the node by UDP multicast every interval_s, the announcements are its heartbeat also.
+
+    On shutdown a bye is sent, so hubs do not wait for the heartbeat to time out.
+    """
+
+    def __init__(
+        self,
+        device_id: int,
+        base_port: int,
+        capabilities: int = 0,
+        interval_s: float = 0.5,
+        group: str = DISCOVERY_GROUP,
+        port: int = DISCOVERY_PORT,
+    ):
+        self.__device_id = device_id
+        self.__base_port = base_port
+        self.__capabilities = capabilities
+        self.__interval_s = interval_s
+        self.__destination = (group, port)
+
+        self.__sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.__sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+        self.__sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)  # hubs on the same host
+        self.__sock.setblocking(False)
+
+    def close(self):
+        self.__sock.close()
+
+    def announce(self, flags: int = 0):
+        msg = AnnounceMessage(self.__device_id, self.__base_port, self.__capabilities, int(self.__interval_s * 1000), flags=flags)
+        try:
+            self.__sock.sendto(msg.to_bytes(), self.__destination)
+        except OSError as exc:
+            # e.g. no network yet, the next heartbeat tries again
+            logger.debug(f"announcement failed: {exc}")
+
+    async def run(self, is_ready: Callable[[], bool] = lambda: True):
+        logger.info(f"announcing device_id={self.__device_id} to {self.__destination[0]}:{self.__destination[1]}")
+        try:
+            while True:
+                self.announce(FLAG_READY if is_ready() else 0)
+                await asyncio.sleep(self.__interval_s)
+        finally:
+            self.announce(FLAG_BYE)
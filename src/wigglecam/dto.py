@@ -1,25 +1,480 @@
 import struct
 import uuid
 from dataclasses import dataclass
+from enum import IntEnum
+
+# Wire format v1+ (little-endian):
+#   prefix: magic (4s), version (B), flags (B), header_len (H)
+#   body:   per version, see _BODY_STRUCTS. Later versions only append fields, so a reader
+#           decodes the fields it knows and uses header_len to find the payload.
+#   payload: header_len bytes after start of message, payload_len bytes long.
+# Wire format v0 (legacy, native order, no prefix): device_id (i), jpg_len (I), uuid (16s), payload.
+MAGIC = b"WGCM"
+VERSION = 5
+
+FLAG_CHUNK = 0x01  # payload is the part of a larger payload at chunk_offset, total_len long
+FLAG_READY = 0x02  # node started and has its first frame, sent once on the lores stream without payload
+FLAG_BYE = 0x04  # node shuts down, sent once as AnnounceMessage
+FLAG_THUMBNAIL = 0x08  # lores frame of the thumbnail level, see StreamLevel
+
+_PREFIX_STRUCT = struct.Struct("<4sBBH")
+_BODY_FIELDS = (
+    "device_id",
+    "payload_len",
+    "job_id",
+    "timestamp_ns",
+    "sequence",
+    "sync_state",
+    "frame_index",
+    "frame_count",
+    "chunk_offset",
+    "total_len",
+    "codec",
+    "pixel_format",
+    "width",
+    "height",
+)
+_BODY_STRUCTS = {
+    1: struct.Struct("<iI16s"),  # device_id, payload_len, uuid (16 Bytes)
+    2: struct.Struct("<iI16sqIB"),  # v1 + sensor timestamp (wall clock ns), frame sequence, sync state
+    3: struct.Struct("<iI16sqIBHH"),  # v2 + frame index and frame count of a burst
+    4: struct.Struct("<iI16sqIBHHII"),  # v3 + chunk offset and total payload length of chunked transfers
+    5: struct.Struct("<iI16sqIBHHIIBBHH"),  # v4 + codec, pixel format, width and height of the payload
+}
+_V0_STRUCT = struct.Struct("iI16s")
+_NULL_UUID = b"\x00" * 16
+
+
+@dataclass(frozen=True)
+class _MessageFormat:
+    """Wire format of the messages without payload: the ImageMessage prefix and a body per version."""
+
+    name: str
+    magic: bytes
+    version: int
+    fields: tuple[str, ...]
+    structs: dict[int, struct.Struct]
+
+    def pack(self, flags: int, *values) -> bytes:
+        body_struct = self.structs[self.version]
+        header_len = _PREFIX_STRUCT.size + body_struct.size
+
+        return _PREFIX_STRUCT.pack(self.magic, self.version, flags, header_len) + body_struct.pack(*values)
+
+    def unpack(self, view: memoryview) -> tuple[int, dict]:
+        """Flags and body fields. Newer versions are decoded as far as this version knows them."""
+        if len(view) < _PREFIX_STRUCT.size or view[:4] != self.magic:
+            raise ValueError(f"invalid {self.name}")
+
+        _, version, flags, _ = _PREFIX_STRUCT.unpack_from(view)
+        known_version = min(version, self.version)
+        if known_version < 1:
+            raise ValueError(f"invalid {self.name} version {version}")
+
+        body_struct = self.structs[known_version]
+        if len(view) < _PREFIX_STRUCT.size + body_struct.size:
+            raise ValueError(f"{self.name} truncated")
+
+        return flags, dict(zip(self.fields, body_struct.unpack_from(view, _PREFIX_STRUCT.size), strict=False))
+
+
+class SyncState(IntEnum):
+    OFF = 0  # node does not sync or state unknown
+    WAITING = 1  # sync enabled but not yet locked to the server
+    READY = 2
+
+
+class Codec(IntEnum):
+    JPEG = 0
+    RAW = 1  # uncompressed pixels as described by pixel_format, width and height
+    ZLIB = 2  # RAW compressed with zlib
+    LZ4 = 3  # RAW compressed with lz4 frame
+
+
+class PixelFormat(IntEnum):
+    UNKNOWN = 0  # JPEG payloads describe themselves
+    I420 = 1  # YUV 4:2:0 planar, full size Y plane, then U and V planes, no row padding
+    RGB888 = 2  # 3 bytes per pixel in R, G, B order, no row padding
+    BGR888 = 3
+
+
+class StreamLevel(IntEnum):
+    LORES = 0  # the full lores stream
+    THUMBNAIL = 1  # downscaled for grid views of many nodes
 
 
 @dataclass
 class ImageMessage:
     device_id: int
-    jpg_bytes: bytes
+    payload: bytes | bytearray | memoryview
     job_id: uuid.UUID | None = None
+    flags: int = 0
+    timestamp_ns: int = 0  # sensor timestamp converted to wall clock, 0 if unknown
+    sequence: int = 0  # frame sequence number of the sensor
+    sync_state: SyncState = SyncState.OFF
+    frame_index: int = 0  # position in a burst job
+    frame_count: int = 1
+    chunk_offset: int = 0  # only used if flags has FLAG_CHUNK
+    total_len: int = 0
+    codec: Codec = Codec.JPEG  # of the payload, JPEG or a raw format
+    pixel_format: PixelFormat = PixelFormat.UNKNOWN
+    width: int = 0  # of raw payloads, 0 if unknown
+    height: int = 0
+
+    @property
+    def jpg_bytes(self) -> bytes | bytearray | memoryview:
+        """Deprecated alias of payload, which holds raw and compressed frames too."""
+        return self.payload
+
+    @property
+    def is_chunk(self) -> bool:
+        return bool(self.flags & FLAG_CHUNK)
+
+    @property
+    def is_ready(self) -> bool:
+        return bool(self.flags & FLAG_READY)
+
+    @property
+    def level(self) -> StreamLevel:
+        return StreamLevel.THUMBNAIL if self.flags & FLAG_THUMBNAIL else StreamLevel.LORES
+
+    def header_bytes(self) -> bytes:
+        body_struct = _BODY_STRUCTS[VERSION]
+        header_len = _PREFIX_STRUCT.size + body_struct.size
+        sid_bytes = self.job_id.bytes if self.job_id else _NULL_UUID
+
+        return _PREFIX_STRUCT.pack(MAGIC, VERSION, self.flags, header_len) + body_struct.pack(
+            self.device_id,
+            len(self.payload),
+            sid_bytes,
+            self.timestamp_ns,
+            self.sequence,
+            self.sync_state,
+            self.frame_index,
+            self.frame_count,
+            self.chunk_offset,
+            self.total_len,
+            self.codec,
+            self.pixel_format,
+            self.width,
+            self.height,
+        )
+
+    def to_segments(self) -> tuple[bytes, bytes | bytearray | memoryview]:
+        """Header and payload as separate segments, the payload is not copied."""
+        return self.header_bytes(), self.payload
+
+    def pack_into(self, buffer: bytearray) -> memoryview:
+        """Serialize into a reusable buffer that is grown if needed. Returns a view on the written part."""
+        header = self.header_bytes()
+        total_len = len(header) + len(self.payload)
+        if len(buffer) < total_len:
+            buffer.extend(bytes(total_len - len(buffer)))
+
+        view = memoryview(buffer)
+        view[: len(header)] = header
+        view[len(header) : total_len] = self.payload
+
+        return view[:total_len]
+
+    def to_bytes(self) -> bytes:
+        return b"".join(self.to_segments())
+
+    @classmethod
+    def from_bytes(cls, data: bytes | bytearray | memoryview) -> "ImageMessage":
+        """Decode v0 and v1+ messages. The payload is a memoryview on data, no copy is made."""
+        view = memoryview(data)
+
+        if len(view) >= _PREFIX_STRUCT.size and view[:4] == MAGIC:
+            _, version, flags, header_len = _PREFIX_STRUCT.unpack_from(view)
+            known_version = min(version, VERSION)
+            if known_version < 1:
+                raise ValueError(f"invalid ImageMessage version {version}")
+
+            body_struct = _BODY_STRUCTS[known_version]
+            if len(view) < _PREFIX_STRUCT.size + body_struct.size:
+                raise ValueError("ImageMessage header truncated")
+            fields = dict(zip(_BODY_FIELDS, body_struct.unpack_from(view, _PREFIX_STRUCT.size), strict=False))
+        else:
+            flags = 0
+            header_len = _V0_STRUCT.size
+            if len(view) < header_len:
+                raise ValueError("ImageMessage header truncated")
+            fields = dict(zip(_BODY_FIELDS, _V0_STRUCT.unpack_from(view), strict=False))
+
+        payload_len = fields.pop("payload_len")
+        if len(view) < header_len + payload_len:
+            raise ValueError(f"ImageMessage truncated, expected {header_len + payload_len} bytes, got {len(view)}")
+
+        uuid_bytes = fields.pop("job_id")
+        job_id = None if uuid_bytes == _NULL_UUID else uuid.UUID(bytes=uuid_bytes)
+        if "sync_state" in fields:
+            fields["sync_state"] = SyncState(fields["sync_state"])
+        if "codec" in fields:
+            fields["codec"] = Codec(fields["codec"])
+            fields["pixel_format"] = PixelFormat(fields["pixel_format"])
+
+        return cls(payload=view[header_len : header_len + payload_len], job_id=job_id, flags=flags, **fields)
+
+
+# Trigger wire format v1+ (little-endian), same prefix as ImageMessage but without payload.
+# Trigger wire format v0 (legacy): the 16 bytes of the job uuid only.
+TRIGGER_MAGIC = b"WGCT"
+TRIGGER_VERSION = 2
+
+_TRIGGER_FORMAT = _MessageFormat(
+    "TriggerMessage",
+    TRIGGER_MAGIC,
+    TRIGGER_VERSION,
+    ("job_id", "frames", "interval_us", "capture_at_ns"),
+    {
+        1: struct.Struct("<16sHI"),  # uuid (16 Bytes), frames in burst, interval between burst frames
+        2: struct.Struct("<16sHIq"),  # v1 + scheduled capture time (hub wall clock ns)
+    },
+)
+
+
+@dataclass
+class TriggerMessage:
+    job_id: uuid.UUID
+    frames: int = 1  # more than 1 requests a burst
+    interval_us: int = 0  # 0 means as fast as the camera delivers frames
+    capture_at_ns: int = 0  # hub wall clock, nodes convert it with their clock offset. 0 captures on arrival
+    flags: int = 0
+
+    def to_bytes(self) -> bytes:
+        return _TRIGGER_FORMAT.pack(
+            self.flags,
+            self.job_id.bytes,
+            self.frames,
+            self.interval_us,
+            self.capture_at_ns,
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes | bytearray | memoryview) -> "TriggerMessage":
+        view = memoryview(data)
+
+        if len(view) == 16:
+            return cls(job_id=uuid.UUID(bytes=bytes(view)))
+
+        flags, fields = _TRIGGER_FORMAT.unpack(view)
+        fields["job_id"] = uuid.UUID(bytes=fields["job_id"])
+
+        return cls(flags=flags, **fields)
+
+
+# Fetch request wire format v2 (little-endian), same prefix as ImageMessage but without payload. The node replies with
+# the cached ImageMessage or an empty message if it does not have the result. With a length, the node replies with that
+# range of the payload as chunk, to repair a chunked transfer that lost chunks.
+FETCH_MAGIC = b"WGCF"
+FETCH_VERSION = 2
+
+FETCH_ANY_DEVICE = -1
+
+_FETCH_FORMAT = _MessageFormat(
+    "FetchRequest",
+    FETCH_MAGIC,
+    FETCH_VERSION,
+    ("job_id", "device_id", "frame_index", "chunk_offset", "length"),
+    {
+        1: struct.Struct("<16siH"),  # uuid (16 Bytes), device_id (-1 for any), frame index in burst
+        2: struct.Struct("<16siHII"),  # v1 + offset and length of a payload range, length 0 for the whole result
+    },
+)
+
+
+@dataclass
+class FetchRequest:
+    job_id: uuid.UUID
+    device_id: int = FETCH_ANY_DEVICE
+    frame_index: int = 0
+    chunk_offset: int = 0
+    length: int = 0  # 0 for the whole result
+    flags: int = 0
+
+    def to_bytes(self) -> bytes:
+        return _FETCH_FORMAT.pack(
+            self.flags,
+            self.job_id.bytes,
+            self.device_id,
+            self.frame_index,
+            self.chunk_offset,
+            self.length,
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes | bytearray | memoryview) -> "FetchRequest":
+        flags, fields = _FETCH_FORMAT.unpack(memoryview(data))
+        fields["job_id"] = uuid.UUID(bytes=fields["job_id"])
+
+        return cls(flags=flags, **fields)
+
+
+# Stream control wire format v1 (little-endian), same prefix as ImageMessage but without payload. Sent by the hub on
+# the trigger channel to select the level of the lores stream of one or all nodes.
+CONTROL_MAGIC = b"WGCL"
+CONTROL_VERSION = 1
+
+CONTROL_ANY_DEVICE = -1
+
+_CONTROL_FORMAT = _MessageFormat(
+    "StreamControlMessage",
+    CONTROL_MAGIC,
+    CONTROL_VERSION,
+    ("device_id", "level"),
+    {
+        1: struct.Struct("<iB"),  # device_id (-1 for all), lores stream level
+    },
+)
+
+
+@dataclass
+class StreamControlMessage:
+    device_id: int = CONTROL_ANY_DEVICE
+    level: StreamLevel = StreamLevel.LORES
+    flags: int = 0
+
+    def to_bytes(self) -> bytes:
+        return _CONTROL_FORMAT.pack(
+            self.flags,
+            self.device_id,
+            self.level,
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes | bytearray | memoryview) -> "StreamControlMessage":
+        flags, fields = _CONTROL_FORMAT.unpack(memoryview(data))
+        fields["level"] = StreamLevel(fields["level"])
+
+        return cls(flags=flags, **fields)
+
+
+# Chunk acknowledgement wire format v1 (little-endian), same prefix as ImageMessage but without payload. Sent by the hub
+# on the trigger channel while it receives a chunked transfer, the node sends at most a window of chunks ahead.
+CHUNK_ACK_MAGIC = b"WGCK"
+CHUNK_ACK_VERSION = 1
+
+_CHUNK_ACK_FORMAT = _MessageFormat(
+    "ChunkAck",
+    CHUNK_ACK_MAGIC,
+    CHUNK_ACK_VERSION,
+    ("job_id", "device_id", "frame_index", "received_len"),
+    {
+        1: struct.Struct("<16siHI"),  # uuid (16 Bytes), device_id, frame index in burst, end of the last chunk received
+    },
+)
+
+
+@dataclass
+class ChunkAck:
+    job_id: uuid.UUID
+    device_id: int
+    frame_index: int = 0
+    received_len: int = 0
+    flags: int = 0
+
+    def to_bytes(self) -> bytes:
+        return _CHUNK_ACK_FORMAT.pack(
+            self.flags,
+            self.job_id.bytes,
+            self.device_id,
+            self.frame_index,
+            self.received_len,
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes | bytearray | memoryview) -> "ChunkAck":
+        flags, fields = _CHUNK_ACK_FORMAT.unpack(memoryview(data))
+        fields["job_id"] = uuid.UUID(bytes=fields["job_id"])
+
+        return cls(flags=flags, **fields)
+
+
+# Time sync wire format v1 (little-endian), same prefix as ImageMessage but without payload. NTP-style exchange: the
+# node sends origin_ns, the hub replies with origin_ns echoed and its receive and transmit time.
+TIMESYNC_MAGIC = b"WGCS"
+TIMESYNC_VERSION = 1
+
+_TIMESYNC_FORMAT = _MessageFormat(
+    "TimeSyncMessage",
+    TIMESYNC_MAGIC,
+    TIMESYNC_VERSION,
+    ("origin_ns", "receive_ns", "transmit_ns"),
+    {
+        1: struct.Struct("<qqq"),  # node send time, hub receive time, hub send time (wall clock ns)
+    },
+)
+
+
+@dataclass
+class TimeSyncMessage:
+    origin_ns: int
+    receive_ns: int = 0
+    transmit_ns: int = 0
+    flags: int = 0
+
+    def to_bytes(self) -> bytes:
+        return _TIMESYNC_FORMAT.pack(
+            self.flags,
+            self.origin_ns,
+            self.receive_ns,
+            self.transmit_ns,
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes | bytearray | memoryview) -> "TimeSyncMessage":
+        flags, fields = _TIMESYNC_FORMAT.unpack(memoryview(data))
+        return cls(flags=flags, **fields)
+
+
+# Announce wire format v1 (little-endian), same prefix as ImageMessage but without payload. Sent by UDP multicast
+# periodically, so it is the heartbeat of the node also. The host is the source address of the datagram.
+ANNOUNCE_MAGIC = b"WGCA"
+ANNOUNCE_VERSION = 1
+
+CAP_TCP_OUTPUT = 0x01  # lores and hires are served on base_port + 1 and + 2 over tcp, otherwise only on the same host
+CAP_RESULT_FETCH = 0x02  # result cache served on base_port + 3
+CAP_METRICS = 0x04  # metrics served on base_port + 4
+CAP_CLOCK_SYNC = 0x08  # syncs its clock to the hub, scheduled triggers are aligned
+
+_ANNOUNCE_FORMAT = _MessageFormat(
+    "AnnounceMessage",
+    ANNOUNCE_MAGIC,
+    ANNOUNCE_VERSION,
+    ("device_id", "base_port", "capabilities", "interval_ms"),
+    {
+        1: struct.Struct("<iHIH"),  # device_id, base_port, capability bits, interval until the next announcement
+    },
+)
+
+
+@dataclass
+class AnnounceMessage:
+    device_id: int
+    base_port: int
+    capabilities: int = 0
+    interval_ms: int = 1000
+    flags: int = 0  # FLAG_READY once the camera delivers frames, FLAG_BYE on shutdown
+
+    @property
+    def is_ready(self) -> bool:
+        return bool(self.flags & FLAG_READY)
 
-    _header_fmt = "iI16s"  # device_id, jpg_len, uuid (16 Bytes)
+    @property
+    def is_bye(self) -> bool:
+        return bool(self.flags & FLAG_BYE)
 
     def to_bytes(self) -> bytes:
-        sid_bytes = self.job_id.bytes if self.job_id else b"\x00" * 16
-        header = struct.pack(self._header_fmt, self.device_id, len(self.jpg_bytes), sid_bytes)
-        return header + self.jpg_bytes
+        return _ANNOUNCE_FORMAT.pack(
+            self.flags,
+            self.device_id,
+            self.base_port,
+            self.capabilities,
+            self.interval_ms,
+        )
 
     @classmethod
-    def from_bytes(cls, data: bytes) -> "ImageMessage":
-        header_size = struct.calcsize(cls._header_fmt)
-        device_id, jpg_len, uuid_bytes = struct.unpack(cls._header_fmt, data[:header_size])
-        jpg_bytes = data[header_size : header_size + jpg_len]
-        job_id = None if uuid_bytes == b"\x00" * 16 else uuid.UUID(bytes=uuid_bytes)
-        return cls(device_id, jpg_bytes, job_id)
+    def from_bytes(cls, data: bytes | bytearray | memoryview) -> "AnnounceMessage":
+        flags, fields = _ANNOUNCE_FORMAT.unpack(memoryview(data))
+        return cls(flags=flags, **fields)
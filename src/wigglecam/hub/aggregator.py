@@ -0,0 +1,288 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from enum import Enum
+
+from ..dto import ImageMessage
+from ..tracing import TRACER
+from .latency import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+ResultKey = tuple[int, int]  # device_id, frame_index
+Recover = Callable[[uuid.UUID, list[ResultKey]], Awaitable[list[ImageMessage]]]
+
+
+class JobStatus(Enum):
+    COMPLETE = "complete"  # all expected results received
+    PARTIAL = "partial"  # timed out with some results
+    FAILED = "failed"  # timed out without any result
+
+
+@dataclass
+class JobResult:
+    job_id: uuid.UUID
+    status: JobStatus
+    results: dict[ResultKey, ImageMessage]
+    expected: int
+    missing: list[ResultKey]
+    duration_s: float
+    deadline_s: float = 0.0
+
+
+@dataclass
+class _PendingJob:
+    job_id: uuid.UUID
+    device_ids: set[int] | None  # None if only the number of devices is known
+    device_count: int
+    frames: int
+    future: asyncio.Future[JobResult]
+    deadline_s: float = 0.0
+    capture_delay_s: float = 0.0  # of scheduled triggers, not counted as latency
+    started: float = field(default_factory=time.monotonic)
+    started_ns: int = field(default_factory=time.time_ns)  # wall clock for the trace
+    results: dict[ResultKey, ImageMessage] = field(default_factory=dict)
+    lost_device_ids: set[int] = field(default_factory=set)  # left while the job was in flight, not waited for
+    last_result: dict[int, float] = field(default_factory=dict)  # per device, to measure the gaps within bursts
+    timeout_handle: asyncio.TimerHandle | None = None
+
+    @property
+    def expected(self) -> int:
+        return self.device_count * self.frames
+
+    @property
+    def capture_start(self) -> float:
+        return self.started + self.capture_delay_s
+
+    def waits_only_for_lost(self) -> bool:
+        if len(self.results) >= self.expected:
+            return True
+        return self.device_ids is not None and all(device_id in self.lost_device_ids for device_id, _ in self.missing(set()))
+
+    def missing(self, known_device_ids: set[int]) -> list[ResultKey]:
+        device_ids = self.device_ids if self.device_ids is not None else known_device_ids
+        return [(device_id, index) for device_id in sorted(device_ids) for index in range(self.frames) if (device_id, index) not in self.results]
+
+
+@dataclass
+class AggregatorStats:
+    completed: int = 0
+    partial: int = 0
+    failed: int = 0
+    duplicates: int = 0
+    unknown: int = 0  # results of jobs not started or already finished
+    late: int = 0  # results of jobs that finished at their deadline already
+
+
+class JobAggregator:
+    """Correlates hires results to any number of in-flight jobs by (job_id, device_id, frame_index).
+
+    Every started job gets a future that resolves with a JobResult once all results arrived or its deadline passed.
+    The deadline adapts to the latencies observed per device (see LatencyTracker), timeout_s is the upper bound and
+    the deadline until enough latencies were observed.
+    Before a timed out job resolves, recover is awaited with the missing results, e.g. ResultFetcher.fetch_missing.
+    The callbacks are an alternative to awaiting the futures: on_result is called for every result of a known job,
+    on_job_done for every finished job.
+    """
+
+    def __init__(
+        self,
+        device_count: int,
+        timeout_s: float = 5.0,
+        recover: Recover | None = None,
+        on_result: Callable[[ImageMessage], None] | None = None,
+        on_job_done: Callable[[JobResult], None] | None = None,
+        finished_history: int = 128,
+        latency: LatencyTracker | None = None,
+    ):
+        self.__device_count = device_count
+        self.__timeout_s = timeout_s
+        self.__recover = recover
+        self.__on_result = on_result
+        self.__on_job_done = on_job_done
+        self.__finished_history = finished_history
+
+        self.__jobs: dict[uuid.UUID, _PendingJob] = {}
+        # capture start and devices that delivered in time per finished job, to measure the latency of late results
+        self.__finished: OrderedDict[uuid.UUID, tuple[float, set[int]]] = OrderedDict()
+        self.__finalize_tasks: set[asyncio.Task] = set()
+        self.__known_device_ids: set[int] = set()
+
+        self.latency = latency or LatencyTracker()
+        self.slow_device_ids: set[int] = set()
+
+        self.stats = AggregatorStats()
+
+    @property
+    def in_flight(self) -> list[uuid.UUID]:
+        return list(self.__jobs)
+
+    def start_job(
+        self, job_id: uuid.UUID, frames: int = 1, device_ids: set[int] | None = None, capture_delay_s: float = 0.0
+    ) -> asyncio.Future[JobResult]:
+        """Register a job before it is triggered, so no result can arrive before the job is known."""
+        if job_id in self.__jobs:
+            raise ValueError(f"job {job_id} is in flight already")
+
+        loop = asyncio.get_running_loop()
+        device_count = len(device_ids) if device_ids is not None else self.__device_count
+        job = _PendingJob(
+            job_id=job_id,
+            device_ids=device_ids,
+            device_count=device_count,
+            frames=frames,
+            future=loop.create_future(),
+            deadline_s=self._deadline_s(device_ids, device_count, frames),
+            capture_delay_s=capture_delay_s,
+        )
+        job.timeout_handle = loop.call_later(capture_delay_s + job.deadline_s, self._timeout, job_id)
+        self.__jobs[job_id] = job
+
+        return job.future
+
+    def add(self, msg: ImageMessage) -> bool:
+        """Add a hires result, returns False if it belongs to no in-flight job or was received before."""
+        self.__known_device_ids.add(msg.device_id)
+
+        job = self.__jobs.get(msg.job_id) if msg.job_id else None
+        if job is None and msg.job_id in self.__finished:
+            capture_start, delivered_device_ids = self.__finished[msg.job_id]
+            if msg.frame_index == 0 and msg.device_id not in delivered_device_ids:
+                self.stats.late += 1
+                self.latency.observe_late(msg.device_id, time.monotonic() - capture_start)
+        if job is None:
+            self.stats.unknown += 1
+            state = "finished" if msg.job_id in self.__finished else "unknown"
+            logger.warning(f"result of {state} job ignored, job_id={msg.job_id} device_id={msg.device_id}")
+            return False
+
+        if not self._add_to_job(job, msg):
+            return False
+
+        if job.waits_only_for_lost():
+            self._finish(job)
+        return True
+
+    def drop_device(self, device_id: int):
+        """Stop waiting for a device that left, jobs waiting only for it finish now instead of timing out."""
+        for job in list(self.__jobs.values()):
+            if job.device_ids is None or device_id not in job.device_ids:
+                continue
+
+            job.lost_device_ids.add(device_id)
+            if job.waits_only_for_lost():
+                logger.warning(f"device_id={device_id} left, finishing job without it, job_id={job.job_id}")
+                self._finish(job)
+
+    def cancel_all(self):
+        for job in list(self.__jobs.values()):
+            self._finish(job)
+
+    def _add_to_job(self, job: _PendingJob, msg: ImageMessage) -> bool:
+        key = (msg.device_id, msg.frame_index)
+        if key in job.results:
+            self.stats.duplicates += 1
+            return False
+
+        now = time.monotonic()
+        if msg.frame_index == 0:
+            self.latency.observe(msg.device_id, now - job.capture_start)
+        elif msg.device_id in job.last_result:
+            self.latency.observe(msg.device_id, now - job.last_result[msg.device_id], first=False)
+        job.last_result[msg.device_id] = now
+
+        job.results[key] = msg
+        TRACER.instant("result_received", job.job_id, device_id=msg.device_id, frame_index=msg.frame_index)
+        if self.__on_result:
+            self.__on_result(msg)
+        return True
+
+    def _deadline_s(self, device_ids: set[int] | None, device_count: int, frames: int) -> float:
+        if device_ids is None:
+            # only the number of devices is known, wait until all of them were observed
+            device_ids = self.latency.device_ids if len(self.latency.device_ids) >= device_count else set()
+
+        deadline_s = self.latency.deadline_s(device_ids, frames)
+        return self.__timeout_s if deadline_s is None else min(deadline_s, self.__timeout_s)
+
+    def _report_slow_devices(self):
+        slow_device_ids = self.latency.slow_devices()
+        stats = self.latency.stats()
+        for device_id in slow_device_ids - self.slow_device_ids:
+            logger.warning(f"device_id={device_id} is slow, median latency {stats[device_id].p50_ms:.0f}ms")
+        for device_id in self.slow_device_ids - slow_device_ids:
+            logger.info(f"device_id={device_id} is no longer slow")
+        self.slow_device_ids = slow_device_ids
+
+    def _timeout(self, job_id: uuid.UUID):
+        job = self.__jobs.get(job_id)
+        if job is None:
+            return
+
+        if self.__recover is None:
+            self._finish(job)
+            return
+
+        task = asyncio.create_task(self._recover_and_finish(job))
+        self.__finalize_tasks.add(task)
+        task.add_done_callback(self.__finalize_tasks.discard)
+
+    async def _recover_and_finish(self, job: _PendingJob):
+        assert self.__recover
+        missing = job.missing(self.__known_device_ids)
+        try:
+            recovered = await self.__recover(job.job_id, missing) if missing else []
+        except Exception as exc:
+            logger.warning(f"recovering missing results failed, job_id={job.job_id}: {exc}")
+            recovered = []
+
+        for msg in recovered:
+            self._add_to_job(job, msg)
+
+        if recovered:
+            logger.info(f"recovered {len(recovered)} of {len(missing)} missing results, job_id={job.job_id}")
+        self._finish(job)
+
+    def _finish(self, job: _PendingJob):
+        if self.__jobs.pop(job.job_id, None) is None:
+            return
+
+        if job.timeout_handle:
+            job.timeout_handle.cancel()
+
+        self.__finished[job.job_id] = (job.capture_start, {device_id for device_id, index in job.results if index == 0})
+        while len(self.__finished) > self.__finished_history:
+            self.__finished.popitem(last=False)
+
+        if len(job.results) >= job.expected:
+            status = JobStatus.COMPLETE
+            self.stats.completed += 1
+        elif job.results:
+            status = JobStatus.PARTIAL
+            self.stats.partial += 1
+        else:
+            status = JobStatus.FAILED
+            self.stats.failed += 1
+
+        result = JobResult(
+            job_id=job.job_id,
+            status=status,
+            results=job.results,
+            expected=job.expected,
+            missing=job.missing(self.__known_device_ids),
+            duration_s=time.monotonic() - job.started,
+            deadline_s=job.deadline_s,
+        )
+        TRACER.record("job", job.started_ns, job_id=job.job_id, status=status.value)
+        logger.info(f"job {status.value} with {len(job.results)}/{job.expected} results in {result.duration_s:.2f}s, job_id={job.job_id}")
+
+        self._report_slow_devices()
+
+        if not job.future.done():
+            job.future.set_result(result)
+        if self.__on_job_done:
+            self.__on_job_done(result)
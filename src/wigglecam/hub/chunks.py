@@ -0,0 +1,135 @@
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass, field, replace
+
+from ..dto import FLAG_CHUNK, ImageMessage
+
+logger = logging.getLogger(__name__)
+
+TransferKey = tuple[uuid.UUID | None, int, int]  # job_id, device_id, frame_index
+
+
+@dataclass
+class _Transfer:
+    buffer: bytearray
+    covered: list[tuple[int, int]] = field(default_factory=list)  # received (start, end), sorted and disjoint
+    received: int = 0
+    started: float = field(default_factory=time.monotonic)
+    active: float = field(default_factory=time.monotonic)  # last chunk received or reported stalled
+
+    def add(self, start: int, end: int) -> int:
+        """Mark start:end received, returns the number of bytes not received before.
+        Fetched ranges may overlap chunks that arrive late, so overlaps are not counted twice."""
+        new = end - start
+        low, high = start, end
+        covered = []
+        for covered_start, covered_end in self.covered:
+            if covered_end < start or covered_start > end:
+                covered.append((covered_start, covered_end))
+                continue
+            new -= max(0, min(covered_end, end) - max(covered_start, start))
+            low, high = min(low, covered_start), max(high, covered_end)
+        covered.append((low, high))
+        covered.sort()
+
+        self.covered = covered
+        self.received += new
+        return new
+
+    def missing_ranges(self) -> list[tuple[int, int]]:
+        ranges = []
+        position = 0
+        for start, end in self.covered:
+            if start > position:
+                ranges.append((position, start - position))
+            position = end
+        if position < len(self.buffer):
+            ranges.append((position, len(self.buffer) - position))
+        return ranges
+
+
+class ChunkAssembler:
+    """Reassembles chunked hires transfers per (job_id, device_id, frame_index).
+
+    feed() returns the complete message as soon as the last chunk arrived, so the caller does not need to wait for a
+    timeout. on_chunk is called for every new chunk, e.g. to write to disk incrementally at chunk_offset.
+    Messages that are not chunked are returned unchanged. Transfers that lost chunks are reported by stalled(), so
+    the missing ranges can be fetched and fed. Incomplete transfers are evicted after max_age_s or when more than
+    max_transfers are pending.
+    """
+
+    def __init__(self, on_chunk: Callable[[ImageMessage], None] | None = None, max_transfers: int = 64, max_age_s: float = 30.0):
+        self.__on_chunk = on_chunk
+        self.__max_transfers = max_transfers
+        self.__max_age_s = max_age_s
+        self.__transfers: OrderedDict[TransferKey, _Transfer] = OrderedDict()
+
+        self.evicted = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self.__transfers)
+
+    def progress(self, job_id: uuid.UUID | None, device_id: int, frame_index: int = 0) -> tuple[int, int] | None:
+        """Received and total bytes of a pending transfer."""
+        transfer = self.__transfers.get((job_id, device_id, frame_index))
+        return (transfer.received, len(transfer.buffer)) if transfer else None
+
+    def missing_ranges(self, key: TransferKey) -> list[tuple[int, int]]:
+        """(offset, length) of the payload not received yet of a pending transfer."""
+        transfer = self.__transfers.get(key)
+        return transfer.missing_ranges() if transfer else []
+
+    def stalled(self, idle_s: float, now: float | None = None) -> list[TransferKey]:
+        """Pending transfers without a chunk for idle_s. They count as active again, so they are reported again only
+        if no chunk arrives within idle_s once more, e.g. because fetching the missing ranges failed."""
+        now = time.monotonic() if now is None else now
+        stalled = [key for key, transfer in self.__transfers.items() if now - transfer.active >= idle_s]
+        for key in stalled:
+            self.__transfers[key].active = now
+        return stalled
+
+    def feed(self, msg: ImageMessage) -> ImageMessage | None:
+        if not msg.is_chunk:
+            return msg
+
+        if msg.total_len == 0:
+            # nothing to reassemble, older nodes send an empty payload as a single empty chunk
+            return replace(msg, flags=msg.flags & ~FLAG_CHUNK, chunk_offset=0)
+
+        key = (msg.job_id, msg.device_id, msg.frame_index)
+        transfer = self.__transfers.get(key)
+        if transfer is None:
+            self._evict()
+            transfer = self.__transfers[key] = _Transfer(bytearray(msg.total_len))
+
+        chunk_len = len(msg.payload)
+        if msg.chunk_offset + chunk_len > len(transfer.buffer) or not transfer.add(msg.chunk_offset, msg.chunk_offset + chunk_len):
+            logger.warning(f"ignored duplicate or invalid chunk at {msg.chunk_offset} of {key}")
+            return None
+
+        transfer.buffer[msg.chunk_offset : msg.chunk_offset + chunk_len] = msg.payload
+        transfer.active = time.monotonic()
+
+        if self.__on_chunk:
+            self.__on_chunk(msg)
+
+        if transfer.received < len(transfer.buffer):
+            return None
+
+        del self.__transfers[key]
+        return replace(msg, payload=memoryview(transfer.buffer), flags=msg.flags & ~FLAG_CHUNK, chunk_offset=0)
+
+    def _evict(self):
+        now = time.monotonic()
+        while self.__transfers:
+            key, transfer = next(iter(self.__transfers.items()))
+            if len(self.__transfers) < self.__max_transfers and now - transfer.started < self.__max_age_s:
+                break
+
+            del self.__transfers[key]
+            self.evicted += 1
+            logger.warning(f"evicted incomplete transfer {key}, got {transfer.received}/{len(transfer.buffer)} bytes")
@@ -0,0 +1,358 @@
+import asyncio
+import ipaddress
+import logging
+import socket
+import time
+import uuid
+from collections.abc import Callable
+
+import pynng
+
+from ..discovery import DISCOVERY_GROUP, DISCOVERY_PORT
+from ..dto import (
+    CAP_RESULT_FETCH,
+    CAP_TCP_OUTPUT,
+    CONTROL_ANY_DEVICE,
+    ChunkAck,
+    ImageMessage,
+    StreamControlMessage,
+    StreamLevel,
+    TriggerMessage,
+)
+from ..tracing import TRACER
+from .aggregator import JobAggregator, JobResult
+from .chunks import ChunkAssembler, TransferKey
+from .discovery import DiscoveryListener, NodeInfo, NodeRegistry
+from .fetch import ResultFetcher
+from .skew import SkewAnalyzer
+from .timesync import TimeServer
+
+logger = logging.getLogger(__name__)
+
+LEVEL_RESEND_INTERVAL_S = 1.0
+CHUNK_REPAIR_AFTER_S = 0.2  # fetch the missing ranges of a chunked transfer without a chunk for this long
+
+
+def _is_local(ip: str) -> bool:
+    try:
+        if ipaddress.ip_address(ip).is_loopback:
+            return True
+    except ValueError:
+        return False
+
+    # only addresses of this host can be bound
+    with socket.socket(socket.AF_INET6 if ":" in ip else socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        try:
+            sock.bind((ip, 0))
+        except OSError:
+            return False
+    return True
+
+
+def _address_key(host: str, base_port: int) -> tuple[str, int]:
+    """Identifies a node by resolved address, so localhost, 127.0.0.1 and the addresses of this host are one node."""
+    try:
+        ip = socket.gethostbyname(host)
+    except OSError:
+        return host, base_port
+    return ("localhost" if _is_local(ip) else ip), base_port
+
+
+class HubClient:
+    """Connects to the nodes, triggers jobs and collects their results.
+
+    Every node listens on base_port (trigger), base_port + 1 (lores), base_port + 2 (hires) and base_port + 3 (fetch
+    missed results). Any number of jobs can be in flight, trigger() resolves once the job is complete, partial or
+    failed at its deadline, which adapts to the latency of the nodes up to job_timeout_s. on_lores is called with
+    every lores frame, the JobAggregator callbacks can be used instead of awaiting.
+    With time_server_address the hub serves its clock to the nodes (their app_time_sync_address), so triggers can
+    be scheduled with capture_delay_s and the nodes capture at the same moment regardless of network latency.
+    With discovery the nodes announcing themselves are dialed when they join, in addition to the static devices, and
+    jobs wait for the static devices and the nodes alive when triggered. A node leaving finishes the jobs that only
+    wait for it. Nodes are dialed once, a discovered node that is a static device already is not dialed again.
+    select_lores_level() switches the lores stream of nodes between full lores and thumbnails, e.g. thumbnails for a
+    grid view. Nodes streaming another level than selected are corrected, so restarted and late nodes follow also.
+    Chunks of hires transfers are acknowledged, so nodes send only a window ahead. The missing ranges of transfers that
+    lost chunks anyway are fetched, with fetch_missing, instead of waiting for their eviction.
+    """
+
+    def __init__(
+        self,
+        devices: list[tuple[str, int]] | None = None,
+        job_timeout_s: float = 5.0,
+        fetch_missing: bool = True,
+        on_lores: Callable[[ImageMessage], None] | None = None,
+        on_result: Callable[[ImageMessage], None] | None = None,
+        on_job_done: Callable[[JobResult], None] | None = None,
+        on_ready: Callable[[int], None] | None = None,
+        time_server_address: str | None = None,
+        discovery: bool = False,
+        discovery_group: str = DISCOVERY_GROUP,
+        discovery_port: int = DISCOVERY_PORT,
+    ):
+        devices = devices or []
+        self.__dialed: set[tuple[str, int]] = set()
+        self.__static_dialers: set[int] = set()  # lores dialer ids of the static devices
+        self.__static_device_ids: set[int] = set()  # learned from their lores frames
+        self.__static_devices = 0
+        self.__on_lores = on_lores
+        self.__on_ready = on_ready
+        self.__ready_devices: set[int] = set()
+        self.__lores_pipes: dict[int, int] = {}  # pipe id -> device id, to notice nodes disconnecting
+        self.__loop: asyncio.AbstractEventLoop | None = None
+        self.__lores_level = StreamLevel.LORES
+        self.__lores_levels: dict[int, StreamLevel] = {}
+        self.__lores_level_sent: dict[int, float] = {}
+        self.__repair_tasks: set[asyncio.Task] = set()
+
+        self.__pub_trigger = pynng.Pub0()
+        self.__sub_lores = pynng.Sub0()
+        self.__sub_lores.subscribe(b"")
+        self.__sub_lores.add_post_pipe_remove_cb(self._on_lores_pipe_remove)
+        self.__sub_hires = pynng.Sub0()
+        self.__sub_hires.subscribe(b"")
+
+        self.__time_server = TimeServer(time_server_address) if time_server_address else None
+        self.__fetcher = ResultFetcher([]) if fetch_missing else None
+        for host, base_port in devices:
+            if dialer := self._dial(host, base_port):
+                self.__static_dialers.add(dialer.id)
+                self.__static_devices += 1
+
+        self.registry = NodeRegistry(on_join=self._on_node_join, on_leave=self._on_node_leave) if discovery else None
+        self.__listener = DiscoveryListener(self.registry, discovery_group, discovery_port) if self.registry else None
+
+        self.chunk_assembler = ChunkAssembler()
+        self.skew_analyzer = SkewAnalyzer()
+        self.aggregator = JobAggregator(
+            device_count=self.__static_devices,
+            timeout_s=job_timeout_s,
+            recover=self.__fetcher.fetch_missing if self.__fetcher else None,
+            on_result=on_result,
+            on_job_done=on_job_done,
+        )
+
+    @property
+    def connected_devices(self) -> int:
+        return len(self.__pub_trigger.pipes)
+
+    @property
+    def expected_devices(self) -> int:
+        return len(self.__dialed)
+
+    @property
+    def ready_devices(self) -> set[int]:
+        """Device ids that announced they are ready or sent a lores frame and did not disconnect since."""
+        return set(self.__ready_devices)
+
+    def lores_level(self, device_id: int) -> StreamLevel:
+        """Level selected for the lores stream of the device."""
+        return self.__lores_levels.get(device_id, self.__lores_level)
+
+    async def select_lores_level(self, level: StreamLevel, device_id: int | None = None):
+        """Select the level of the lores stream of a device or, without device_id, of all devices."""
+        if device_id is None:
+            self.__lores_level = level
+            self.__lores_levels.clear()
+        else:
+            self.__lores_levels[device_id] = level
+
+        now = time.monotonic()
+        for ready_device_id in self.__ready_devices if device_id is None else (device_id,):
+            self.__lores_level_sent[ready_device_id] = now
+        await self._send_stream_control(StreamControlMessage(CONTROL_ANY_DEVICE if device_id is None else device_id, level))
+
+    async def _send_stream_control(self, msg: StreamControlMessage):
+        # stream control shares the trigger channel, it reaches the nodes the same way
+        await self.__pub_trigger.asend(msg.to_bytes())
+
+    def close(self):
+        self.aggregator.cancel_all()
+        for task in self.__repair_tasks:
+            task.cancel()
+        for sock in (self.__pub_trigger, self.__sub_lores, self.__sub_hires):
+            sock.close()
+        if self.__fetcher:
+            self.__fetcher.close()
+        if self.__time_server:
+            self.__time_server.close()
+        if self.__listener:
+            self.__listener.close()
+
+    def _dial(self, host: str, base_port: int, fetch: bool = True) -> pynng.Dialer | None:
+        """Dial the node unless it was dialed before, returns the dialer of the lores stream."""
+        key = _address_key(host, base_port)
+        if key in self.__dialed:
+            return None  # pynng redials lost connections itself, dialing again would duplicate every message
+        self.__dialed.add(key)
+
+        # block=False means continue program and try to connect in the background without any exception
+        self.__pub_trigger.dial(f"tcp://{host}:{base_port + 0}", block=False)
+        lores_dialer = self.__sub_lores.dial(f"tcp://{host}:{base_port + 1}", block=False)
+        self.__sub_hires.dial(f"tcp://{host}:{base_port + 2}", block=False)
+        if self.__fetcher and fetch:
+            self.__fetcher.add(f"tcp://{host}:{base_port + 3}")
+        return lores_dialer
+
+    def _on_node_join(self, node: NodeInfo):
+        if not node.capabilities & CAP_TCP_OUTPUT:
+            logger.warning(f"device_id={node.device_id} serves no tcp output, not dialed")
+            return
+        if node.device_id in self.__static_device_ids:
+            logger.debug(f"device_id={node.device_id} is a static device, dialed already")
+            return
+        self._dial(node.host, node.base_port, fetch=bool(node.capabilities & CAP_RESULT_FETCH))
+
+    def _on_node_leave(self, node: NodeInfo):
+        self.__ready_devices.discard(node.device_id)
+        self.aggregator.drop_device(node.device_id)
+
+    async def trigger_nowait(
+        self, frames: int = 1, interval_us: int = 0, capture_delay_s: float = 0.0
+    ) -> tuple[uuid.UUID, asyncio.Future[JobResult]]:
+        """Trigger a job and return its id and a future of the result without waiting for it.
+        capture_delay_s > 0 schedules the capture, it should exceed the trigger latency to the slowest node."""
+        if self.connected_devices < self.expected_devices:
+            logger.warning(f"only {self.connected_devices} of {self.expected_devices} devices are connected")
+
+        device_ids = None
+        if self.registry:
+            device_ids = self.registry.alive_device_ids | self.__static_device_ids
+            if len(self.__static_device_ids) < self.__static_devices:
+                unknown = self.__static_devices - len(self.__static_device_ids)
+                logger.warning(f"{unknown} static devices sent no frame yet, the job does not wait for them")
+            if not device_ids:
+                logger.warning("no node alive, the job will fail")
+
+        job_id = uuid.uuid4()
+        capture_at_ns = time.time_ns() + int(capture_delay_s * 1e9) if capture_delay_s > 0 else 0
+        future = self.aggregator.start_job(job_id, frames=frames, device_ids=device_ids, capture_delay_s=max(0.0, capture_delay_s))
+        trigger = TriggerMessage(job_id, frames=frames, interval_us=interval_us, capture_at_ns=capture_at_ns)
+        await self.__pub_trigger.asend(trigger.to_bytes())
+        TRACER.instant("trigger_sent", job_id, frames=frames)
+
+        return job_id, future
+
+    async def trigger(self, frames: int = 1, interval_us: int = 0, capture_delay_s: float = 0.0) -> JobResult:
+        _, future = await self.trigger_nowait(frames, interval_us, capture_delay_s)
+        return await future
+
+    async def run(self):
+        """Receive lores and hires messages until cancelled or closed."""
+        self.__loop = asyncio.get_running_loop()
+        try:
+            async with asyncio.TaskGroup() as task_group:
+                task_group.create_task(self._lores_task())
+                task_group.create_task(self._hires_task())
+                if self.__fetcher:
+                    task_group.create_task(self._chunk_repair_task())
+                if self.__time_server:
+                    task_group.create_task(self.__time_server.serve())
+                if self.__listener:
+                    task_group.create_task(self.__listener.serve())
+        except* pynng.exceptions.Closed:
+            logger.debug("hub client closed")
+
+    async def _lores_task(self):
+        while True:
+            received = await self.__sub_lores.arecv_msg()
+            try:
+                msg = ImageMessage.from_bytes(received.bytes)
+            except ValueError as exc:
+                logger.warning(f"skipped invalid lores message: {exc}")
+                continue
+            self.__lores_pipes[received.pipe.id] = msg.device_id
+            if msg.device_id not in self.__static_device_ids and received.pipe.dialer.id in self.__static_dialers:
+                self.__static_device_ids.add(msg.device_id)
+            if msg.is_ready or msg.device_id not in self.__ready_devices:
+                # a hub connecting later missed the announcement, a frame shows the node is ready also.
+                # a node restarting announces again, so on_ready is called for every announcement
+                self.__ready_devices.add(msg.device_id)
+                logger.info(f"device {msg.device_id} ready")
+                if self.__on_ready:
+                    self.__on_ready(msg.device_id)
+            await self._correct_lores_level(msg)
+            if msg.is_ready:
+                continue
+
+            self.skew_analyzer.add(msg)
+            if self.__on_lores:
+                self.__on_lores(msg)
+
+    def _on_lores_pipe_remove(self, pipe: pynng.Pipe):
+        # invoked from nng threads
+        if self.__loop is None:
+            return
+        try:
+            self.__loop.call_soon_threadsafe(self._lores_pipe_removed, pipe.id)
+        except RuntimeError:
+            pass  # event loop closed
+
+    def _lores_pipe_removed(self, pipe_id: int):
+        device_id = self.__lores_pipes.pop(pipe_id, None)
+        if device_id is None or device_id in self.__lores_pipes.values():
+            return
+
+        if device_id in self.__ready_devices:
+            self.__ready_devices.discard(device_id)
+            logger.warning(f"device {device_id} disconnected")
+
+    async def _correct_lores_level(self, msg: ImageMessage):
+        """Select the level again if the node streams another one, at most every LEVEL_RESEND_INTERVAL_S per device,
+        so frames still in flight after a selection do not cause a resend."""
+        level = self.lores_level(msg.device_id)
+        if msg.level is level:
+            return
+
+        now = time.monotonic()
+        if now - self.__lores_level_sent.get(msg.device_id, 0.0) < LEVEL_RESEND_INTERVAL_S:
+            return
+
+        self.__lores_level_sent[msg.device_id] = now
+        logger.debug(f"device {msg.device_id} streams {msg.level.name} instead of {level.name}, selecting again")
+        await self._send_stream_control(StreamControlMessage(msg.device_id, level))
+
+    async def _hires_task(self):
+        while True:
+            try:
+                received = ImageMessage.from_bytes(await self.__sub_hires.arecv())
+            except ValueError as exc:
+                logger.warning(f"skipped invalid hires message: {exc}")
+                continue
+            msg = self.chunk_assembler.feed(received)
+            if received.is_chunk:
+                ack = ChunkAck(received.job_id, received.device_id, received.frame_index, received.chunk_offset + len(received.payload))
+                await self.__pub_trigger.asend(ack.to_bytes())
+            if msg is None:
+                continue  # more chunks to come
+
+            self._hires_received(msg)
+
+    def _hires_received(self, msg: ImageMessage):
+        self.skew_analyzer.add(msg)
+        self.aggregator.add(msg)
+
+    async def _chunk_repair_task(self):
+        while True:
+            await asyncio.sleep(CHUNK_REPAIR_AFTER_S / 2)
+            for key in self.chunk_assembler.stalled(CHUNK_REPAIR_AFTER_S):
+                task = asyncio.create_task(self._repair_transfer(key))
+                self.__repair_tasks.add(task)
+                task.add_done_callback(self.__repair_tasks.discard)
+
+    async def _repair_transfer(self, key: TransferKey):
+        """Fetch the ranges a stalled transfer misses from the node's result cache."""
+        assert self.__fetcher
+        job_id, device_id, frame_index = key
+        ranges = self.chunk_assembler.missing_ranges(key)
+        if job_id is None or not ranges:
+            return
+
+        logger.info(f"chunked transfer stalled, fetching {sum(length for _, length in ranges)} missing bytes, {job_id=} {device_id=}")
+        chunks = await asyncio.gather(*(self.__fetcher.fetch(job_id, device_id, frame_index, offset, length) for offset, length in ranges))
+        for chunk in chunks:
+            if chunk is None:
+                continue
+            msg = self.chunk_assembler.feed(chunk)
+            if msg is not None:
+                self._hires_received(msg)
@@ -0,0 +1,70 @@
+import math
+
+import cv2
+import numpy as np
+
+from .decode import DecodedFrame
+
+
+class GridCompositor:
+    """Live wall of the lores frames on a persistent canvas.
+
+    Only tiles of devices that sent a new frame since the last compose are redrawn, they are resized straight into
+    their view of the canvas. The canvas is reallocated only if the layout changes, i.e. a new device shows up.
+    Devices are placed by device id in a grid of columns, default is a roughly square grid. positions maps device ids
+    to (row, column) for custom layouts, e.g. to match the physical arrangement of a rig.
+    """
+
+    def __init__(self, tile_size: tuple[int, int] = (320, 240), columns: int | None = None, positions: dict[int, tuple[int, int]] | None = None):
+        self.__tile_width, self.__tile_height = tile_size
+        self.__columns = columns
+        self.__positions = positions or {}
+
+        self.__canvas = np.zeros((0, 0, 3), np.uint8)
+        self.__views: dict[int, np.ndarray] = {}
+        self.__shown: dict[int, DecodedFrame] = {}
+
+        self.tiles_updated = 0
+
+    @property
+    def canvas(self) -> np.ndarray:
+        return self.__canvas
+
+    def compose(self, frames: dict[int, DecodedFrame]) -> np.ndarray:
+        """Update the tiles of changed frames and return the canvas. The canvas is reused, copy it to keep it."""
+        if frames.keys() - self.__views.keys():
+            self._layout(sorted(frames.keys() | self.__views.keys()))
+
+        for device_id, frame in frames.items():
+            if self.__shown.get(device_id) is frame:
+                continue
+
+            cv2.resize(frame.image, (self.__tile_width, self.__tile_height), dst=self.__views[device_id], interpolation=cv2.INTER_AREA)
+            self.__shown[device_id] = frame
+            self.tiles_updated += 1
+
+        return self.__canvas
+
+    def _layout(self, device_ids: list[int]):
+        columns = self.__columns or math.ceil(math.sqrt(len(device_ids)))
+        cells = {}
+        free_cells = ((index // columns, index % columns) for index in range(len(device_ids) + len(self.__positions)))
+        occupied = set(self.__positions.values())
+        for device_id in device_ids:
+            if device_id in self.__positions:
+                cells[device_id] = self.__positions[device_id]
+            else:
+                cells[device_id] = next(cell for cell in free_cells if cell not in occupied)
+
+        rows = max(row for row, _ in cells.values()) + 1
+        columns = max(column for _, column in cells.values()) + 1
+        self.__canvas = np.zeros((rows * self.__tile_height, columns * self.__tile_width, 3), np.uint8)
+
+        self.__views = {
+            device_id: self.__canvas[
+                row * self.__tile_height : (row + 1) * self.__tile_height,
+                column * self.__tile_width : (column + 1) * self.__tile_width,
+            ]
+            for device_id, (row, column) in cells.items()
+        }
+        self.__shown.clear()  # redraw everything on the new canvas
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import os
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any
+
+from ..dto import ImageMessage
+
+logger = logging.getLogger(__name__)
+
+
+def decode_jpeg_cv2(data: bytes | bytearray | memoryview) -> Any:
+    import cv2  # optional dependency of the hub, imported when used
+    import numpy as np
+
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("invalid JPEG")
+    return image
+
+
+@dataclass
+class DecodeStats:
+    received: int = 0
+    decoded: int = 0
+    dropped: int = 0  # replaced by a newer frame before it was decoded
+    failed: int = 0
+
+
+@dataclass
+class DecodedFrame:
+    image: Any
+    msg: ImageMessage  # the frame's metadata, timestamp, sequence...
+
+
+class LoresDecoder:
+    """Decodes lores frames in a worker pool, latest frame wins.
+
+    Per device only the newest undecoded frame is kept and at most one decode runs at a time, frames arriving
+    meanwhile replace the waiting one. So decode load is bounded by the pool and not by the incoming frame rate.
+    submit() is called from the event loop, the display pulls the most recent decoded frames with latest() or frames().
+    """
+
+    def __init__(self, decode: Callable[[bytes | bytearray | memoryview], Any] = decode_jpeg_cv2, workers: int | None = None):
+        self.__decode = decode
+        self.__executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1, thread_name_prefix="lores_decode")
+
+        self.__waiting: dict[int, ImageMessage] = {}
+        self.__decoding: set[int] = set()
+        self.__decoded: dict[int, DecodedFrame] = {}
+
+        self.stats = DecodeStats()
+
+    def close(self):
+        self.__executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, msg: ImageMessage):
+        self.stats.received += 1
+
+        if self.__waiting.pop(msg.device_id, None) is not None:
+            self.stats.dropped += 1
+
+        if msg.device_id in self.__decoding:
+            self.__waiting[msg.device_id] = msg
+        else:
+            self._start(msg)
+
+    def latest(self, device_id: int) -> DecodedFrame | None:
+        return self.__decoded.get(device_id)
+
+    def frames(self) -> dict[int, DecodedFrame]:
+        """Most recent decoded frame of every device, sorted by device id."""
+        return dict(sorted(self.__decoded.items()))
+
+    def _start(self, msg: ImageMessage):
+        self.__decoding.add(msg.device_id)
+        future = asyncio.get_running_loop().run_in_executor(self.__executor, self.__decode, msg.payload)
+        future.add_done_callback(lambda future: self._done(msg, future))
+
+    def _done(self, msg: ImageMessage, future: asyncio.Future):
+        self.__decoding.discard(msg.device_id)
+
+        if future.cancelled():
+            return
+        if exc := future.exception():
+            self.stats.failed += 1
+            logger.warning(f"decoding lores frame of device {msg.device_id} failed: {exc}")
+        else:
+            self.stats.decoded += 1
+            self.__decoded[msg.device_id] = DecodedFrame(future.result(), msg)
+
+        if (waiting := self.__waiting.pop(msg.device_id, None)) is not None:
+            self._start(waiting)
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import socket
+import struct
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+from ..discovery import DISCOVERY_GROUP, DISCOVERY_PORT
+from ..dto import AnnounceMessage
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class NodeInfo:
+    device_id: int
+    host: str
+    base_port: int
+    capabilities: int
+    ready: bool
+    timeout_s: float  # declared dead if no announcement arrives within
+    last_seen: float = field(default_factory=time.monotonic)
+
+    def address(self, port_offset: int) -> str:
+        return f"tcp://{self.host}:{self.base_port + port_offset}"
+
+
+class NodeRegistry:
+    """Live nodes by device id, kept from their announcements.
+
+    A node is dead once it missed missed_heartbeats announcements or said bye. A device id announced from another
+    address is treated as the old node leaving and a new one joining, e.g. a node restarted with another base port.
+    """
+
+    def __init__(
+        self,
+        missed_heartbeats: int = 3,
+        on_join: Callable[[NodeInfo], None] | None = None,
+        on_leave: Callable[[NodeInfo], None] | None = None,
+    ):
+        self.__missed_heartbeats = missed_heartbeats
+        self.__on_join = on_join
+        self.__on_leave = on_leave
+
+        self.__nodes: dict[int, NodeInfo] = {}
+
+    @property
+    def nodes(self) -> dict[int, NodeInfo]:
+        return dict(self.__nodes)
+
+    @property
+    def alive_device_ids(self) -> set[int]:
+        return set(self.__nodes)
+
+    def update(self, msg: AnnounceMessage, host: str, now: float | None = None):
+        now = time.monotonic() if now is None else now
+        node = self.__nodes.get(msg.device_id)
+
+        if msg.is_bye:
+            if node and (node.host, node.base_port) == (host, msg.base_port):
+                self._leave(node, "said bye")
+            return
+
+        if node and (node.host, node.base_port) != (host, msg.base_port):
+            logger.warning(f"device_id={msg.device_id} moved from {node.host}:{node.base_port} to {host}:{msg.base_port}")
+            self._leave(node, "moved")
+            node = None
+
+        if node is None:
+            node = NodeInfo(
+                device_id=msg.device_id,
+                host=host,
+                base_port=msg.base_port,
+                capabilities=msg.capabilities,
+                ready=msg.is_ready,
+                timeout_s=self.__missed_heartbeats * msg.interval_ms / 1000,
+                last_seen=now,
+            )
+            self.__nodes[msg.device_id] = node
+            logger.info(f"node joined, device_id={node.device_id} at {host}:{node.base_port}")
+            if self.__on_join:
+                self.__on_join(node)
+            return
+
+        node.last_seen = now
+        node.ready = msg.is_ready
+        node.capabilities = msg.capabilities
+
+    def expire(self, now: float | None = None) -> list[NodeInfo]:
+        """Remove the nodes whose heartbeat timed out and return them."""
+        now = time.monotonic() if now is None else now
+        dead = [node for node in self.__nodes.values() if now - node.last_seen > node.timeout_s]
+        for node in dead:
+            self._leave(node, f"missed heartbeats for {now - node.last_seen:.1f}s")
+        return dead
+
+    def _leave(self, node: NodeInfo, reason: str):
+        del self.__nodes[node.device_id]
+        logger.warning(f"node left, device_id={node.device_id} at {node.host}:{node.base_port}: {reason}")
+        if self.__on_leave:
+            self.__on_leave(node)
+
+
+class DiscoveryListener:
+    """Receives the UDP multicast announcements of the nodes into a NodeRegistry and expires silent nodes."""
+
+    def __init__(self, registry: NodeRegistry, group: str = DISCOVERY_GROUP, port: int = DISCOVERY_PORT, expire_interval_s: float = 0.1):
+        self.__registry = registry
+        self.__expire_interval_s = expire_interval_s
+
+        self.__sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.__sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # several hubs on one host
+        self.__sock.bind(("", port))
+        membership = struct.pack("4s4s", socket.inet_aton(group), socket.inet_aton("0.0.0.0"))
+        self.__sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        self.__sock.setblocking(False)
+
+    def close(self):
+        self.__sock.close()
+
+    async def serve(self):
+        async with asyncio.TaskGroup() as task_group:
+            task_group.create_task(self._receive_task())
+            task_group.create_task(self._expire_task())
+
+    async def _receive_task(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            data, (host, _) = await loop.sock_recvfrom(self.__sock, 1024)
+            try:
+                msg = AnnounceMessage.from_bytes(data)
+            except ValueError as exc:
+                logger.debug(f"ignored invalid announcement from {host}: {exc}")
+                continue
+
+            self.__registry.update(msg, host)
+
+    async def _expire_task(self):
+        while True:
+            await asyncio.sleep(self.__expire_interval_s)
+            self.__registry.expire()
@@ -0,0 +1,61 @@
+import asyncio
+import logging
+import uuid
+
+import pynng
+
+from ..dto import FETCH_ANY_DEVICE, FetchRequest, ImageMessage
+
+logger = logging.getLogger(__name__)
+
+
+class ResultFetcher:
+    """Fetch hires results a hub missed from the result cache of the nodes (Req0 to base_port + 3).
+
+    The hub usually does not know which address a device id belongs to, so a request is sent to all nodes and the
+    node that has the result answers with it.
+    """
+
+    def __init__(self, addresses: list[str], timeout_ms: int = 500):
+        self.__timeout_ms = timeout_ms
+        self.__sockets: list[pynng.Req0] = []
+        for address in addresses:
+            self.add(address)
+
+    def add(self, address: str):
+        """Fetch from another node, e.g. one that was discovered."""
+        sock = pynng.Req0(recv_timeout=self.__timeout_ms, send_timeout=self.__timeout_ms)
+        # block=False means continue program and try to connect in the background without any exception
+        sock.dial(address, block=False)
+        self.__sockets.append(sock)
+
+    def close(self):
+        for sock in self.__sockets:
+            sock.close()
+
+    async def fetch(
+        self, job_id: uuid.UUID, device_id: int = FETCH_ANY_DEVICE, frame_index: int = 0, chunk_offset: int = 0, length: int = 0
+    ) -> ImageMessage | None:
+        """Fetch a result, with a length only that range of its payload, returned as chunk."""
+        request = FetchRequest(job_id, device_id, frame_index, chunk_offset, length).to_bytes()
+        replies = await asyncio.gather(*(self._request(sock, request) for sock in self.__sockets))
+
+        return next((msg for msg in replies if msg is not None), None)
+
+    async def fetch_missing(self, job_id: uuid.UUID, missing: list[tuple[int, int]]) -> list[ImageMessage]:
+        """Fetch (device_id, frame_index) results concurrently, returns those found."""
+        results = await asyncio.gather(*(self.fetch(job_id, device_id, frame_index) for device_id, frame_index in missing))
+
+        return [msg for msg in results if msg is not None]
+
+    async def _request(self, sock: pynng.Req0, request: bytes) -> ImageMessage | None:
+        # a context per request, so requests to the same node run concurrently
+        with sock.new_context() as ctx:
+            try:
+                await ctx.asend(request)
+                reply = await ctx.arecv()
+            except pynng.exceptions.NNGException as exc:
+                logger.debug(f"fetch request failed: {exc}")
+                return None
+
+        return ImageMessage.from_bytes(reply) if reply else None
@@ -0,0 +1,92 @@
+from collections import deque
+from dataclasses import dataclass
+
+from .skew import percentile
+
+
+@dataclass
+class LatencyStats:
+    samples: int
+    p50_ms: float
+    p99_ms: float
+    late: int  # results that arrived after their job finished
+
+
+class LatencyTracker:
+    """Rolling trigger-to-result latencies per device, used to derive job deadlines.
+
+    Two windows are kept per device: the latency of the first result of a job and the gap between the results of a
+    burst. The deadline of a job is the slowest expected device's percentile plus margin_s. A device is reported
+    slow if its median is slow_factor times the median of all devices.
+    """
+
+    def __init__(
+        self,
+        window: int = 200,
+        min_samples: int = 10,
+        deadline_percentile: float = 99.0,
+        margin_s: float = 0.1,
+        slow_factor: float = 2.0,
+    ):
+        self.__window = window
+        self.__min_samples = min_samples
+        self.__deadline_percentile = deadline_percentile
+        self.__margin_s = margin_s
+        self.__slow_factor = slow_factor
+
+        self.__first: dict[int, deque[float]] = {}
+        self.__gaps: dict[int, deque[float]] = {}
+        self.__late: dict[int, int] = {}
+
+    @property
+    def device_ids(self) -> set[int]:
+        return set(self.__first)
+
+    def observe(self, device_id: int, latency_s: float, first: bool = True):
+        windows = self.__first if first else self.__gaps
+        windows.setdefault(device_id, deque(maxlen=self.__window)).append(latency_s)
+
+    def observe_late(self, device_id: int, latency_s: float, first: bool = True):
+        """A result of a finished job, its latency counts also so deadlines grow again if they were too tight."""
+        self.__late[device_id] = self.__late.get(device_id, 0) + 1
+        self.observe(device_id, latency_s, first)
+
+    def deadline_s(self, device_ids: set[int], frames: int = 1) -> float | None:
+        """Deadline of a job from trigger to its last result, None if a device has too few samples yet."""
+        if not device_ids:
+            return None
+
+        deadlines = []
+        for device_id in device_ids:
+            first = self._percentile(self.__first.get(device_id), self.__deadline_percentile)
+            gap = self._percentile(self.__gaps.get(device_id), self.__deadline_percentile) if frames > 1 else 0.0
+            if first is None or gap is None:
+                return None
+            deadlines.append(first + (frames - 1) * gap)
+
+        return max(deadlines) + self.__margin_s
+
+    def stats(self) -> dict[int, LatencyStats]:
+        stats = {}
+        for device_id, samples in self.__first.items():
+            values = sorted(samples)
+            stats[device_id] = LatencyStats(
+                samples=len(values),
+                p50_ms=percentile(values, 50) * 1000,
+                p99_ms=percentile(values, 99) * 1000,
+                late=self.__late.get(device_id, 0),
+            )
+        return stats
+
+    def slow_devices(self) -> set[int]:
+        medians = {device_id: median for device_id, samples in self.__first.items() if (median := self._percentile(samples, 50)) is not None}
+        if len(medians) < 2:
+            return set()
+
+        overall = percentile(sorted(medians.values()), 50)
+        return {device_id for device_id, median in medians.items() if median > self.__slow_factor * overall}
+
+    def _percentile(self, samples: deque[float] | None, p: float) -> float | None:
+        if samples is None or len(samples) < self.__min_samples:
+            return None
+        return percentile(sorted(samples), p)
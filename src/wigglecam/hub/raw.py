@@ -0,0 +1,62 @@
+import zlib
+
+import numpy as np
+
+from ..dto import Codec, ImageMessage, PixelFormat
+
+
+def decode_raw(msg: ImageMessage) -> np.ndarray:
+    """Pixels of a raw result: (height * 3 // 2, width) for I420, (height, width, 3) for RGB888 and BGR888.
+
+    Uncompressed payloads are not copied, the array is a read-only view on the received message.
+    """
+    if msg.codec is Codec.RAW:
+        data = msg.payload
+    elif msg.codec is Codec.ZLIB:
+        data = zlib.decompress(msg.payload)
+    elif msg.codec is Codec.LZ4:
+        import lz4.frame  # optional dependency, only needed if a node sends lz4
+
+        data = lz4.frame.decompress(msg.payload)
+    else:
+        raise ValueError(f"{msg.codec.name} is not a raw codec")
+
+    if msg.pixel_format is PixelFormat.I420:
+        shape: tuple[int, ...] = (msg.height * 3 // 2, msg.width)
+    elif msg.pixel_format in (PixelFormat.RGB888, PixelFormat.BGR888):
+        shape = (msg.height, msg.width, 3)
+    else:
+        raise ValueError(f"unsupported pixel format {msg.pixel_format.name}")
+
+    array = np.frombuffer(data, np.uint8)
+    if array.size != np.prod(shape):
+        raise ValueError(f"raw payload of {array.size} bytes does not match {msg.width}x{msg.height} {msg.pixel_format.name}")
+    return array.reshape(shape)
+
+
+def i420_planes(array: np.ndarray, width: int, height: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Y, U and V planes of an I420 array as views."""
+    flat = array.reshape(-1)
+    chroma_size = (width // 2) * (height // 2)
+    y = flat[: width * height].reshape(height, width)
+    u = flat[width * height : width * height + chroma_size].reshape(height // 2, width // 2)
+    v = flat[width * height + chroma_size : width * height + 2 * chroma_size].reshape(height // 2, width // 2)
+    return y, u, v
+
+
+def decode_bgr(msg: ImageMessage) -> np.ndarray:
+    """Any hires result as BGR array as expected by cv2, JPEG or raw."""
+    import cv2  # optional dependency of the hub, imported when used
+
+    if msg.codec is Codec.JPEG:
+        image = cv2.imdecode(np.frombuffer(msg.payload, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("invalid JPEG")
+        return image
+
+    array = decode_raw(msg)
+    if msg.pixel_format is PixelFormat.I420:
+        return cv2.cvtColor(array, cv2.COLOR_YUV2BGR_I420)
+    if msg.pixel_format is PixelFormat.RGB888:
+        return cv2.cvtColor(array, cv2.COLOR_RGB2BGR)
+    return array
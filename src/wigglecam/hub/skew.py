@@ -0,0 +1,112 @@
+import math
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+
+from ..dto import ImageMessage, SyncState
+
+
+@dataclass
+class SkewStats:
+    samples: int
+    p50_ms: float
+    p99_ms: float
+    max_ms: float
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Nearest-rank percentile, values need to be sorted."""
+    if not values:
+        return 0.0
+    rank = max(0, min(len(values) - 1, math.ceil(p / 100 * len(values)) - 1))
+    return values[rank]
+
+
+def _stats(samples_ns) -> SkewStats:
+    values = sorted(sample / 1e6 for sample in samples_ns)
+    return SkewStats(
+        samples=len(values),
+        p50_ms=percentile(values, 50),
+        p99_ms=percentile(values, 99),
+        max_ms=values[-1] if values else 0.0,
+    )
+
+
+class SkewAnalyzer:
+    """Rolling inter-node capture skew computed from the timestamps the nodes send with every ImageMessage.
+
+    Lores frames of each device are matched against the nearest frame of the reference device (lowest device id).
+    A frame is evaluated only once the reference device sent a newer frame, so network reordering does not count as skew.
+    Hires results are grouped by job id, the skew of a job is the spread of its timestamps over the last max_jobs jobs.
+    Timestamps are wall clock, so the result is only meaningful if the nodes' clocks are synchronized (NTP/PTP).
+    """
+
+    def __init__(self, window: int = 500, history: int = 16, max_jobs: int = 100):
+        self.__window = window
+        self.__history = history
+        self.__max_jobs = max_jobs
+
+        self.__timestamps: dict[int, deque[int]] = {}  # recent lores timestamps per device
+        self.__pending: dict[int, deque[int]] = {}  # lores timestamps not yet evaluated per device
+        self.__lores_samples: dict[int, deque[int]] = {}
+        self.__sync_states: dict[int, SyncState] = {}
+
+        self.__jobs: OrderedDict[uuid.UUID, dict[int, int]] = OrderedDict()
+
+    @property
+    def reference_device_id(self) -> int | None:
+        return min(self.__timestamps) if self.__timestamps else None
+
+    def add(self, msg: ImageMessage):
+        self.__sync_states[msg.device_id] = msg.sync_state
+        if not msg.timestamp_ns:
+            return  # older nodes or no timestamp known
+
+        if msg.job_id is None:
+            self._add_lores(msg.device_id, msg.timestamp_ns)
+        else:
+            self._add_hires(msg.job_id, msg.device_id, msg.timestamp_ns)
+
+    def _add_lores(self, device_id: int, timestamp_ns: int):
+        self.__timestamps.setdefault(device_id, deque(maxlen=self.__history)).append(timestamp_ns)
+        self.__pending.setdefault(device_id, deque(maxlen=self.__history)).append(timestamp_ns)
+
+        reference_id = self.reference_device_id
+        reference = self.__timestamps[reference_id]
+        for other_id, pending in self.__pending.items():
+            if other_id == reference_id:
+                pending.clear()
+                continue
+
+            while pending and pending[0] <= reference[-1]:
+                timestamp = pending.popleft()
+                skew = min(abs(timestamp - reference_timestamp) for reference_timestamp in reference)
+                self.__lores_samples.setdefault(other_id, deque(maxlen=self.__window)).append(skew)
+
+    def _add_hires(self, job_id: uuid.UUID, device_id: int, timestamp_ns: int):
+        job = self.__jobs.get(job_id)
+        if job is None:
+            job = self.__jobs[job_id] = {}
+            if len(self.__jobs) > self.__max_jobs:
+                self.__jobs.popitem(last=False)
+
+        job[device_id] = timestamp_ns
+
+    def job_skew_ms(self, job_id: uuid.UUID) -> float | None:
+        job = self.__jobs.get(job_id)
+        if not job or len(job) < 2:
+            return None
+        return (max(job.values()) - min(job.values())) / 1e6
+
+    def lores_skew(self, device_id: int | None = None) -> SkewStats:
+        """Skew of a device against the reference device, or over all devices if device_id is None."""
+        if device_id is not None:
+            return _stats(self.__lores_samples.get(device_id, ()))
+        return _stats(sample for samples in self.__lores_samples.values() for sample in samples)
+
+    def hires_skew(self) -> SkewStats:
+        """Skew over the recent jobs with at least two results."""
+        return _stats(max(job.values()) - min(job.values()) for job in self.__jobs.values() if len(job) > 1)
+
+    def unsynced_devices(self) -> list[int]:
+        return sorted(device_id for device_id, state in self.__sync_states.items() if state == SyncState.WAITING)
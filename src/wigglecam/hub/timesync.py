@@ -0,0 +1,34 @@
+import logging
+import time
+
+import pynng
+
+from ..dto import TimeSyncMessage
+
+logger = logging.getLogger(__name__)
+
+
+class TimeServer:
+    """Rep0 endpoint the nodes estimate their clock offset against, so scheduled triggers fire at the same moment."""
+
+    def __init__(self, address: str):
+        self.__rep = pynng.Rep0()
+        self.__rep.listen(address=address)
+
+    def close(self):
+        self.__rep.close()
+
+    async def serve(self):
+        while True:
+            data = await self.__rep.arecv()
+            receive_ns = time.time_ns()
+
+            try:
+                request = TimeSyncMessage.from_bytes(data)
+            except ValueError as exc:
+                logger.warning(f"ignored invalid time sync request: {exc}")
+                await self.__rep.asend(b"")
+                continue
+
+            reply = TimeSyncMessage(request.origin_ns, receive_ns=receive_ns, transmit_ns=time.time_ns())
+            await self.__rep.asend(reply.to_bytes())
@@ -0,0 +1,209 @@
+import json
+import logging
+import os
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Literal
+
+import cv2
+import numpy as np
+
+from ..dto import ImageMessage
+from .raw import decode_bgr
+
+logger = logging.getLogger(__name__)
+
+OutputFormat = Literal["gif", "webp", "mp4"]
+Image = bytes | bytearray | memoryview | ImageMessage  # JPEG or a hires result in any codec
+
+
+@dataclass
+class RigCalibration:
+    """Transforms aligning every device to the reference device, estimated once per rig setup.
+
+    transforms are 2x3 affine matrices per device id, crop is the area (x, y, width, height) covered by all
+    warped images, so the wigglegram has no black borders.
+    """
+
+    reference_device_id: int
+    image_size: tuple[int, int]  # width, height
+    transforms: dict[int, list[list[float]]]
+    crop: tuple[int, int, int, int]
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(asdict(self), indent=2))
+
+    @classmethod
+    def load(cls, path: Path) -> "RigCalibration":
+        data = json.loads(path.read_text())
+        return cls(
+            reference_device_id=data["reference_device_id"],
+            image_size=tuple(data["image_size"]),
+            transforms={int(device_id): matrix for device_id, matrix in data["transforms"].items()},
+            crop=tuple(data["crop"]),
+        )
+
+
+def calibrate(images: Mapping[int, np.ndarray], reference_device_id: int | None = None, max_features: int = 2000) -> RigCalibration:
+    """Estimate the alignment of all images to the reference image (lowest device id by default).
+
+    ORB features are matched to the reference and a similarity transform (rotation, scale, translation) is fitted
+    with RANSAC. That keeps the wiggle of the subject's depth while removing the rig's mounting tolerances.
+    """
+    reference_device_id = min(images) if reference_device_id is None else reference_device_id
+    reference = images[reference_device_id]
+    height, width = reference.shape[:2]
+
+    orb = cv2.ORB_create(nfeatures=max_features)
+    matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
+    reference_keypoints, reference_descriptors = orb.detectAndCompute(_gray(reference), None)
+
+    transforms = {}
+    for device_id, image in images.items():
+        if device_id == reference_device_id:
+            transforms[device_id] = np.eye(2, 3)
+            continue
+
+        keypoints, descriptors = orb.detectAndCompute(_gray(image), None)
+        matches = matcher.match(descriptors, reference_descriptors) if descriptors is not None and reference_descriptors is not None else []
+        if len(matches) < 4:
+            raise ValueError(f"not enough features matched to calibrate device {device_id}, got {len(matches)}")
+
+        source = np.float32([keypoints[match.queryIdx].pt for match in matches])
+        target = np.float32([reference_keypoints[match.trainIdx].pt for match in matches])
+        matrix, inliers = cv2.estimateAffinePartial2D(source, target, method=cv2.RANSAC, ransacReprojThreshold=3.0)
+        if matrix is None:
+            raise ValueError(f"could not estimate the alignment of device {device_id}")
+
+        logger.info(f"calibrated device {device_id} with {int(inliers.sum())}/{len(matches)} inliers")
+        transforms[device_id] = matrix
+
+    return RigCalibration(
+        reference_device_id=reference_device_id,
+        image_size=(width, height),
+        transforms={device_id: matrix.tolist() for device_id, matrix in transforms.items()},
+        crop=_common_crop(transforms.values(), width, height),
+    )
+
+
+def _gray(image: np.ndarray) -> np.ndarray:
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+
+
+def _common_crop(transforms, width: int, height: int) -> tuple[int, int, int, int]:
+    """Axis aligned rectangle inside all warped image borders (conservative for rotations)."""
+    corners = np.float32([[0, 0], [width, 0], [width, height], [0, height]]).reshape(-1, 1, 2)
+    left, top, right, bottom = 0.0, 0.0, float(width), float(height)
+    for matrix in transforms:
+        warped = cv2.transform(corners, np.asarray(matrix, np.float64)).reshape(-1, 2)
+        left = max(left, warped[0, 0], warped[3, 0])
+        right = min(right, warped[1, 0], warped[2, 0])
+        top = max(top, warped[0, 1], warped[1, 1])
+        bottom = min(bottom, warped[2, 1], warped[3, 1])
+
+    if right - left < 1 or bottom - top < 1:
+        raise ValueError("images do not overlap after alignment")
+
+    x, y = int(np.ceil(left)), int(np.ceil(top))
+    return x, y, int(right) - x, int(bottom) - y
+
+
+class WigglegramPipeline:
+    """Turns the hires results of a job into an aligned wigglegram.
+
+    The rig calibration is loaded from calibration_path or estimated from the first job and saved there, so every
+    following job only decodes and warps. Decoding and warping runs in a thread pool, one task per frame.
+    """
+
+    def __init__(self, calibration_path: Path, workers: int | None = None, max_width: int | None = 1920):
+        self.__calibration_path = calibration_path
+        self.__max_width = max_width
+        self.__executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1, thread_name_prefix="wigglegram")
+
+        self.__calibration = RigCalibration.load(calibration_path) if calibration_path.exists() else None
+
+    @property
+    def calibration(self) -> RigCalibration | None:
+        return self.__calibration
+
+    def close(self):
+        self.__executor.shutdown(wait=False, cancel_futures=True)
+
+    def invalidate_calibration(self):
+        """Estimate the calibration again from the next job, e.g. after the rig was moved."""
+        self.__calibration = None
+        self.__calibration_path.unlink(missing_ok=True)
+
+    def align(self, jpegs: Mapping[int, Image]) -> list[np.ndarray]:
+        """Decode and align the images, ordered by device id."""
+        device_ids = sorted(jpegs)
+        images = list(self.__executor.map(lambda device_id: _decode(jpegs[device_id]), device_ids))
+
+        calibration = self.__calibration
+        if calibration is None or not set(device_ids) <= set(calibration.transforms) or calibration.image_size != _size(images[0]):
+            calibration = self.__calibration = calibrate(dict(zip(device_ids, images, strict=True)))
+            calibration.save(self.__calibration_path)
+            logger.info(f"rig calibration saved to {self.__calibration_path}")
+
+        return list(self.__executor.map(lambda args: self._warp(calibration, *args), zip(device_ids, images, strict=True)))
+
+    def assemble(
+        self,
+        jpegs: Mapping[int, Image],
+        output_path: Path,
+        format: OutputFormat = "gif",
+        frame_duration_ms: int = 120,
+    ):
+        """Write the wigglegram of the images, played forth and back."""
+        frames = self.align(jpegs)
+        frames = frames + frames[-2:0:-1]
+
+        if format == "mp4":
+            _write_mp4(frames, output_path, fps=1000 / frame_duration_ms)
+        else:
+            _write_pil(frames, output_path, format, frame_duration_ms)
+
+    def _warp(self, calibration: RigCalibration, device_id: int, image: np.ndarray) -> np.ndarray:
+        x, y, width, height = calibration.crop
+        matrix = np.asarray(calibration.transforms[device_id], np.float64).copy()
+        matrix[:, 2] -= (x, y)  # warp straight into the cropped area
+
+        scale = min(1.0, self.__max_width / width) if self.__max_width else 1.0
+        matrix *= scale
+        size = (round(width * scale), round(height * scale))
+
+        return cv2.warpAffine(image, matrix, size, flags=cv2.INTER_LINEAR)
+
+
+def _decode(data: Image) -> np.ndarray:
+    if isinstance(data, ImageMessage):
+        return decode_bgr(data)
+
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("invalid JPEG")
+    return image
+
+
+def _size(image: np.ndarray) -> tuple[int, int]:
+    return image.shape[1], image.shape[0]
+
+
+def _write_mp4(frames: list[np.ndarray], output_path: Path, fps: float, loops: int = 5):
+    writer = cv2.VideoWriter(str(output_path), cv2.VideoWriter.fourcc(*"mp4v"), fps, _size(frames[0]))
+    try:
+        for _ in range(loops):  # videos do not loop by themselves in most players
+            for frame in frames:
+                writer.write(frame)
+    finally:
+        writer.release()
+
+
+def _write_pil(frames: list[np.ndarray], output_path: Path, format: str, frame_duration_ms: int):
+    from PIL import Image
+
+    images = [Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)) for frame in frames]
+    images[0].save(output_path, format=format.upper(), save_all=True, append_images=images[1:], duration=frame_duration_ms, loop=0)
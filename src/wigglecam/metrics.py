@@ -0,0 +1,189 @@
+import asyncio
+import bisect
+import json
+import logging
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
+from .tracing import TRACER, Tracer
+
+logger = logging.getLogger(__name__)
+
+# latency buckets in seconds, from lores frame intervals up to slow hires transfers
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = dict[str, str]
+
+
+def _format_labels(labels: Labels, extra: Labels | None = None) -> str:
+    merged = {**labels, **(extra or {})}
+    if not merged:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in merged.items()) + "}"
+
+
+class Counter:
+    """Monotonic count. Updated with plain attribute arithmetic, so the hot path costs next to nothing."""
+
+    type = "counter"
+
+    def __init__(self, name: str, labels: Labels):
+        self.name = name
+        self.labels = labels
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def samples(self) -> Iterator[str]:
+        yield f"{self.name}{_format_labels(self.labels)} {self.value}"
+
+
+class Gauge:
+    """Current value, either set or read from function at scrape time."""
+
+    type = "gauge"
+
+    def __init__(self, name: str, labels: Labels, function: Callable[[], float | None] | None = None):
+        self.name = name
+        self.labels = labels
+        self.value = 0.0
+        self.function = function
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def samples(self) -> Iterator[str]:
+        value = self.function() if self.function else self.value
+        if value is not None:
+            yield f"{self.name}{_format_labels(self.labels)} {value}"
+
+
+class Histogram:
+    """Distribution of observed values in fixed buckets, e.g. latencies in seconds."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, labels: Labels, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.labels = labels
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self) -> Iterator[str]:
+        cumulative = 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts, strict=True):
+            cumulative += count
+            yield f"{self.name}_bucket{_format_labels(self.labels, {'le': str(bound)})} {cumulative}"
+        yield f"{self.name}_sum{_format_labels(self.labels)} {self.sum}"
+        yield f"{self.name}_count{_format_labels(self.labels)} {self.count}"
+
+
+Metric = Counter | Gauge | Histogram
+
+
+class Registry:
+    """Metrics of the process by name and labels. Getting a metric that exists returns it, so modules and instances
+    can declare the metrics they update without coordination."""
+
+    def __init__(self):
+        self.__metrics: dict[str, tuple[str, dict[tuple, Metric]]] = {}  # name -> help, labels -> metric
+
+    def counter(self, name: str, help: str, labels: Labels | None = None) -> Counter:
+        return self._get(Counter, name, help, labels or {})
+
+    def gauge(self, name: str, help: str, labels: Labels | None = None, function: Callable[[], float | None] | None = None) -> Gauge:
+        gauge = self._get(Gauge, name, help, labels or {})
+        if function:
+            gauge.function = function  # the latest instance wins, e.g. if a backend is created again
+        return gauge
+
+    def histogram(self, name: str, help: str, labels: Labels | None = None, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, labels or {}, buckets=buckets)
+
+    def _get(self, metric_class, name: str, help: str, labels: Labels, **kwargs):
+        _, metrics = self.__metrics.setdefault(name, (help, {}))
+        key = tuple(sorted(labels.items()))
+        metric = metrics.get(key)
+        if metric is None:
+            metric = metrics[key] = metric_class(name, labels, **kwargs)
+        elif not isinstance(metric, metric_class):
+            raise ValueError(f"metric {name} is registered as {metric.type} already")
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for name, (help, metrics) in self.__metrics.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {next(iter(metrics.values())).type}")
+            for metric in metrics.values():
+                lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class MetricsHttpServer:
+    """Minimal HTTP endpoint serving the registry for Prometheus to scrape and the Chrome trace on /trace."""
+
+    def __init__(self, host: str, port: int):
+        self.__host = host.strip("[]")  # accept the pynng style [::]
+        self.__port = port
+
+    async def serve(self, registry: Registry = REGISTRY, tracer: Tracer = TRACER):
+        server = await asyncio.start_server(lambda reader, writer: self._handle(registry, tracer, reader, writer), self.__host, self.__port)
+        logger.info(f"metrics served on http://{self.__host}:{self.__port}/metrics")
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, registry: Registry, tracer: Tracer, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # the headers are not interpreted, read them to be a well-behaved server
+            while await asyncio.wait_for(reader.readline(), timeout=5) not in (b"\r\n", b"\n", b""):
+                pass
+
+            path = request_line.split(b" ")[1] if request_line.count(b" ") >= 2 else b"/"
+            if path.startswith(b"/trace"):
+                body = json.dumps(tracer.to_chrome_trace()).encode()
+                content_type = b"application/json"
+            else:
+                body = registry.render().encode()
+                content_type = b"text/plain; version=0.0.4; charset=utf-8"
+
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: "
+                + content_type
+                + b"\r\n"
+                + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        except (TimeoutError, ConnectionError) as exc:
+            logger.debug(f"metrics request failed: {exc}")
+        finally:
+            writer.close()
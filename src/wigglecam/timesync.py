@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+
+import pynng
+
+from .dto import TimeSyncMessage
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ClockSample:
+    offset_ns: int  # hub clock minus node clock
+    rtt_ns: int
+
+
+def sample_from_exchange(origin_ns: int, receive_ns: int, transmit_ns: int, destination_ns: int) -> ClockSample:
+    """Offset and round trip time of one NTP-style exchange, assuming the same delay in both directions."""
+    return ClockSample(
+        offset_ns=((receive_ns - origin_ns) + (transmit_ns - destination_ns)) // 2,
+        rtt_ns=(destination_ns - origin_ns) - (transmit_ns - receive_ns),
+    )
+
+
+class ClockOffsetEstimator:
+    """Estimates the offset of the node clock to the hub clock from the recent exchanges.
+
+    The exchange with the lowest round trip time of the window is used, it was the least delayed by queueing so its
+    offset is the most accurate (the clock filter of NTP). The estimate is usable once min_samples were added.
+    """
+
+    def __init__(self, window: int = 16, min_samples: int = 4):
+        self.__samples: deque[ClockSample] = deque(maxlen=window)
+        self.__min_samples = min_samples
+
+    def add(self, sample: ClockSample):
+        if sample.rtt_ns < 0:
+            # the clock was stepped during the exchange
+            logger.debug(f"ignored clock sample with negative rtt {sample.rtt_ns}ns")
+            return
+        self.__samples.append(sample)
+
+    @property
+    def synced(self) -> bool:
+        return len(self.__samples) >= self.__min_samples
+
+    @property
+    def best(self) -> ClockSample | None:
+        return min(self.__samples, key=lambda sample: sample.rtt_ns) if self.__samples else None
+
+    @property
+    def offset_ns(self) -> int:
+        best = self.best
+        return best.offset_ns if best else 0
+
+    @property
+    def rtt_ns(self) -> int:
+        best = self.best
+        return best.rtt_ns if best else 0
+
+    def to_local(self, hub_time_ns: int) -> int:
+        """Convert a hub wall clock time to the node wall clock with the current estimate."""
+        return hub_time_ns - self.offset_ns
+
+
+def _sleep_precise(target_ns: int, spin_ns: int = 100_000):
+    remaining_ns = target_ns - time.time_ns()
+    if remaining_ns > spin_ns:
+        time.sleep((remaining_ns - spin_ns) / 1e9)
+    while time.time_ns() < target_ns:
+        pass
+
+
+async def sleep_until(target_ns: int, fine_ns: int = 2_000_000):
+    """Sleep until the wall clock reaches target_ns. asyncio.sleep wakes up late by up to the millisecond timer
+    resolution of the event loop, so the last fine_ns are slept with high resolution timers in a worker thread,
+    which spins the last 100us. The event loop stays free meanwhile."""
+    remaining_ns = target_ns - time.time_ns()
+    if remaining_ns > fine_ns:
+        await asyncio.sleep((remaining_ns - fine_ns) / 1e9)
+
+    if target_ns > time.time_ns():
+        await asyncio.to_thread(_sleep_precise, target_ns)
+
+
+class ClockSyncClient:
+    """Node side of the clock sync, Req0 to the TimeServer of the hub.
+
+    Until synced the hub is polled every 100ms, afterwards every interval_s.
+    """
+
+    def __init__(self, address: str, interval_s: float = 1.0, timeout_ms: int = 500):
+        self.__interval_s = interval_s
+
+        self.__req = pynng.Req0(recv_timeout=timeout_ms, send_timeout=timeout_ms)
+        # block=False means continue program and try to connect in the background without any exception
+        self.__req.dial(address, block=False)
+
+        self.estimator = ClockOffsetEstimator()
+
+        REGISTRY.gauge("wigglecam_clock_offset_seconds", "Hub clock minus node clock.", function=lambda: self.estimator.offset_ns / 1e9)
+        REGISTRY.gauge("wigglecam_clock_rtt_seconds", "Round trip time to the hub time server.", function=lambda: self.estimator.rtt_ns / 1e9)
+
+    def close(self):
+        self.__req.close()
+
+    async def exchange(self) -> ClockSample | None:
+        origin_ns = time.time_ns()
+        try:
+            await self.__req.asend(TimeSyncMessage(origin_ns).to_bytes())
+            reply = TimeSyncMessage.from_bytes(await self.__req.arecv())
+        except (pynng.exceptions.NNGException, ValueError) as exc:
+            logger.debug(f"clock sync request failed: {exc}")
+            return None
+        destination_ns = time.time_ns()
+
+        if reply.origin_ns != origin_ns:
+            logger.debug("ignored clock sync reply to an earlier request")
+            return None
+
+        return sample_from_exchange(origin_ns, reply.receive_ns, reply.transmit_ns, destination_ns)
+
+    async def run(self):
+        while True:
+            sample = await self.exchange()
+            if sample:
+                was_synced = self.estimator.synced
+                self.estimator.add(sample)
+                if self.estimator.synced and not was_synced:
+                    logger.info(f"clock synced to hub, offset {self.estimator.offset_ns / 1e6:.3f}ms, rtt {self.estimator.rtt_ns / 1e6:.3f}ms")
+
+            await asyncio.sleep(self.__interval_s if self.estimator.synced else 0.1)
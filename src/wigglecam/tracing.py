@@ -0,0 +1,100 @@
+import atexit
+import contextlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+
+# Opt-in tracing. Set WIGGLECAM_TRACE=1 to record spans, WIGGLECAM_TRACE_BUFFER to the number of spans kept and
+# WIGGLECAM_TRACE_FILE to dump the Chrome trace (open in chrome://tracing or ui.perfetto.dev) on exit.
+# Timestamps are wall clock, so traces of nodes and hub with synchronized clocks can be merged.
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+@dataclass(slots=True)
+class Span:
+    name: str
+    start_ns: int  # wall clock
+    duration_ns: int
+    thread_id: int
+    job_id: uuid.UUID | None = None
+    args: dict = field(default_factory=dict)
+
+
+class Tracer:
+    def __init__(self, capacity: int = 10_000, enabled: bool = False):
+        self.enabled = enabled
+        self.__spans: deque[Span] = deque(maxlen=capacity)
+        self.__pid = os.getpid()
+
+    def __len__(self) -> int:
+        return len(self.__spans)
+
+    def clear(self):
+        self.__spans.clear()
+
+    def span(self, name: str, job_id: uuid.UUID | None = None, **args) -> contextlib.AbstractContextManager:
+        """Context manager recording the enclosed block. A shared no-op if tracing is disabled."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return self._span(name, job_id, args)
+
+    @contextlib.contextmanager
+    def _span(self, name: str, job_id: uuid.UUID | None, args: dict) -> Iterator[None]:
+        start_ns = time.time_ns()
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.__spans.append(Span(name, start_ns, time.perf_counter_ns() - start, threading.get_ident(), job_id, args))
+
+    def record(self, name: str, start_ns: int, end_ns: int | None = None, job_id: uuid.UUID | None = None, **args):
+        """Record a span that already happened, e.g. the time a job waited in the queue. end_ns default is now."""
+        if self.enabled:
+            end_ns = end_ns if end_ns is not None else time.time_ns()
+            self.__spans.append(Span(name, start_ns, max(0, end_ns - start_ns), threading.get_ident(), job_id, args))
+
+    def instant(self, name: str, job_id: uuid.UUID | None = None, **args):
+        if self.enabled:
+            self.__spans.append(Span(name, time.time_ns(), 0, threading.get_ident(), job_id, args))
+
+    def spans(self, job_id: uuid.UUID | None = None) -> list[Span]:
+        spans = list(self.__spans)
+        return spans if job_id is None else [span for span in spans if span.job_id == job_id]
+
+    def to_chrome_trace(self) -> dict:
+        """Trace event format. Spans of a job are async events on one track per job id, because coroutines of
+        concurrent jobs interleave on the event loop thread. Other spans are complete events on their thread."""
+        events = []
+        for span in list(self.__spans):  # snapshot, worker threads append meanwhile
+            ts_us = span.start_ns / 1000
+            args = {key: str(value) for key, value in span.args.items()}
+            common = {"name": span.name, "pid": self.__pid, "tid": span.thread_id}
+            if span.job_id is None:
+                phase = "i" if span.duration_ns == 0 else "X"
+                events.append({**common, "ph": phase, "ts": ts_us, "dur": span.duration_ns / 1000, "args": args})
+                continue
+
+            common.update(cat="job", id=str(span.job_id))
+            events.append({**common, "ph": "b", "ts": ts_us, "args": {"job_id": str(span.job_id), **args}})
+            events.append({**common, "ph": "e", "ts": ts_us + span.duration_ns / 1000})
+
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def dump(self, path: Path):
+        path.write_text(json.dumps(self.to_chrome_trace()))
+
+
+TRACER = Tracer(
+    capacity=int(os.environ.get("WIGGLECAM_TRACE_BUFFER", "10000")),
+    enabled=os.environ.get("WIGGLECAM_TRACE", "").lower() in ("1", "true", "yes"),
+)
+
+if TRACER.enabled and (_trace_file := os.environ.get("WIGGLECAM_TRACE_FILE")):
+    atexit.register(TRACER.dump, Path(_trace_file))